@@ -27,6 +27,7 @@ from src.utils.config_loader import config
 # ייבוא המודולים שבנינו בתיקיית src
 try:
     from src.database_manager import DatabaseManager
+    from src.query_profiler import get_query_profiler
     from src.ai_engine import FleetAIEngine
     from src.auth_manager import AuthManager
 except ImportError as e:
@@ -218,15 +219,22 @@ st.markdown("""
 st.title("🚛 FleetGuard - מערכת לניהול צי רכב חכם")
 st.markdown("---")
 
+# --- מיגרציות סכמה (פעם אחת בהפעלה, לא בזמן הקריאות) ---
+@st.cache_resource
+def apply_schema_migrations():
+    return DatabaseManager().apply_migrations()
+
+apply_schema_migrations()
+
 # --- טעינת נתונים ---
 @st.cache_data
 def load_data():
     try:
         db = DatabaseManager()
-        # שליפת נתונים מחוברים (חשבונית + שורות)
-        df_full = db.get_full_view()
+        # שליפת נתונים מחוברים (חשבונית + שורות) - מצילום Parquet אם הוא עדכני
+        df_full = db.load_snapshot('full_view')
         # שליפת חשבוניות בלבד לסיכומים
-        df_invoices = db.get_all_invoices()
+        df_invoices = db.load_snapshot('invoices')
         return df_full, df_invoices
     except Exception as e:
         return None, None
@@ -254,6 +262,19 @@ if os.getenv('EMAIL_FETCH_ENABLED', 'false').lower() == 'true':
         # Error will be visible in email sync tab if user checks
         pass
 
+# ===== Rules Scheduler (Background) =====
+# With RULES_SCHEDULER_ENABLED=true alerts are evaluated in the background every
+# RULES_SCHEDULER_INTERVAL_MIN minutes and the rules tab only reads them.
+# Set RULES_SCHEDULER_IN_PROCESS=false when running `python -m src.rules_scheduler` instead.
+rules_scheduler_enabled = os.getenv('RULES_SCHEDULER_ENABLED', 'false').lower() == 'true'
+if rules_scheduler_enabled and os.getenv('RULES_SCHEDULER_IN_PROCESS', 'true').lower() == 'true':
+    try:
+        from src.rules_scheduler import get_rules_scheduler
+
+        get_rules_scheduler(db.db_path).start()
+    except Exception as e:
+        print(f"⚠️ Warning: rules scheduler not started: {str(e)}")
+
 # בדיקה שהנתונים נטענו בהצלחה
 if df_full is None or df_invoices is None:
     st.error("⚠️ לא נמצא קובץ נתונים! אנא הרץ קודם את `generate_data.py`.")
@@ -328,6 +349,24 @@ with st.sidebar:
     else:
         filtered_df = pd.DataFrame()
 
+    # ביצועי שאילתות - מוצג רק כש-DB_PROFILE_ENABLED=true
+    query_profiler = get_query_profiler()
+    if query_profiler.enabled:
+        st.markdown("---")
+        with st.expander("⏱️ ביצועי שאילתות"):
+            st.caption(f"מתודות DatabaseManager לפי זמן כולל | שאילתה איטית: {query_profiler.slow_ms:.0f}ms ומעלה")
+            st.dataframe(query_profiler.report(), use_container_width=True, hide_index=True)
+            slow_queries = query_profiler.read_slow_log(limit=10)
+            if slow_queries:
+                st.caption("🐢 שאילתות איטיות אחרונות")
+                for entry in reversed(slow_queries):
+                    st.text(f"{entry['method']} - {entry['ms']}ms ({entry['caller']})")
+                    for query in entry['queries']:
+                        st.code("\n".join(query['plan']), language=None)
+            if st.button("💾 שמור דוח", key="save_query_stats"):
+                query_profiler.save_snapshot()
+                st.success(f"✅ נשמר ל-{query_profiler.snapshot_path}")
+
 # --- לשוניות ראשיות (Tabs) ---
 tab1, tab2, tab_rules, tab3, tab5, tab6, tab7, tab8, tab9 = st.tabs([
     "📊 לוח בקרה (Dashboard)",
@@ -449,6 +488,12 @@ with tab_rules:
         # Initialize Rules Engine
         rules_engine = FleetRulesEngine(db)
 
+        if rules_scheduler_enabled:
+            runs = db.get_rule_scheduler_runs(limit=1)
+            if not runs.empty:
+                st.caption(f"🕒 הערכה אחרונה ברקע: {runs.iloc[0]['started_at']} "
+                           f"({int(runs.iloc[0]['events'])} אירועי התראות)")
+
         # Get list of all vehicles
         vehicles_df = db.get_vehicle_with_stats()
 
@@ -461,13 +506,14 @@ with tab_rules:
                 key="rules_engine_vehicle_select"
             )
 
-            # Evaluate rules
+            # Evaluate rules (persisted alerts - only changed vehicles are re-evaluated)
             if selected_vehicle_filter == "כל הרכבים":
                 with st.spinner("מעריך כללים עבור כל הצי..."):
-                    results = rules_engine.evaluate_all_rules()
+                    results = rules_engine.get_alerts(refresh=not rules_scheduler_enabled)
             else:
                 with st.spinner(f"מעריך כללים עבור {selected_vehicle_filter}..."):
-                    results = rules_engine.evaluate_all_rules(vehicle_id=selected_vehicle_filter)
+                    results = rules_engine.get_alerts(vehicle_id=selected_vehicle_filter,
+                                                      refresh=not rules_scheduler_enabled)
 
             # Summary statistics at top
             st.subheader("📊 סטטיסטיקת התראות")
@@ -860,7 +906,9 @@ with tab3:
                                                     rules_engine = FleetRulesEngine(db)
 
                                                     # Evaluate rules for this specific vehicle
-                                                    vehicle_alerts = rules_engine.evaluate_all_rules(vehicle_id=selected_vehicle)
+                                                    vehicle_alerts = rules_engine.get_alerts(
+                                                        vehicle_id=selected_vehicle, refresh=not rules_scheduler_enabled
+                                                    )
 
                                                     col_ml, col_rules = st.columns(2)
 
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark Parallel Rules - סקיילינג של הערכת הכללים המקבילית לפי מספר תהליכים
+
+יוצר צי סינתטי בקובץ זמני (scripts/synthetic_fleet.py) ומודד את
+FleetRulesEngine.evaluate_rules_parallel עם 1 עד N תהליכים. לכל מספר תהליכים
+נמדד זמן ההערכה עם pool קיים (ה-pool מחומם בהרצה ראשונה שלא נמדדת) ובנוסף זמן
+ה-"cold" - כולל הפעלת התהליכים. התוצאה של כל מספר תהליכים נבדקת מול תהליך אחד.
+
+שימוש:
+    python scripts/benchmark_parallel_rules.py --vehicles 50000 --max-workers 8
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from src.database_manager import DatabaseManager
+from src.rules_engine import FleetRulesEngine
+from scripts.synthetic_fleet import create_synthetic_fleet
+
+
+def worker_counts(max_workers):
+    """1, 2, 4, ... עד max_workers (כולל)"""
+    counts = []
+    n = 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    counts.append(max_workers)
+    return counts
+
+
+def run_benchmark(vehicles, max_workers, repeat=3, seed=42):
+    """
+    Returns:
+        dict: פרטי הצי ושורה לכל מספר תהליכים (median_s, cold_s, speedup, alerts, matches)
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'fleet.db')
+        start = time.perf_counter()
+        created = create_synthetic_fleet(db_path, vehicles, seed=seed)
+        build_s = time.perf_counter() - start
+
+        db = DatabaseManager(db_path, cache=False, analytics='sqlite')
+        engine = FleetRulesEngine(db)
+        vehicles_df = db.get_vehicle_with_stats()
+        vehicle_ids = vehicles_df['vehicle_id'].tolist()
+        fleet_avg_cost = vehicles_df['avg_service_cost'].mean()
+
+        baseline = None
+        results = []
+        for workers in worker_counts(max_workers):
+            start = time.perf_counter()
+            engine.evaluate_rules_parallel(vehicle_ids, fleet_avg_cost, workers=workers)
+            cold_s = time.perf_counter() - start
+
+            times = []
+            if workers == 1:
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    alerts = engine.evaluate_rules_parallel(vehicle_ids, fleet_avg_cost, workers=1)
+                    times.append(time.perf_counter() - start)
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    engine.evaluate_rules_parallel(vehicle_ids, fleet_avg_cost, workers=workers, executor=executor)
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        alerts = engine.evaluate_rules_parallel(vehicle_ids, fleet_avg_cost,
+                                                                workers=workers, executor=executor)
+                        times.append(time.perf_counter() - start)
+
+            if baseline is None:
+                baseline = alerts
+            median_s = statistics.median(times)
+            results.append({
+                'workers': workers,
+                'median_s': round(median_s, 4),
+                'cold_s': round(cold_s, 4),
+                'speedup': round(results[0]['median_s'] / median_s, 2) if results else 1.0,
+                'alerts': len(alerts),
+                'matches': alerts.equals(baseline)
+            })
+
+    return {
+        'vehicles': created['vehicles'],
+        'invoices': created['invoices'],
+        'build_s': round(build_s, 2),
+        'cpu_count': os.cpu_count(),
+        'repeat': repeat,
+        'results': results
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark sharded parallel rule evaluation")
+    parser.add_argument('--vehicles', type=int, default=20000)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.vehicles, args.max_workers, args.repeat, args.seed)
+    print(f"Synthetic fleet: {report['vehicles']:,} vehicles, {report['invoices']:,} invoices "
+          f"(built in {report['build_s']}s, {report['cpu_count']} CPUs)")
+    print(f"{'workers':>8} {'median s':>10} {'cold s':>8} {'speedup':>8} {'alerts':>8}  same")
+    for row in report['results']:
+        print(f"{row['workers']:>8} {row['median_s']:>10.3f} {row['cold_s']:>8.3f} {row['speedup']:>8.2f} "
+              f"{row['alerts']:>8}  {'yes' if row['matches'] else 'NO'}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"[OK] {args.json}")
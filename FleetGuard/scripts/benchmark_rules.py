@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark Rules - בנצ'מרק של ה-Rules Engine על ציים סינתטיים בכמה גדלים
+
+לכל גודל (ברירת מחדל: 1k / 10k / 100k רכבים) נוצר צי סינתטי בקובץ SQLite זמני
+(scripts/synthetic_fleet.py) ונמדדים:
+- evaluate_all_rules מקצה לקצה לכל שיטת הערכה (sql / parallel / vectorized / loop)
+- זמן לכל כלל: מתודות ה-check_* על מדגם רכבים (זמן לרכב), ושאילתת ה-SQL של כל
+  קבוצת כללים בנפרד
+- זיכרון שיא: הקצאות Python (tracemalloc, במדידה נפרדת כדי לא להאט את מדידת הזמן)
+  ו-RSS מקסימלי של התהליך
+
+התוצאות נכתבות ל-JSON (עם ה-commit הנוכחי) כדי להשוות בין commits:
+    python scripts/benchmark_rules.py --json bench_before.json
+    python scripts/benchmark_rules.py --json bench_after.json --compare bench_before.json
+
+ה-loop הוא O(רכבים x חשבוניות) - מעל --loop-max-vehicles הוא מדולג.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import platform
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+from src.database_manager import DatabaseManager
+from src.rules_engine import FleetRulesEngine
+from scripts.synthetic_fleet import create_synthetic_fleet
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METHODS = ('sql', 'parallel', 'vectorized', 'loop')
+CHECKS = ('check_maintenance_overdue', 'check_cost_anomaly', 'check_retirement_readiness',
+          'check_high_utilization', 'check_workshop_quality')
+
+
+def _max_rss_mb():
+    """RSS מקסימלי של התהליך עד עכשיו (MB), או None אם לא זמין"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux מחזיר KB, macOS בתים
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _timed(func, repeat):
+    """median / min של repeat הרצות, והתוצאה של האחרונה"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return {'median_s': round(statistics.median(times), 4), 'min_s': round(min(times), 4)}, result
+
+
+def _peak_python_mb(func):
+    """שיא הקצאות ה-Python של הרצה אחת (MB)"""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / (1024 * 1024), 1)
+
+
+def bench_end_to_end(engine, methods, repeat, workers):
+    """evaluate_all_rules לכל שיטה"""
+    results = {}
+    for method in methods:
+        run = lambda: engine.evaluate_all_rules(method=method, workers=workers)
+        timing, output = _timed(run, repeat)
+        results[method] = {
+            **timing,
+            'peak_python_mb': _peak_python_mb(run),
+            'alerts': output['stats'].get('total_alerts', 0),
+        }
+    return results
+
+
+def bench_checks(engine, db, sample_size, seed):
+    """
+    זמן כל מתודת check_* על מדגם רכבים (כמו בלולאה של evaluate_all_rules).
+
+    Returns:
+        dict: לכל check - total_s על המדגם ו-per_vehicle_us
+    """
+    vehicles_df = db.get_vehicle_with_stats()
+    invoices_df = db.get_all_invoices()
+    sample = vehicles_df.sample(min(sample_size, len(vehicles_df)), random_state=seed)
+    invoices_by_vehicle = dict(tuple(invoices_df.groupby('vehicle_id')))
+    empty = invoices_df.iloc[0:0]
+
+    totals = dict.fromkeys(CHECKS, 0.0)
+    for _, vehicle in sample.iterrows():
+        vehicle_invoices = invoices_by_vehicle.get(vehicle['vehicle_id'], empty)
+        calls = {
+            'check_maintenance_overdue': lambda: engine.check_maintenance_overdue(vehicle, vehicle_invoices),
+            'check_cost_anomaly': lambda: engine.check_cost_anomaly(vehicle, vehicle_invoices, vehicles_df),
+            'check_retirement_readiness': lambda: engine.check_retirement_readiness(vehicle),
+            'check_high_utilization': lambda: engine.check_high_utilization(vehicle),
+            'check_workshop_quality': lambda: engine.check_workshop_quality(vehicle, vehicle_invoices, vehicles_df),
+        }
+        for name, call in calls.items():
+            start = time.perf_counter()
+            call()
+            totals[name] += time.perf_counter() - start
+
+    return {
+        name: {
+            'total_s': round(total, 4),
+            'per_vehicle_us': round(total / len(sample) * 1e6, 1) if len(sample) else 0.0,
+            'sampled_vehicles': len(sample),
+        }
+        for name, total in totals.items()
+    }
+
+
+def bench_rule_groups(engine, db, repeat):
+    """שאילתת ה-SQL של כל קבוצת כללים בנפרד (הקלט המשותף נבנה בכל אחת)"""
+    today, after_midnight = engine._evaluation_day()
+    vehicles_df = db.get_vehicle_with_stats()
+    fleet_avg_cost = vehicles_df['avg_service_cost'].mean()
+    fleet_avg_cost = None if pd.isna(fleet_avg_cost) else float(fleet_avg_cost)
+
+    results = {}
+    order = 0
+    for definition in engine.definitions:
+        predicates = engine._compile_group(definition, order)
+        order += len(predicates)
+        if not predicates:
+            continue
+        timing, alerts = _timed(
+            lambda: db.query_rule_matches(predicates, today, after_midnight, fleet_avg_cost=fleet_avg_cost),
+            repeat
+        )
+        results[definition['group']] = {**timing, 'alerts': len(alerts)}
+    return results
+
+
+def run_scale(vehicles, args):
+    """בנצ'מרק מלא לגודל צי אחד"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'fleet.db')
+        start = time.perf_counter()
+        created = create_synthetic_fleet(db_path, vehicles, seed=args.seed)
+        build_s = time.perf_counter() - start
+
+        # בלי מטמון - כל הרצה קוראת מ-SQLite
+        db = DatabaseManager(db_path, cache=False, analytics='sqlite')
+        engine = FleetRulesEngine(db)
+
+        methods = [m for m in args.methods if m != 'loop' or vehicles <= args.loop_max_vehicles]
+        report = {
+            'vehicles': created['vehicles'],
+            'invoices': created['invoices'],
+            'build_s': round(build_s, 2),
+            'skipped_methods': [m for m in args.methods if m not in methods],
+            'end_to_end': bench_end_to_end(engine, methods, args.repeat, args.workers),
+            'per_rule': {
+                'checks': bench_checks(engine, db, args.check_sample, args.seed),
+                'sql_groups': bench_rule_groups(engine, db, args.repeat),
+            },
+            'max_rss_mb': _max_rss_mb(),
+        }
+        db.close_connections()
+    return report
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_report(report, baseline=None):
+    """טבלת סיכום; עם baseline - יחס הזמנים מולו (x < 1 = מהיר יותר)"""
+    previous = {scale['vehicles']: scale for scale in baseline['scales']} if baseline else {}
+    for scale in report['scales']:
+        print(f"\n=== {scale['vehicles']:,} vehicles, {scale['invoices']:,} invoices "
+              f"(built in {scale['build_s']}s) ===")
+        before = previous.get(scale['vehicles'], {})
+        print(f"{'method':<12} {'median s':>10} {'peak MB':>9} {'alerts':>8}" + ("   vs baseline" if before else ""))
+        for method, row in scale['end_to_end'].items():
+            line = f"{method:<12} {row['median_s']:>10.3f} {row['peak_python_mb']:>9.1f} {row['alerts']:>8}"
+            old = before.get('end_to_end', {}).get(method)
+            if old and old['median_s']:
+                line += f"   x{row['median_s'] / old['median_s']:.2f}"
+            print(line)
+        if scale['skipped_methods']:
+            print(f"(skipped: {', '.join(scale['skipped_methods'])})")
+
+        print(f"{'check':<28} {'us/vehicle':>11}")
+        for name, row in scale['per_rule']['checks'].items():
+            print(f"{name:<28} {row['per_vehicle_us']:>11.1f}")
+        print(f"{'sql rule group':<28} {'median s':>11} {'alerts':>8}")
+        for group, row in scale['per_rule']['sql_groups'].items():
+            print(f"{group:<28} {row['median_s']:>11.3f} {row['alerts']:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FleetRulesEngine benchmark on synthetic fleets")
+    parser.add_argument('--scales', default='1000,10000,100000', help="comma-separated fleet sizes")
+    parser.add_argument('--methods', default=','.join(METHODS), help="evaluate_all_rules methods to time")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=None, help="processes for the parallel method")
+    parser.add_argument('--loop-max-vehicles', type=int, default=10000)
+    parser.add_argument('--check-sample', type=int, default=1000, help="vehicles sampled for per-check timings")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="previous results JSON to compare against")
+    args = parser.parse_args()
+
+    args.methods = [m.strip() for m in args.methods.split(',') if m.strip()]
+    unknown = set(args.methods) - set(METHODS)
+    if unknown:
+        parser.error(f"unknown methods: {', '.join(sorted(unknown))}")
+
+    report = {
+        'commit': _git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': args.repeat,
+        'scales': [],
+    }
+    for vehicles in (int(s) for s in args.scales.split(',') if s.strip()):
+        print(f"[..] {vehicles:,} vehicles")
+        report['scales'].append(run_scale(vehicles, args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"Baseline: {args.compare} (commit {baseline.get('commit')})")
+    print_report(report, baseline)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n[OK] {args.json}")
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic Fleet - יצירת דאטה בייס צי סינתטי בכל גודל לבנצ'מרקים
+
+הטבלאות נוצרות כמו ב-generate_data.py, עמודות הרכב נוספות ע"י update_schema
+והמיגרציות מוחלות אחרי הכנסת הנתונים (vehicle_stats / FTS נבנים פעם אחת בכמות
+ולא שורה-שורה דרך הטריגרים). הנתונים דטרמיניסטיים לפי ה-seed ומכסים את כל הכללים:
+רכבים ישנים / קרובים לגריטה / בלי תאריכים, רכבים בלי חשבוניות, מוסכים יקרים וכו'.
+
+שימוש:
+    python scripts/synthetic_fleet.py /tmp/fleet_10k.db --vehicles 10000
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import contextlib
+import io
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from src.database_schema_update import DatabaseSchemaUpdater
+
+WORKSHOPS = ["מוסך יוסי", "מוסך יואב", "מוסך עובד", "מוסך צי צפון", "מוסך העיר", "מוסך המרכז"]
+MAKE_MODELS = ["Toyota Corolla", "Hyundai i30", "Kia Niro", "Skoda Octavia", "Mazda 3"]
+KINDS = ["routine", "repair", "tires", "test"]
+
+
+def _days_to_dates(days):
+    """ימים מ-1970-01-01 -> מחרוזות 'YYYY-MM-DD'"""
+    return pd.to_datetime(days, unit='D').strftime('%Y-%m-%d').tolist()
+
+
+def create_synthetic_fleet(db_path, vehicles=1000, invoices_per_vehicle=6, seed=42, quiet=True):
+    """
+    יוצר קובץ דאטה בייס עם צי סינתטי (קובץ קיים נמחק).
+
+    Args:
+        db_path: נתיב הקובץ
+        vehicles: מספר רכבים
+        invoices_per_vehicle: ממוצע חשבוניות לרכב (0 עד פי 2, חלק מהרכבים בלי חשבוניות)
+        seed: seed של המחולל האקראי
+        quiet: השתקת ההדפסות של עדכון הסכמה
+
+    Returns:
+        dict: vehicles, invoices
+    """
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    rng = np.random.default_rng(seed)
+    today = (pd.Timestamp.now().normalize() - pd.Timestamp('1970-01-01')).days
+
+    # ===== Vehicles =====
+    ids = [f"SYN-{i:06d}" for i in range(vehicles)]
+    purchase = today - rng.integers(60, 12 * 365, vehicles)
+    retirement = purchase + rng.integers(5 * 365, 10 * 365, vehicles)
+    initial_km = rng.integers(0, 60000, vehicles)
+    purchase_dates = _days_to_dates(purchase)
+    retirement_dates = _days_to_dates(retirement)
+    last_test = _days_to_dates(today - rng.integers(0, 365, vehicles))
+    next_test = _days_to_dates(today + rng.integers(-30, 365, vehicles))
+
+    vehicle_rows = []
+    for i, vid in enumerate(ids):
+        vehicle_rows.append((
+            vid, f"{rng.integers(10, 99)}-{rng.integers(100, 999)}-{rng.integers(10, 99)}",
+            MAKE_MODELS[i % len(MAKE_MODELS)], int(purchase_dates[i][:4]), purchase_dates[i],
+            None if i % 31 == 0 else int(initial_km[i]), 'active',
+            None if i % 17 == 0 else purchase_dates[i], None,
+            last_test[i], next_test[i], None if i % 23 == 0 else retirement_dates[i]
+        ))
+
+    # ===== Invoices =====
+    counts = rng.integers(0, 2 * invoices_per_vehicle + 1, vehicles)
+    counts[::13] = 0
+    owners = np.repeat(np.arange(vehicles), counts)
+    total = len(owners)
+    # תאריכים בין הרכישה להיום, עולים לכל רכב; קילומטראז' עולה בהתאם
+    fraction = rng.random(total)
+    order = np.lexsort((fraction, owners))
+    fraction = fraction[order]
+    span = today - purchase[owners]
+    dates = _days_to_dates(purchase[owners] + (fraction * span).astype(int))
+    km_per_day = rng.integers(20, 180, vehicles)[owners]
+    odometer = initial_km[owners] + (fraction * span * km_per_day).astype(int)
+    # מוסך "יקר" לכל רכב שלישי - בסיס לכללי עלות חריגה ומוסך יקר
+    workshop_index = rng.integers(0, len(WORKSHOPS), total)
+    expensive = (owners % 3 == 0)
+    totals = np.round(rng.gamma(2.0, 450.0, total) * np.where(expensive, 2.5, 1.0), 2)
+
+    invoice_rows = []
+    for n in range(total):
+        vid = ids[owners[n]]
+        invoice_rows.append((
+            f"SYN-INV-{n:08d}", dates[n], WORKSHOPS[workshop_index[n]], vid,
+            vehicle_rows[owners[n]][1], vehicle_rows[owners[n]][2], int(odometer[n]),
+            KINDS[n % len(KINDS)], float(round(totals[n] / 1.17, 2)), float(round(totals[n] - totals[n] / 1.17, 2)),
+            float(totals[n]), None
+        ))
+
+    # ===== Database =====
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    cur.execute("""CREATE TABLE vehicles (
+        vehicle_id TEXT PRIMARY KEY,
+        plate TEXT,
+        make_model TEXT,
+        year INTEGER,
+        fleet_entry_date TEXT,
+        initial_km INTEGER,
+        status TEXT
+    )""")
+    cur.execute("""CREATE TABLE invoices (
+        invoice_no TEXT PRIMARY KEY, date TEXT, workshop TEXT, vehicle_id TEXT,
+        plate TEXT, make_model TEXT, odometer_km INTEGER, kind TEXT,
+        subtotal REAL, vat REAL, total REAL, pdf_file TEXT
+    )""")
+    cur.execute("""CREATE TABLE invoice_lines (
+        invoice_no TEXT, line_no INTEGER, description TEXT, type TEXT,
+        qty REAL, unit_price REAL, line_total REAL
+    )""")
+    conn.commit()
+    conn.close()
+
+    updater = DatabaseSchemaUpdater(db_path)
+    output = io.StringIO() if quiet else None
+    with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+        updater.update_schema()
+
+        conn = sqlite3.connect(db_path)
+        conn.executemany("""
+            INSERT INTO vehicles (vehicle_id, plate, make_model, year, fleet_entry_date, initial_km, status,
+                                  purchase_date, assigned_to, last_test_date, next_test_date,
+                                  estimated_retirement_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, vehicle_rows)
+        conn.executemany("INSERT INTO invoices VALUES (?,?,?,?,?,?,?,?,?,?,?,?)", invoice_rows)
+        conn.commit()
+        conn.close()
+
+        updater.apply_migrations()
+        updater.analyze()
+
+    return {'vehicles': vehicles, 'invoices': total}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create a synthetic FleetGuard database")
+    parser.add_argument('db_path')
+    parser.add_argument('--vehicles', type=int, default=1000)
+    parser.add_argument('--invoices-per-vehicle', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    created = create_synthetic_fleet(args.db_path, args.vehicles, args.invoices_per_vehicle, args.seed)
+    print(f"[OK] {args.db_path}: {created['vehicles']:,} vehicles, {created['invoices']:,} invoices")
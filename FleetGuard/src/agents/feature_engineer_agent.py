@@ -39,8 +39,8 @@ class FeatureEngineer:
         # נתוני צי מלאים
         fleet_df = self.db.get_fleet_overview()
 
-        # חשבוניות מלאות
-        invoices_df = self.db.get_all_invoices()
+        # חשבוניות מלאות (typed - תאריכים כ-datetime64)
+        invoices_df = self.db.get_all_invoices(typed=True)
 
         print(f"[+] Loaded {len(fleet_df)} vehicles, {len(invoices_df)} invoices")
 
@@ -108,7 +108,7 @@ class FeatureEngineer:
             features_df['months_since_purchase'] = features_df['vehicle_age_years'] * 12
             return features_df
 
-        # המרת תאריכים
+        # המרת תאריכים (ללא עלות אם נטען עם typed=True)
         invoices_df['date'] = pd.to_datetime(invoices_df['date'], errors='coerce')
 
         # חישוב ימים מאז טיפול אחרון
@@ -1,21 +1,60 @@
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 import pandas as pd
 from openai import OpenAI
 from src.utils.config_loader import config
 
 try:
     from src.database_manager import DatabaseManager
+    from src.context_cache import get_context_cache
     from src.fleet_analysis_tools import FleetAnalyzer
 except ImportError:
     # מאפשר הרצה גם כסקריפט עצמאי לבדיקה
     from database_manager import DatabaseManager
+    from context_cache import get_context_cache
     try:
         from fleet_analysis_tools import FleetAnalyzer
     except ImportError:
         FleetAnalyzer = None
 
+# Thread pool משותף לבניית סעיפי ההקשר (כל הסשנים בתהליך). לא נסגר בסוף כל שאלה -
+# סעיף שחרג מה-timeout ממשיך להיבנות ברקע ונשמר במטמון לשאלה הבאה
+_context_executor = None
+_context_executor_lock = threading.Lock()
+
+
+def _get_context_executor():
+    global _context_executor
+    with _context_executor_lock:
+        if _context_executor is None:
+            _context_executor = ThreadPoolExecutor(
+                max_workers=2 * len(FleetAIEngine.CONTEXT_SECTIONS), thread_name_prefix='ai-context'
+            )
+        return _context_executor
+
+
 class FleetAIEngine:
-    def __init__(self, api_key=None):
+    # סעיפי ההקשר של ask_analyst -> המתודה שבונה כל סעיף
+    CONTEXT_SECTIONS = {
+        'data_summary': '_create_data_summary',
+        'strategic_summary': '_create_strategic_summary',
+        'driver_analysis': '_analyze_drivers',
+        'full_data': '_get_full_data_context',
+        'maintenance_insights': '_get_maintenance_insights',
+    }
+    # timeout (שניות) לסעיף; None = מחכים תמיד (הפרומפט לא נבנה בלי סיכום הנתונים).
+    # שאר הסעיפים - לפי AI_CONTEXT_SECTION_TIMEOUT_S
+    CONTEXT_TIMEOUTS = {'data_summary': None}
+
+    def __init__(self, api_key=None, context_cache=None):
+        """
+        Args:
+            api_key: מפתח OpenAI (ברירת מחדל: OPENAI_API_KEY מה-config)
+            context_cache: שמירת סעיפי ההקשר לפי גרסת הנתונים, משותף לכל הסשנים.
+                           None = לפי משתנה הסביבה AI_CONTEXT_CACHE_ENABLED (ברירת מחדל: פעיל)
+        """
         # משתמש ב-ConfigLoader שתומך גם ב-Streamlit Secrets וגם ב-.env
         self.api_key = api_key or config.get("OPENAI_API_KEY")
         if not self.api_key:
@@ -25,6 +64,72 @@ class FleetAIEngine:
         self.db = DatabaseManager()
         self.analyzer = FleetAnalyzer() if FleetAnalyzer else None
 
+        if context_cache is None:
+            context_cache = os.getenv('AI_CONTEXT_CACHE_ENABLED', 'true').lower() == 'true'
+        self._context_cache = get_context_cache(self.db.db_path) if context_cache else None
+        self.section_timeout_s = float(os.getenv('AI_CONTEXT_SECTION_TIMEOUT_S', '15'))
+        # זמני הסעיפים בבנייה האחרונה (לאבחון): שם סעיף -> seconds, status
+        self.context_timings = {}
+
+    def _build_context(self):
+        """
+        בונה את סעיפי ההקשר של ask_analyst.
+        עם המטמון - סעיף שנבנה מאותה גרסת נתונים (ומאותו יום) מוחזר בלי לגשת לדאטה בייס.
+        הסעיפים החסרים נבנים במקביל ב-Thread pool (הם בלתי תלויים ורובם ממתינים ל-SQLite
+        ול-pandas). סעיף שחורג מה-timeout שלו מוחלף בגרסה הישנה מהמטמון אם יש, אחרת {},
+        וממשיך להיבנות ברקע.
+
+        Returns:
+            dict: שם סעיף -> תוכן הסעיף (הזמנים נשמרים ב-self.context_timings)
+        """
+        # גרסה אחת לכל הסעיפים של השאלה
+        version = self._context_cache.data_version() if self._context_cache is not None else None
+        context, timings, pending = {}, {}, {}
+        for section, builder in self.CONTEXT_SECTIONS.items():
+            cached = self._context_cache.peek(section, version) if self._context_cache is not None else None
+            if cached is not None:
+                context[section] = cached
+                timings[section] = {'seconds': 0.0, 'status': 'cached'}
+            else:
+                pending[section] = getattr(self, builder)
+
+        if pending:
+            executor = _get_context_executor()
+            start = time.perf_counter()
+            futures = {
+                section: executor.submit(self._build_section, section, builder, version)
+                for section, builder in pending.items()
+            }
+            for section, future in futures.items():
+                timeout = self.CONTEXT_TIMEOUTS.get(section, self.section_timeout_s)
+                remaining = None if timeout is None else max(start + timeout - time.perf_counter(), 0)
+                try:
+                    context[section], seconds = future.result(timeout=remaining)
+                    timings[section] = {'seconds': round(seconds, 3), 'status': 'built'}
+                except FuturesTimeoutError:
+                    stale = self._context_cache.peek(section) if self._context_cache is not None else None
+                    print(f"⚠️ Warning: context section '{section}' exceeded {timeout}s - "
+                          f"{'using the previous version' if stale is not None else 'left out'}")
+                    context[section] = stale if stale is not None else {}
+                    timings[section] = {'seconds': round(time.perf_counter() - start, 3),
+                                        'status': 'stale' if stale is not None else 'timeout'}
+
+        self.context_timings = {section: timings[section] for section in self.CONTEXT_SECTIONS}
+        return context
+
+    def _build_section(self, section, builder, version):
+        """בונה סעיף אחד (דרך המטמון אם הוא פעיל) ומחזיר (תוכן, שניות)"""
+        start = time.perf_counter()
+        if self._context_cache is not None:
+            value = self._context_cache.get(section, builder, version)
+        else:
+            value = builder()
+        return value, time.perf_counter() - start
+
+    def get_context_cache_stats(self):
+        """סטטיסטיקות מטמון ההקשר (hits, misses, מצב כל סעיף), או None אם הוא כבוי"""
+        return self._context_cache.stats() if self._context_cache is not None else None
+
     def _create_data_summary(self):
         """
         יוצר סיכום קומפקטי של הנתונים במקום לשלוח את כל הטבלה
@@ -78,9 +183,10 @@ class FleetAIEngine:
             "total_invoices": len(df_invoices),
             "total_spent": df_invoices['total'].sum(),
             "date_range": f"{df_invoices['date'].min()} to {df_invoices['date'].max()}",
-            "workshops": df_invoices.groupby('workshop')['total'].agg(['count', 'sum', 'mean']).to_dict('index'),
-            "vehicles": df_invoices.groupby('vehicle_id')['total'].agg(['count', 'sum', 'mean']).to_dict('index'),
-            "by_kind": df_invoices.groupby('kind')['total'].agg(['count', 'sum', 'mean']).to_dict('index'),
+            # אגרגציות על המנוע האנליטי (DuckDB) במקום groupby על כל הטבלה
+            "workshops": self.db.get_invoice_cost_summary('workshop').to_dict('index'),
+            "vehicles": self.db.get_invoice_cost_summary('vehicle_id').to_dict('index'),
+            "by_kind": self.db.get_invoice_cost_summary('kind').to_dict('index'),
             "recent_invoices": df_invoices.head(20).to_dict('records'),  # רק 20 האחרונים מטבלת החשבוניות
             # מידע חדש על קילומטראז'
             "vehicle_mileage": vehicle_mileage,  # כל הרכבים עם קילומטראז'
@@ -319,16 +425,16 @@ class FleetAIEngine:
             # נתוני צי מלאים
             fleet_df = self.db.get_fleet_overview()
 
-            # חשבוניות גולמיות
-            invoices_df = self.db.get_all_invoices()
+            # חשבוניות גולמיות - רק 100 השורות הנדרשות נשלפות מהמסד (LIMIT)
+            invoices_df = self.db.get_all_invoices(limit=100)
 
             # נתונים מאוחדים (JOIN)
-            full_view_df = self.db.get_full_view()
+            full_view_df = self.db.get_full_view(limit=100)
 
             return {
                 'fleet_data': fleet_df.to_dict('records'),
-                'raw_invoices': invoices_df.head(100).to_dict('records'),  # 100 אחרונות
-                'full_view': full_view_df.head(100).to_dict('records'),
+                'raw_invoices': invoices_df.to_dict('records'),  # 100 אחרונות
+                'full_view': full_view_df.to_dict('records'),
                 'fleet_columns': fleet_df.columns.tolist(),
                 'invoice_columns': invoices_df.columns.tolist()
             }
@@ -342,20 +448,14 @@ class FleetAIEngine:
         כולל גישה מלאה לנתונים אסטרטגיים מ-Agent H וניתוח נהגים
         וניתוחים מתקדמים של קילומטראז', עיתוי טיפולים ועלויות
         """
-        # יצירת סיכום קומפקטי במקום לשלוח את כל הנתונים
-        data_summary = self._create_data_summary()
-
-        # הוספת נתונים אסטרטגיים מ-Agent H
-        strategic_summary = self._create_strategic_summary()
-
-        # ניתוח נהגים
-        driver_analysis = self._analyze_drivers()
-
-        # נתונים מלאים מכל הטבלאות
-        full_data = self._get_full_data_context()
-
-        # ניתוחים מתקדמים של תחזוקה
-        maintenance_insights = self._get_maintenance_insights()
+        # סעיפי ההקשר: סיכום קומפקטי במקום כל הנתונים, נתונים אסטרטגיים מ-Agent H,
+        # ניתוח נהגים, נתונים מלאים מכל הטבלאות וניתוחים מתקדמים של תחזוקה
+        context = self._build_context()
+        data_summary = context['data_summary']
+        strategic_summary = context['strategic_summary']
+        driver_analysis = context['driver_analysis']
+        full_data = context['full_data']
+        maintenance_insights = context['maintenance_insights']
 
         # 3. בניית הפרומפט עם סיכום מלא כולל קילומטראז'
         # פורמט מידע על קילומטראז'
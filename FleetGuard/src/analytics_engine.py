@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Analytics Engine
+מנוע אנליטי עמודתי (DuckDB מוטמע) עבור שאילתות אגרגציה על fleet.db
+
+שני מצבי עבודה:
+- attach: ה-extension של sqlite ב-DuckDB מצרף את fleet.db לקריאה בלבד - שאילתות
+  רצות ישירות על הקובץ, בלי העתקה.
+- mirror: אם ה-extension לא מותקן מקומית, הטבלאות
+  שהשאילתה משתמשת בהן נטענות פעם אחת לטבלאות DuckDB בזיכרון ומתרעננות רק כש-
+  PRAGMA data_version משתנה (כל commit של כל חיבור).
+
+התקנת ה-extension מורידה אותו מהרשת, ולכן היא לא קורית בזמן ריצה אלא אם ביקשו
+במפורש (install_extension / DB_ANALYTICS_INSTALL_EXTENSION=true) - בסביבה בלי
+גישה לרשת זה היה תוקע כל הפעלה עד timeout של HTTP.
+
+השאילתות נכתבות ב-SQL שתקף גם ב-SQLite וגם ב-DuckDB, כך ש-DatabaseManager יכול
+להריץ אותן על SQLite כשה-DuckDB לא מותקן (ראה DatabaseManager.analytics_query).
+"""
+
+import os
+import re
+import sqlite3
+import threading
+
+import pandas as pd
+
+from src.query_cache import get_query_cache
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+# טבלאות שזמינות לשאילתות אנליטיות
+ANALYTICS_TABLES = ('invoices', 'invoice_lines', 'vehicles', 'vehicle_stats')
+
+
+class AnalyticsEngine:
+    """
+    חיבור DuckDB יחיד לקובץ SQLite, משותף לכל מופעי DatabaseManager בתהליך.
+
+    Attributes:
+        db_path: נתיב לקובץ הדאטה בייס
+        mode: 'attach' או 'mirror'
+        install_extension: להתקין את ה-extension של sqlite (מהרשת) אם הוא לא מותקן
+    """
+
+    def __init__(self, db_path, install_extension=False):
+        if duckdb is None:
+            raise ImportError("duckdb אינו מותקן")
+
+        self.db_path = db_path
+        self.install_extension = install_extension
+        self._con = duckdb.connect(database=':memory:')
+        self._lock = threading.Lock()
+        self._mirrored = {}  # table -> data version של העותק בזיכרון
+        self.mode = 'attach' if self._attach() else 'mirror'
+
+    def _attach(self):
+        """
+        מנסה לצרף את fleet.db דרך ה-extension של sqlite - טעינה מקומית בלבד, והתקנה
+        רק עם install_extension
+        """
+        path = self.db_path.replace("'", "''")
+        setups = ["LOAD sqlite"]
+        if self.install_extension:
+            setups.append("INSTALL sqlite; LOAD sqlite")
+        for setup in setups:
+            try:
+                self._con.execute(setup)
+                self._con.execute(f"ATTACH '{path}' AS fleet (TYPE sqlite, READ_ONLY)")
+                self._con.execute("USE fleet")
+                return True
+            except Exception:
+                continue
+        return False
+
+    # ===== Mirror Mode =====
+
+    def _referenced_tables(self, query):
+        """הטבלאות מתוך ANALYTICS_TABLES שמופיעות בשאילתה"""
+        words = set(re.findall(r'[A-Za-z_]+', query.lower()))
+        return [table for table in ANALYTICS_TABLES if table in words]
+
+    def _refresh_mirror(self, tables):
+        """טוען מחדש טבלאות שהעותק שלהן בזיכרון ישן יותר מגרסת הנתונים הנוכחית"""
+        version = get_query_cache(self.db_path).data_version()
+        stale = [table for table in tables if self._mirrored.get(table) != version]
+        if not stale:
+            return
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            existing = {
+                row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+            }
+            for table in stale:
+                if table not in existing:
+                    continue
+                df = pd.read_sql_query(f"SELECT * FROM {table}", conn)
+                self._con.register('_mirror_source', df)
+                try:
+                    self._con.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM _mirror_source")
+                finally:
+                    self._con.unregister('_mirror_source')
+                self._mirrored[table] = version
+        finally:
+            conn.close()
+
+    # ===== Queries =====
+
+    def query(self, query, params=None):
+        """מריץ שאילתה ב-DuckDB ומחזיר DataFrame"""
+        with self._lock:
+            if self.mode == 'mirror':
+                self._refresh_mirror(self._referenced_tables(query))
+            return self._con.execute(query, list(params or [])).df()
+
+    def close(self):
+        """סוגר את חיבור ה-DuckDB"""
+        with self._lock:
+            self._con.close()
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_analytics_engine(db_path, install_extension=False):
+    """
+    מחזיר את המנוע האנליטי המשותף לקובץ הדאטה בייס, או None אם duckdb אינו מותקן.
+    install_extension נקבע ביצירה הראשונה.
+    """
+    if duckdb is None:
+        return None
+
+    key = os.path.abspath(db_path)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = AnalyticsEngine(key, install_extension=install_extension)
+            _engines[key] = engine
+        return engine
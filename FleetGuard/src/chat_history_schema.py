@@ -47,6 +47,10 @@ class ChatHistorySchemaManager:
             FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id)
         )
         """)
+        cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chat_messages_conversation
+        ON chat_messages(conversation_id)
+        """)
 
         # טבלה 3: תבניות פרויקטים (Project Templates)
         cursor.execute("""
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+AI Context Cache
+מטמון סעיפי ההקשר של FleetAIEngine.ask_analyst (סיכום נתונים, סיכום אסטרטגי,
+ניתוח נהגים, הקשר נתונים מלא, תובנות תחזוקה)
+
+כל סעיף נשמר עם גרסת הנתונים שממנה נבנה: PRAGMA data_version של fleet.db (דרך
+QueryCache - משתנה בכל commit של כל חיבור / תהליך) ותאריך היום, כי חלק מהסעיפים
+תלויים בו (ימים מאז טיפול, גריטה). סעיף ישן נבנה מחדש רק כשמבקשים אותו, ומופע
+המטמון משותף לכל מופעי FleetAIEngine בתהליך - כלומר לכל הסשנים של הדשבורד.
+"""
+
+import os
+import threading
+import time
+from datetime import date, datetime
+
+from src.query_cache import get_query_cache
+
+
+class ContextCache:
+    """
+    מטמון סעיפי הקשר (dict / list) לקובץ SQLite יחיד.
+
+    סעיף נבנה פעם אחת לכל גרסת נתונים גם כשכמה סשנים מבקשים אותו במקביל (נעילה
+    לכל סעיף). תוצאה ריקה לא נשמרת - הבונים מחזירים {} גם בשגיאה, ושגיאה זמנית
+    (למשל דאטה בייס נעול) לא צריכה להיתקע עד ה-commit הבא.
+
+    Attributes:
+        db_path: נתיב לקובץ הדאטה בייס
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+        self._sections = {}  # section -> (version, value, build_s, built_at)
+        self._section_locks = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def data_version(self):
+        """גרסת הנתונים הנוכחית: (גרסת ה-QueryCache של הקובץ, תאריך היום)"""
+        return get_query_cache(self.db_path).data_version(), date.today().isoformat()
+
+    def get(self, section, builder, version=None):
+        """
+        מחזיר את הסעיף מהמטמון אם הוא מגרסת הנתונים הנוכחית, אחרת בונה אותו.
+
+        Args:
+            section: שם הסעיף
+            builder: פונקציה ללא ארגומנטים שבונה את הסעיף
+            version: גרסת הנתונים (ברירת מחדל: data_version() - אפשר להעביר גרסה אחת
+                     לכל הסעיפים של אותה שאלה)
+
+        Returns:
+            הסעיף (אובייקט משותף - לקריאה בלבד)
+        """
+        if version is None:
+            version = self.data_version()
+
+        with self._lock:
+            entry = self._sections.get(section)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+            section_lock = self._section_locks.setdefault(section, threading.Lock())
+
+        with section_lock:
+            # סשן אחר אולי בנה את הסעיף בזמן שחיכינו
+            with self._lock:
+                entry = self._sections.get(section)
+                if entry is not None and entry[0] == version:
+                    self.hits += 1
+                    return entry[1]
+                self.misses += 1
+
+            # הגרסה נקראה לפני הבנייה - commit שמתבצע במהלכה יבטל את הסעיף בבקשה הבאה
+            start = time.perf_counter()
+            value = builder()
+            build_s = time.perf_counter() - start
+            if value:
+                with self._lock:
+                    self._sections[section] = (version, value, build_s, datetime.now().isoformat(timespec='seconds'))
+            return value
+
+    def peek(self, section, version=None):
+        """
+        הסעיף השמור בלי לבנות ובלי לספור hit / miss.
+        עם version - רק אם הוא מאותה גרסה; בלי - גם סעיף ישן (גיבוי כשבנייה מתעכבת).
+        None אם אין.
+        """
+        with self._lock:
+            entry = self._sections.get(section)
+        if entry is None or (version is not None and entry[0] != version):
+            return None
+        return entry[1]
+
+    def invalidate(self, section=None):
+        """מבטל סעיף אחד (או את כל הסעיפים) - ייבנה מחדש בבקשה הבאה"""
+        with self._lock:
+            if section is None:
+                self._sections.clear()
+            else:
+                self._sections.pop(section, None)
+
+    def stats(self):
+        """סטטיסטיקות שימוש: hits / misses ולכל סעיף שמור - האם הוא עדכני, זמן הבנייה ומתי נבנה"""
+        version = self.data_version()
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+                'sections': {
+                    section: {
+                        'fresh': entry[0] == version,
+                        'build_s': round(entry[2], 3),
+                        'built_at': entry[3]
+                    }
+                    for section, entry in self._sections.items()
+                }
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_context_cache(db_path):
+    """
+    מחזיר את מטמון ההקשר המשותף לקובץ הדאטה בייס (משותף לכל מופעי FleetAIEngine בתהליך).
+    """
+    key = os.path.abspath(db_path)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = ContextCache(key)
+            _caches[key] = cache
+        return cache
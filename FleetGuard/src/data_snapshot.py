@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Data Snapshots
+צילומי Parquet של טבלאות הצי לטעינה מהירה בהפעלה (cold start) של הדשבורד
+
+כל צילום נשמר עם גרסת הנתונים של fleet.db ברגע הקריאה. בטעינה הצילום נקרא
+עם memory mapping ורק העמודות שהתבקשו (column projection); אם גרסת הנתונים
+השתנתה מאז (commit של כל חיבור / תהליך) הצילום נחשב ישן ו-DatabaseManager
+קורא מ-SQLite וכותב צילום חדש.
+
+גרסת הנתונים נגזרת מגודל וזמן השינוי של fleet.db ושל קובץ ה-WAL - בשונה מ-
+PRAGMA data_version היא נשמרת בין תהליכים. checkpoint של ה-WAL משנה אותה בלי
+שינוי בנתונים, מה שרק גורם לקריאה חוזרת מ-SQLite (לעולם לא לנתונים ישנים).
+
+שימוש:
+    python -m src.data_snapshot export   # כתיבת כל הצילומים
+    python -m src.data_snapshot status   # מצב הצילומים מול הדאטה בייס
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from importlib.util import find_spec
+
+import pandas as pd
+
+
+# Parquet דורש pyarrow; בלעדיו הצילומים כבויים והקריאה היא תמיד מ-SQLite
+PARQUET_AVAILABLE = find_spec('pyarrow') is not None
+
+
+class SnapshotStore:
+    """
+    תיקיית צילומי Parquet של קובץ דאטה בייס אחד, עם manifest שמתעד לכל צילום
+    את הקובץ, גרסת הנתונים ומספר השורות.
+
+    Attributes:
+        db_path: נתיב לקובץ הדאטה בייס
+        snapshot_dir: תיקיית הצילומים (ברירת מחדל: snapshots/ ליד קובץ הדאטה בייס)
+    """
+
+    def __init__(self, db_path, snapshot_dir=None):
+        self.db_path = os.path.abspath(db_path)
+        self.snapshot_dir = snapshot_dir or os.path.join(os.path.dirname(self.db_path), 'snapshots')
+        self._prefix = os.path.splitext(os.path.basename(self.db_path))[0]
+        self.manifest_path = os.path.join(self.snapshot_dir, f"{self._prefix}.manifest.json")
+        self._lock = threading.Lock()
+
+    # ===== Data Version =====
+
+    def data_version(self):
+        """
+        גרסת הנתונים הנוכחית של הקובץ (נשמרת בין תהליכים).
+        WAL ריק או חסר נחשבים זהים - פתיחת חיבור לקריאה לא משנה את הגרסה.
+        """
+        parts = []
+        for suffix in ('', '-wal'):
+            try:
+                stat = os.stat(self.db_path + suffix)
+            except FileNotFoundError:
+                continue
+            if suffix and stat.st_size == 0:
+                continue
+            parts.append(f"{suffix}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}")
+        return hashlib.sha1('|'.join(parts).encode()).hexdigest()[:16]
+
+    # ===== Manifest =====
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {'tables': {}}
+
+    def _write_manifest(self, manifest):
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    # ===== Read / Write =====
+
+    def read(self, name, version, columns=None):
+        """
+        קורא צילום (memory-mapped, רק העמודות שהתבקשו).
+
+        Returns:
+            DataFrame, או None אם אין צילום, הוא מגרסה אחרת או לא ניתן לקריאה
+        """
+        if not PARQUET_AVAILABLE:
+            return None
+
+        entry = self._read_manifest()['tables'].get(name)
+        if entry is None or entry['version'] != version:
+            return None
+
+        path = os.path.join(self.snapshot_dir, entry['file'])
+        try:
+            return pd.read_parquet(path, columns=columns, engine='pyarrow', memory_map=True)
+        except Exception:
+            return None
+
+    def write(self, name, df, version):
+        """
+        כותב צילום חדש בשם קובץ עם הגרסה, מעדכן את ה-manifest ומוחק את הצילום הקודם.
+
+        Returns:
+            bool: האם הצילום נכתב
+        """
+        if not PARQUET_AVAILABLE:
+            return False
+
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        filename = f"{self._prefix}.{name}.{version}.parquet"
+        path = os.path.join(self.snapshot_dir, filename)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        df.to_parquet(tmp_path, engine='pyarrow', index=False)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            manifest = self._read_manifest()
+            old = manifest['tables'].get(name)
+            manifest['tables'][name] = {
+                'file': filename,
+                'version': version,
+                'rows': len(df),
+                'columns': list(df.columns),
+                'created_at': datetime.now().isoformat(timespec='seconds')
+            }
+            self._write_manifest(manifest)
+
+        if old is not None and old['file'] != filename:
+            try:
+                os.remove(os.path.join(self.snapshot_dir, old['file']))
+            except OSError:
+                pass
+        return True
+
+    def status(self):
+        """מצב כל הצילומים מול גרסת הנתונים הנוכחית"""
+        version = self.data_version()
+        return {
+            name: {**entry, 'fresh': entry['version'] == version}
+            for name, entry in self._read_manifest()['tables'].items()
+        }
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_snapshot_store(db_path):
+    """מחזיר את תיקיית הצילומים המשותפת לקובץ הדאטה בייס"""
+    key = os.path.abspath(db_path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = SnapshotStore(key)
+            _stores[key] = store
+        return store
+
+
+if __name__ == "__main__":
+    from src.database_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="FleetGuard Parquet snapshots")
+    parser.add_argument('command', choices=['export', 'status'])
+    parser.add_argument('--db', help="database path (default: data/database/fleet.db)")
+    args = parser.parse_args()
+
+    db = DatabaseManager(args.db)
+    if args.command == 'export':
+        for name, rows in db.export_snapshots().items():
+            print(f"[OK] {name}: {rows} rows")
+    else:
+        status = get_snapshot_store(db.db_path).status()
+        if not status:
+            print("⚠️ No snapshots yet (run: python -m src.data_snapshot export)")
+        for name, entry in status.items():
+            state = "fresh" if entry['fresh'] else "stale"
+            print(f"{name}: {entry['rows']} rows, {entry['created_at']} ({state})")
@@ -1,13 +1,52 @@
+import json
 import sqlite3
+import numpy as np
 import pandas as pd
 import os
+import threading
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
+from datetime import date, datetime
 from src.utils.path_resolver import path_resolver
-
+from src.database_pool import get_connection_pool
+from src.query_cache import get_query_cache
+from src.analytics_engine import get_analytics_engine
+from src.data_snapshot import get_snapshot_store
+from src.write_queue import get_write_queue
+from src.invoice_archive import InvoiceArchive
+from src.query_profiler import get_query_profiler, profile_methods
+from src.database_schema_update import DatabaseSchemaUpdater
+
+# קבצי דאטה בייס שכבר עברו בדיקת מיגרציות בתהליך הנוכחי
+_schema_checked_paths = set()
+_schema_lock = threading.Lock()
+
+# יום 0 של עמודות ה-epoch-day (ראה DatabaseSchemaUpdater.EPOCH_DAY_SQL)
+EPOCH = date(1970, 1, 1)
+
+@profile_methods
 class DatabaseManager:
-    def __init__(self, db_path=None):
+    # מתודות תשתית שלא נמדדות ע"י QueryProfiler (חיבורים / מטמון - לא שאילתות)
+    PROFILE_EXCLUDE = {
+        'ensure_schema', 'apply_migrations', 'get_connection', 'get_read_connection', 'get_write_connection',
+        'close_connections', 'get_data_version', 'get_cache_stats', 'clear_cache', 'has_search_index',
+        'get_analytics_backend', 'get_write_queue_stats'
+    }
+
+    def __init__(self, db_path=None, pooled=None, cache=None, analytics=None, write_queue=None):
         """
         מאתחל את החיבור לדאטה בייס.
         אם לא התקבל נתיב, משתמש ב-PathResolver למציאה אוטומטית.
+
+        Args:
+            db_path: נתיב לקובץ הדאטה בייס (ברירת מחדל: data/database/fleet.db)
+            pooled: שימוש בחיבורים ממוחזרים (thread-local, WAL).
+                    None = לפי משתנה הסביבה DB_POOL_ENABLED
+            cache: מטמון תוצאות שאילתות קריאה (מתבטל אוטומטית בכל שינוי בדאטה בייס).
+                   None = לפי משתנה הסביבה DB_CACHE_ENABLED (ברירת מחדל: פעיל)
+            analytics: מנוע שאילתות האגרגציה של analytics_query - 'auto' / 'duckdb' / 'sqlite'.
+                       None = לפי משתנה הסביבה DB_ANALYTICS_ENGINE (ברירת מחדל: auto)
+            write_queue: כתיבות קטנות (חשבונית, הודעות צ'אט, לוג סנכרון, התראות) דרך Thread כותב
+                         יחיד עם group commit. None = לפי משתנה הסביבה DB_WRITE_QUEUE_ENABLED
         """
         if db_path is None:
             # שימוש ב-PathResolver לקבלת נתיב מוחלט
@@ -16,36 +55,345 @@ class DatabaseManager:
         else:
             self.db_path = db_path
 
+        if pooled is None:
+            pooled = os.getenv('DB_POOL_ENABLED', 'false').lower() == 'true'
+        self.pooled = pooled
+        self._pool = get_connection_pool(self.db_path) if pooled else None
+
+        if cache is None:
+            cache = os.getenv('DB_CACHE_ENABLED', 'true').lower() == 'true'
+        self._cache = None
+        if cache:
+            max_mb = int(os.getenv('DB_CACHE_MAX_MB', '64'))
+            self._cache = get_query_cache(self.db_path, max_bytes=max_mb * 1024 * 1024)
+
+        if analytics is None:
+            analytics = os.getenv('DB_ANALYTICS_ENGINE', 'auto').lower()
+        if analytics not in ('auto', 'duckdb', 'sqlite'):
+            raise ValueError(f"מנוע אנליטי לא מוכר: {analytics}")
+        # המנוע נוצר בשאילתה האנליטית הראשונה (ראה _get_analytics), לא בבנאי
+        self._analytics_setting = analytics
+        self._analytics = None
+        self._analytics_pending = analytics != 'sqlite'
+
+        if write_queue is None:
+            write_queue = os.getenv('DB_WRITE_QUEUE_ENABLED', 'false').lower() == 'true'
+        self._write_queue = None
+        if write_queue:
+            max_delay_ms = float(os.getenv('DB_WRITE_QUEUE_MAX_DELAY_MS', '5'))
+            self._write_queue = get_write_queue(self.db_path, max_delay_ms=max_delay_ms)
+        # המתנה מקסימלית לתוצאת כתיבה (תור כתיבה תקוע לא תוקע את המתקשר)
+        self.write_timeout_s = float(os.getenv('DB_WRITE_TIMEOUT_S', '30'))
+
+    def ensure_schema(self):
+        """
+        בודק שגרסת הסכמה (PRAGMA user_version) עדכנית - בלי להחיל מיגרציות בזמן קריאה.
+        רץ פעם אחת לכל קובץ דאטה בייס בתהליך; אם הסכמה ישנה - אזהרה בלבד.
+        המיגרציות מוחלות במפורש: apply_migrations בהפעלת האפליקציה, או
+        python -m src.database_schema_update migrate
+        """
+        if self.db_path in _schema_checked_paths:
+            return
+        with _schema_lock:
+            if self.db_path in _schema_checked_paths or not os.path.exists(self.db_path):
+                return
+            latest = DatabaseSchemaUpdater.MIGRATIONS[-1][0]
+            try:
+                version = DatabaseSchemaUpdater(self.db_path).get_schema_version()
+            except sqlite3.Error as e:
+                print(f"⚠️ Schema version check skipped: {str(e)}")
+                version = latest
+            if version < latest:
+                print(f"⚠️ Warning: database schema version {version} is behind {latest} - "
+                      f"run: python -m src.database_schema_update migrate")
+            _schema_checked_paths.add(self.db_path)
+
+    def apply_migrations(self):
+        """
+        מחיל את המיגרציות שטרם הוחלו (DDL, בניית FTS, טריגרים, ANALYZE) - נקרא במפורש
+        בהפעלת האפליקציה / CLI שכותב, לא מנתיב הקריאה.
+        כישלון (למשל קובץ לקריאה בלבד) לא חוסם את המשך העבודה.
+
+        Returns:
+            list: גרסאות המיגרציות שהוחלו
+        """
+        applied = []
+        with _schema_lock:
+            if not os.path.exists(self.db_path):
+                return applied
+            try:
+                applied = DatabaseSchemaUpdater(self.db_path).apply_migrations()
+            except sqlite3.Error as e:
+                print(f"⚠️ Schema migration skipped: {str(e)}")
+            _schema_checked_paths.add(self.db_path)
+        return applied
+
     def get_connection(self):
         """יוצר חיבור ל-SQLite"""
+        self.ensure_schema()
+        if self._pool is not None:
+            return self._pool.get_write_connection()
         if not os.path.exists(self.db_path):
             raise FileNotFoundError(f"❌ Database not found at: {self.db_path}")
         return sqlite3.connect(self.db_path)
 
-    def get_all_invoices(self):
-        """שולף את כל החשבוניות כ-DataFrame"""
-        conn = self.get_connection()
-        query = "SELECT * FROM invoices"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-        return df
+    def get_read_connection(self):
+        """
+        חיבור לקריאה בלבד.
+        במצב pooled - חיבור query_only ממוחזר של ה-Thread הנוכחי; אחרת חיבור חדש.
+        """
+        if self._pool is not None:
+            self.ensure_schema()
+            return self._pool.get_read_connection()
+        return self.get_connection()
 
-    def get_invoice_lines(self):
-        """שולף את כל שורות הפירוט (פריטים)"""
-        conn = self.get_connection()
-        query = "SELECT * FROM invoice_lines"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+    def get_write_connection(self):
+        """
+        חיבור לכתיבה.
+        במצב pooled - חיבור כתיבה ממוחזר של ה-Thread הנוכחי; אחרת חיבור חדש.
+        """
+        if self._pool is not None:
+            self.ensure_schema()
+            return self._pool.get_write_connection()
+        return self.get_connection()
+
+    def close_connections(self):
+        """סוגר את כל החיבורים הממוחזרים של קובץ הדאטה בייס (במצב pooled)"""
+        if self._pool is not None:
+            self._pool.close_all()
+
+    # ===== Write Queue =====
+
+    def _write(self, work, error_message, wait=True):
+        """
+        מריץ work(cursor) בטרנזקציה ומחזיר את הערך שהחזיר.
+        עם תור כתיבה - העבודה נשלחת ל-Thread הכותב ומצטרפת ל-group commit; אחרת - חיבור כתיבה רגיל.
+
+        Args:
+            work: פונקציה שמקבלת cursor ומריצה את הכתיבות (בלי commit)
+            error_message: תחילית הודעת השגיאה
+            wait: False = החזרת Future מיד (התוצאה / השגיאה זמינות אחרי ה-commit)
+        """
+        if self._write_queue is not None:
+            self.ensure_schema()
+            future = self._write_queue.submit(work)
+        else:
+            future = Future()
+            conn = self.get_write_connection()
+            cursor = conn.cursor()
+            try:
+                result = work(cursor)
+                conn.commit()
+                future.set_result(result)
+            except Exception as e:
+                conn.rollback()
+                future.set_exception(e)
+            finally:
+                conn.close()
+
+        if not wait:
+            return future
+        try:
+            return future.result(timeout=self.write_timeout_s)
+        except FuturesTimeoutError:
+            raise Exception(f"{error_message}: הכתיבה לא הסתיימה תוך {self.write_timeout_s:g} שניות")
+        except Exception as e:
+            raise Exception(f"{error_message}: {str(e)}")
+
+    def get_write_queue_stats(self):
+        """סטטיסטיקות תור הכתיבה (jobs, commits, jobs_per_commit...), או None אם הוא כבוי"""
+        return self._write_queue.stats() if self._write_queue is not None else None
+
+    # ===== Query Cache =====
+
+    def get_data_version(self):
+        """
+        מזהה גרסת הנתונים הנוכחית (משתנה בכל commit של כל חיבור).
+        None אם המטמון כבוי.
+        """
+        if self._cache is None:
+            return None
+        return self._cache.data_version()
+
+    def get_cache_stats(self):
+        """סטטיסטיקות מטמון השאילתות (hits, misses, bytes...), או None אם המטמון כבוי"""
+        return self._cache.stats() if self._cache is not None else None
+
+    def clear_cache(self):
+        """מרוקן את מטמון השאילתות"""
+        if self._cache is not None:
+            self._cache.clear()
+
+    # ===== Typed Loading =====
+
+    # עמודות תאריך (TEXT במסד) שמומרות ל-datetime64 בטעינה טיפוסית
+    DATE_COLUMNS = {
+        'date', 'purchase_date', 'fleet_entry_date', 'last_test_date', 'next_test_date',
+        'estimated_retirement_date', 'last_service_date'
+    }
+    # עמודות טקסט עם מעט ערכים ייחודיים - נשמרות כ-category
+    CATEGORY_COLUMNS = {'workshop', 'make_model', 'kind', 'plate'}
+    # עמודות epoch-day מחושבות (מיגרציה 006) - לשימוש בשאילתות בלבד, לא מוחזרות ב-DataFrames
+    DAY_COLUMNS = {
+        day_column
+        for day_columns in DatabaseSchemaUpdater.DAY_COLUMNS.values()
+        for day_column in day_columns
+    }
+
+    @classmethod
+    def apply_dtypes(cls, df):
+        """
+        ממיר DataFrame גולמי מ-SQLite לטיפוסים קומפקטיים:
+        - עמודות תאריך -> datetime64 (ערכים לא תקינים / ריקים -> NaT)
+        - workshop / make_model / kind / plate -> category
+        - עמודות int64 -> int32 (קילומטראז', שנים, ספירות)
+
+        עמודות כספיות (float) נשארות float64 כדי לא לאבד דיוק בסכומים,
+        ושלמים לא מוקטנים מתחת ל-int32 כדי שחישובים (למשל total_services * 5) לא יגלשו.
+        """
+        int32 = np.iinfo(np.int32)
+        for col in df.columns:
+            if col in cls.DATE_COLUMNS:
+                df[col] = pd.to_datetime(df[col], errors='coerce', format='ISO8601')
+            elif col in cls.CATEGORY_COLUMNS:
+                df[col] = df[col].astype('category')
+            elif df[col].dtype == np.int64 and (
+                df[col].empty or (df[col].min() >= int32.min and df[col].max() <= int32.max)
+            ):
+                df[col] = df[col].astype(np.int32)
         return df
 
-    def get_full_view(self):
+    def _read_frame(self, query, params=None, typed=False, archive=False):
         """
-        מחבר בין החשבוניות לשורות הפירוט (Join)
-        כדי לקבל תמונה מלאה: מי עשה מה, מתי וכמה עלה.
+        מריץ שאילתת קריאה ומחזיר DataFrame (עם המרת טיפוסים אם typed=True).
+        התוצאה נשמרת במטמון עד ה-commit הבא; כל קריאה מקבלת עותק משלה.
+        archive=True - השאילתה רצה על חיבור עם מחיצות הארכיון (invoices_all / invoice_lines_all).
         """
-        conn = self.get_connection()
-        query = """
-        SELECT 
+        if self._cache is None:
+            return self._query_frame(query, params, typed, archive)
+
+        self.ensure_schema()
+        key = (query, tuple(params) if params else (), typed, archive)
+        # הגרסה נקראת לפני השאילתה - commit שמתבצע במהלכה יבטל את התוצאה בקריאה הבאה
+        version = self._cache.data_version()
+        df = self._cache.get(key, version)
+        if df is None:
+            df = self._query_frame(query, params, typed, archive)
+            self._cache.put(key, version, df)
+        return df.copy()
+
+    def _query_frame(self, query, params=None, typed=False, archive=False):
+        """מריץ שאילתת קריאה מול הדאטה בייס (ללא מטמון)"""
+        get_query_profiler().note_sql(query, params)
+        if archive:
+            self.ensure_schema()
+            conn = InvoiceArchive(self.db_path).connect()
+        else:
+            conn = self.get_read_connection()
+        try:
+            df = self._drop_day_columns(pd.read_sql_query(query, conn, params=params))
+        finally:
+            conn.close()
+        return self.apply_dtypes(df) if typed else df
+
+    @classmethod
+    def _drop_day_columns(cls, df):
+        """מסיר עמודות epoch-day ש-SELECT * מחזיר (הן חלק מהטבלה אבל לא מהנתונים)"""
+        day_columns = [col for col in df.columns if col in cls.DAY_COLUMNS]
+        return df.drop(columns=day_columns) if day_columns else df
+
+    def _iter_frames(self, query, params=None, chunksize=10000, typed=False):
+        """
+        מריץ שאילתת קריאה ומחזיר generator של DataFrames בגודל chunksize,
+        כך שטבלאות גדולות לא נטענות לזיכרון במלואן.
+        """
+        get_query_profiler().note_sql(query, params)
+        conn = self.get_read_connection()
+        try:
+            for chunk in pd.read_sql_query(query, conn, params=params, chunksize=chunksize):
+                chunk = self._drop_day_columns(chunk)
+                yield self.apply_dtypes(chunk) if typed else chunk
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _paginate(query, params, limit=None, offset=0):
+        """מוסיף LIMIT/OFFSET לשאילתה (pushdown ל-SQLite במקום head() ב-pandas)"""
+        params = list(params or [])
+        if limit is None and not offset:
+            return query, params or None
+        query += " LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else int(limit), int(offset or 0)]
+        return query, params
+
+    def _where_clause(self, where, table_columns):
+        """
+        בונה WHERE מתוך dict של {עמודה: ערך}.
+        ערך מסוג list/tuple/set -> IN, None -> IS NULL. שמות עמודות נבדקים מול רשימה מותרת.
+        """
+        conditions, params = self._filter_conditions(where, table_columns)
+        return (" WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    def _filter_conditions(self, where, table_columns):
+        """תנאי הסינון של _where_clause כרשימה (לשילוב עם תנאים נוספים)"""
+        conditions, params = [], []
+        for col, value in (where or {}).items():
+            if col not in table_columns:
+                raise ValueError(f"עמודה לא מוכרת לסינון: {col}")
+            if value is None:
+                conditions.append(f"{col} IS NULL")
+            elif isinstance(value, (list, tuple, set)):
+                value = list(value)
+                if not value:
+                    conditions.append("0")
+                    continue
+                conditions.append(f"{col} IN ({', '.join('?' * len(value))})")
+                params.extend(value)
+            else:
+                conditions.append(f"{col} = ?")
+                params.append(value)
+        return conditions, params
+
+    def get_all_invoices(self, typed=False, limit=None, offset=0, include_archive=False):
+        """
+        שולף את כל החשבוניות כ-DataFrame
+
+        Args:
+            typed: True = תאריכים כ-datetime64, טקסט חוזר כ-category (ראה apply_dtypes)
+            limit / offset: שליפת טווח שורות בלבד (LIMIT/OFFSET ב-SQLite)
+            include_archive: גם חשבוניות שהועברו לארכיון השנתי (ברירת מחדל: רק המחיצה החמה)
+        """
+        table = 'invoices_all' if include_archive else 'invoices'
+        query, params = self._paginate(f"SELECT * FROM {table}", None, limit, offset)
+        return self._read_frame(query, params=params, typed=typed, archive=include_archive)
+
+    def iter_invoices(self, where=None, chunksize=10000, typed=False):
+        """
+        מחזיר generator של DataFrames של חשבוניות במנות בגודל chunksize.
+
+        Args:
+            where: dict של {עמודה: ערך} לסינון, למשל {'vehicle_id': 'VH-01'}
+                   או {'kind': ['routine', 'tires']}
+            chunksize: מספר שורות בכל מנה
+            typed: המרת טיפוסים לכל מנה (ראה apply_dtypes)
+        """
+        where_sql, params = self._where_clause(where, self.INVOICE_COLUMNS)
+        query = f"SELECT * FROM invoices{where_sql}"
+        return self._iter_frames(query, params=params or None, chunksize=chunksize, typed=typed)
+
+    def get_invoice_lines(self, typed=False, limit=None, offset=0, include_archive=False):
+        """שולף את כל שורות הפירוט (פריטים); include_archive - גם מהארכיון השנתי"""
+        table = 'invoice_lines_all' if include_archive else 'invoice_lines'
+        query, params = self._paginate(f"SELECT * FROM {table}", None, limit, offset)
+        return self._read_frame(query, params=params, typed=typed, archive=include_archive)
+
+    def iter_invoice_lines(self, where=None, chunksize=10000, typed=False):
+        """מחזיר generator של DataFrames של שורות פירוט במנות (ראה iter_invoices)"""
+        where_sql, params = self._where_clause(where, self.LINE_COLUMNS)
+        query = f"SELECT * FROM invoice_lines{where_sql}"
+        return self._iter_frames(query, params=params or None, chunksize=chunksize, typed=typed)
+
+    FULL_VIEW_COLUMNS = """
             i.invoice_no, 
             i.date, 
             i.workshop, 
@@ -56,40 +404,236 @@ class DatabaseManager:
             l.description, 
             l.qty, 
             l.unit_price, 
-            l.line_total
+            l.line_total"""
+
+    FULL_VIEW_QUERY = f"""
+        SELECT {FULL_VIEW_COLUMNS}
         FROM invoices i
         JOIN invoice_lines l ON i.invoice_no = l.invoice_no
         ORDER BY i.date DESC
         """
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-        return df
+    # אותו Join על ההיסטוריה המלאה (מחיצה חמה + ארכיון שנתי)
+    FULL_VIEW_ARCHIVE_QUERY = f"""
+        SELECT {FULL_VIEW_COLUMNS}
+        FROM invoices_all i
+        JOIN invoice_lines_all l ON i.invoice_no = l.invoice_no
+        ORDER BY i.date DESC
+        """
 
-    def get_vehicle_history(self, vehicle_id):
-        """שולף היסטוריה ספציפית לרכב"""
-        conn = self.get_connection()
-        query = f"SELECT * FROM invoices WHERE vehicle_id = '{vehicle_id}' ORDER BY date DESC"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-        return df
+    def get_full_view(self, typed=False, limit=None, offset=0, include_archive=False):
+        """
+        מחבר בין החשבוניות לשורות הפירוט (Join)
+        כדי לקבל תמונה מלאה: מי עשה מה, מתי וכמה עלה.
+
+        Args:
+            typed: המרת טיפוסים (ראה apply_dtypes)
+            limit / offset: שליפת טווח שורות בלבד - למשל limit=100 ל-100 השורות האחרונות
+            include_archive: גם חשבוניות שהועברו לארכיון השנתי (ברירת מחדל: רק המחיצה החמה)
+        """
+        base_query = self.FULL_VIEW_ARCHIVE_QUERY if include_archive else self.FULL_VIEW_QUERY
+        query, params = self._paginate(base_query, None, limit, offset)
+        return self._read_frame(query, params=params, typed=typed, archive=include_archive)
+
+    def iter_full_view(self, chunksize=10000, typed=False):
+        """מחזיר generator של DataFrames של ה-Join המלא (מהחדש לישן) במנות בגודל chunksize"""
+        return self._iter_frames(self.FULL_VIEW_QUERY, chunksize=chunksize, typed=typed)
+
+    # ===== Keyset Pagination =====
+
+    # מקורות לתצוגה בעמודים: שאילתת בסיס, עמודות מפתח ייחודי (שובר שוויון במיון), מיון ברירת מחדל.
+    # עמודות שמתחילות ב-_ הן מפתחות פנימיים ולא מוחזרות ב-DataFrame.
+    PAGED_SOURCES = {
+        'full_view': (
+            f"SELECT {FULL_VIEW_COLUMNS}, l.rowid AS _row_key "
+            "FROM invoices i JOIN invoice_lines l ON i.invoice_no = l.invoice_no",
+            ('_row_key',), ('date', True)
+        ),
+        'invoices': ("SELECT * FROM invoices", ('invoice_no',), None),
+        'invoice_lines': ("SELECT *, rowid AS _row_key FROM invoice_lines", ('_row_key',), None),
+        'vehicles': ("SELECT * FROM vehicles", ('vehicle_id',), None),
+    }
+
+    def get_page_columns(self, source):
+        """מחזיר את העמודות הגלויות של מקור לתצוגה בעמודים (למיון / סינון)"""
+        return [c for c in self._source_columns(source) if not c.startswith('_')]
+
+    def _source_columns(self, source):
+        if source not in self.PAGED_SOURCES:
+            raise ValueError(f"מקור לא מוכר: {source}")
+        base_query = self.PAGED_SOURCES[source][0]
+        return list(self._read_frame(f"SELECT * FROM ({base_query}) LIMIT 0").columns)
+
+    def _page_conditions(self, source, filters=None, search=None):
+        """
+        תנאי WHERE משותפים לשליפת עמוד ולספירה:
+        filters - dict של {עמודה: ערך} (ראה _where_clause), search - טקסט חופשי.
+        החיפוש הוא LIKE על כל העמודות הגלויות. במקורות עם invoice_no העמודות שבאינדקס
+        ה-FTS (ראה search_text) נבדקות רק בחשבוניות שהאינדקס מצא (סינון מקדים), כך שהתוצאה
+        זהה ל-LIKE מלא: שורת פריט נמצאת לפי ה-description שלה ולא לפי פריטים אחרים
+        באותה חשבונית, ועמודות שלא מוצגות במקור לא נבדקות.
+        """
+        columns = self.get_page_columns(source)
+        conditions, params = self._filter_conditions(filters, columns)
+        if search and search.strip():
+            pattern = self._like_pattern(search)
+            like = lambda cols: " OR ".join(f"CAST(\"{c}\" AS TEXT) LIKE ? ESCAPE '\\'" for c in cols)
+            indexed = []
+            if 'invoice_no' in columns:
+                indexed = [c for c in columns if c in self.TEXT_SEARCH_COLUMNS or c == 'description']
+            others = [c for c in columns if c not in indexed]
+
+            matches = []
+            if indexed:
+                search_sql, search_params, _ = self._text_search_sql(search)
+                matches.append(f"(invoice_no IN ({search_sql}) AND ({like(indexed)}))")
+                params.extend(search_params)
+                params.extend([pattern] * len(indexed))
+            if others:
+                matches.append(f"({like(others)})")
+                params.extend([pattern] * len(others))
+            conditions.append("(" + " OR ".join(matches) + ")")
+        return conditions, params
+
+    @staticmethod
+    def _like_pattern(text):
+        """תבנית LIKE לתת-מחרוזת (עם escape ל-% ו-_)"""
+        return '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+    def page_rows(self, source, sort_col=None, descending=False, after_key=None, page_size=25,
+                  filters=None, search=None, typed=False):
+        """
+        שולף עמוד אחד ממקור (Keyset Pagination): במקום OFFSET, ממשיכים מהמפתח של השורה האחרונה
+        בעמוד הקודם, כך שכל עמוד עולה אותו דבר גם עמוק בטבלה.
+
+        Args:
+            source: שם מקור מתוך PAGED_SOURCES ('full_view', 'invoices', 'invoice_lines', 'vehicles')
+            sort_col: עמודת מיון (None = מיון ברירת המחדל של המקור)
+            descending: מיון יורד
+            after_key: next_key שהוחזר מהעמוד הקודם (None = עמוד ראשון)
+            page_size: מספר שורות בעמוד
+            filters: dict של {עמודה: ערך} (ראה _where_clause)
+            search: טקסט חופשי לחיפוש בכל העמודות
+            typed: המרת טיפוסים (ראה apply_dtypes)
+
+        Returns:
+            (DataFrame של העמוד, next_key) - next_key הוא None בעמוד האחרון
+        """
+        if source not in self.PAGED_SOURCES:
+            raise ValueError(f"מקור לא מוכר: {source}")
+        base_query, key_cols, default_sort = self.PAGED_SOURCES[source]
+        if sort_col is None and default_sort is not None:
+            sort_col, descending = default_sort
+        if sort_col is not None and sort_col not in self.get_page_columns(source):
+            raise ValueError(f"עמודה לא מוכרת למיון: {sort_col}")
+
+        conditions, params = self._page_conditions(source, filters, search)
+        if after_key is not None:
+            condition, key_params = self._keyset_condition(sort_col, descending, key_cols, after_key)
+            conditions.append(condition)
+            params.extend(key_params)
+
+        order = [f'"{k}"' for k in key_cols]
+        if sort_col is not None:
+            order.insert(0, f'"{sort_col}" {"DESC" if descending else "ASC"}')
+
+        query = f"SELECT * FROM ({base_query})"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += f" ORDER BY {', '.join(order)} LIMIT ?"
+        # שורה אחת נוספת כדי לדעת אם יש עמוד הבא
+        params.append(int(page_size) + 1)
+
+        df = self._read_frame(query, params=params)
+        next_key = None
+        if len(df) > page_size:
+            df = df.iloc[:page_size]
+            last = df.iloc[-1]
+            next_key = tuple(
+                self._key_value(last[c]) for c in ([sort_col] if sort_col is not None else []) + list(key_cols)
+            )
+
+        df = df[[c for c in df.columns if not c.startswith('_')]].reset_index(drop=True)
+        return (self.apply_dtypes(df) if typed else df), next_key
+
+    def count_rows(self, source, filters=None, search=None):
+        """מספר השורות במקור לאחר סינון (COUNT ב-SQLite, בלי לטעון שורות)"""
+        if source not in self.PAGED_SOURCES:
+            raise ValueError(f"מקור לא מוכר: {source}")
+        conditions, params = self._page_conditions(source, filters, search)
+        query = f"SELECT COUNT(*) AS n FROM ({self.PAGED_SOURCES[source][0]})"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        return int(self._read_frame(query, params=params or None)['n'].iloc[0])
 
-    def get_all_vehicles(self):
+    @staticmethod
+    def _keyset_condition(sort_col, descending, key_cols, after_key):
+        """
+        תנאי "אחרי המפתח" עבור ORDER BY sort_col [DESC], key_cols.
+        SQLite ממיין NULL ראשון בסדר עולה ואחרון בסדר יורד - התנאי מכסה את שני המקרים.
+        """
+        keys = ", ".join(f'"{k}"' for k in key_cols)
+        tie = f"({keys}) > ({', '.join('?' * len(key_cols))})"
+        if sort_col is None:
+            return tie, list(after_key)
+
+        value, key_values = after_key[0], list(after_key[1:])
+        col = f'"{sort_col}"'
+        if value is None:
+            condition = f"({col} IS NULL AND {tie})"
+            if not descending:
+                condition += f" OR {col} IS NOT NULL"
+            return f"({condition})", key_values
+
+        condition = f"{col} {'<' if descending else '>'} ? OR ({col} = ? AND {tie})"
+        if descending:
+            condition += f" OR {col} IS NULL"
+        return f"({condition})", [value, value] + key_values
+
+    @staticmethod
+    def _key_value(value):
+        """ממיר ערך מ-pandas לערך שניתן להעביר כפרמטר ל-SQLite (numpy -> python, NaN -> None)"""
+        if pd.isna(value):
+            return None
+        return value.item() if isinstance(value, np.generic) else value
+
+    def page_full_view(self, sort_col=None, after_key=None, page_size=25, filters=None,
+                       descending=False, search=None, typed=False):
+        """
+        עמוד אחד מה-Join המלא (ראה page_rows). ברירת מחדל: מהחדש לישן, כמו get_full_view.
+        """
+        return self.page_rows('full_view', sort_col=sort_col, descending=descending, after_key=after_key,
+                              page_size=page_size, filters=filters, search=search, typed=typed)
+
+    def count_full_view(self, filters=None, search=None):
+        """מספר השורות ב-Join המלא לאחר סינון"""
+        return self.count_rows('full_view', filters=filters, search=search)
+
+    def page_invoices(self, sort_col=None, after_key=None, page_size=25, filters=None,
+                      descending=False, search=None, typed=False):
+        """עמוד אחד מטבלת החשבוניות (ראה page_rows)"""
+        return self.page_rows('invoices', sort_col=sort_col, descending=descending, after_key=after_key,
+                              page_size=page_size, filters=filters, search=search, typed=typed)
+
+    def count_invoices(self, filters=None, search=None):
+        """מספר החשבוניות לאחר סינון"""
+        return self.count_rows('invoices', filters=filters, search=search)
+
+    def get_vehicle_history(self, vehicle_id, typed=False, include_archive=False):
+        """שולף היסטוריה ספציפית לרכב; include_archive - כולל חשבוניות מהארכיון השנתי"""
+        table = 'invoices_all' if include_archive else 'invoices'
+        query = f"SELECT * FROM {table} WHERE vehicle_id = ? ORDER BY date DESC"
+        return self._read_frame(query, params=(vehicle_id,), typed=typed, archive=include_archive)
+
+    def get_all_vehicles(self, typed=False):
         """שולף את כל הרכבים בצי"""
-        conn = self.get_connection()
-        query = "SELECT * FROM vehicles"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-        return df
+        return self._read_frame("SELECT * FROM vehicles", typed=typed)
 
     def get_vehicle_info(self, vehicle_id):
         """שולף מידע על רכב ספציפי"""
-        conn = self.get_connection()
-        query = f"SELECT * FROM vehicles WHERE vehicle_id = '{vehicle_id}'"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-        return df
+        query = "SELECT * FROM vehicles WHERE vehicle_id = ?"
+        return self._read_frame(query, params=(vehicle_id,))
 
-    def get_vehicle_with_stats(self):
+    def get_vehicle_with_stats(self, typed=False):
         """
         שולף מידע על כל רכב עם סטטיסטיקות מעודכנות:
         - קילומטרז' נוכחי (מהחשבונית האחרונה)
@@ -97,32 +641,18 @@ class DatabaseManager:
         - סה"כ הוצאות
         - מספר טיפולים
         """
-        conn = self.get_connection()
-        query = """
-        SELECT
-            v.*,
-            MAX(i.date) as last_service_date,
-            MAX(i.odometer_km) as current_km,
-            COUNT(i.invoice_no) as total_services,
-            SUM(i.total) as total_cost,
-            AVG(i.total) as avg_service_cost
-        FROM vehicles v
-        LEFT JOIN invoices i ON v.vehicle_id = i.vehicle_id
-        GROUP BY v.vehicle_id
-        ORDER BY v.vehicle_id
-        """
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-        return df
+        return self._read_vehicle_stats("v.*", typed=typed)
     
     # ===== CRUD Operations =====
     
-    def add_invoice(self, invoice_data, invoice_lines_data):
-        """מוסיף חשבונית חדשה למסד הנתונים"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
+    def add_invoice(self, invoice_data, invoice_lines_data, wait=True):
+        """
+        מוסיף חשבונית חדשה למסד הנתונים
+
+        Args:
+            wait: False = החזרת Future במקום המתנה ל-commit (במצב תור כתיבה)
+        """
+        def work(cursor):
             cursor.execute("""
                 INSERT INTO invoices (
                     invoice_no, date, workshop, vehicle_id, plate, make_model,
@@ -157,18 +687,178 @@ class DatabaseManager:
                     line.get('unit_price'),
                     line.get('line_total')
                 ))
-            
-            conn.commit()
             return True
+
+        return self._write(work, "שגיאה בהוספת חשבונית", wait=wait)
+    
+    # עמודות וברירות מחדל - זהות ל-add_invoice
+    INVOICE_COLUMNS = [
+        'invoice_no', 'date', 'workshop', 'vehicle_id', 'plate', 'make_model',
+        'odometer_km', 'kind', 'subtotal', 'vat', 'total', 'pdf_file'
+    ]
+    INVOICE_DEFAULTS = {'kind': 'routine', 'subtotal': 0, 'vat': 0, 'total': 0, 'pdf_file': ''}
+    LINE_COLUMNS = ['invoice_no', 'line_no', 'description', 'type', 'qty', 'unit_price', 'line_total']
+
+    def bulk_add_invoices(self, invoices, lines=None, on_conflict='ignore', batch_size=5000):
+        """
+        טעינה מרוכזת של חשבוניות ושורות פירוט בטרנזקציה אחת (executemany).
+
+        Args:
+            invoices: DataFrame / pyarrow.Table / list of dicts עם עמודות invoices
+            lines: DataFrame / pyarrow.Table / list of dicts עם עמודות invoice_lines (אופציונלי)
+            on_conflict: מה לעשות עם invoice_no שכבר קיים במסד:
+                - 'ignore': דילוג על החשבונית והשורות שלה
+                - 'upsert': עדכון החשבונית והחלפת שורות הפירוט שלה (אם סופקו)
+            batch_size: מספר שורות לכל קריאת executemany
+
+        Returns:
+            dict: {
+                'inserted': int, 'updated': int, 'skipped': int, 'failed': int,
+                'lines_inserted': int,
+                'conflicts': [{'row': int, 'invoice_no': str, 'action': str, 'reason': str}]
+            }
+        """
+        if on_conflict not in ('ignore', 'upsert'):
+            raise ValueError(f"on_conflict חייב להיות 'ignore' או 'upsert', התקבל: {on_conflict}")
+        batch_size = max(1, int(batch_size))
+
+        invoices_df = self._to_dataframe(invoices)
+        lines_df = self._to_dataframe(lines) if lines is not None else pd.DataFrame(columns=self.LINE_COLUMNS)
+
+        invoice_rows = self._prepare_rows(invoices_df, self.INVOICE_COLUMNS, self.INVOICE_DEFAULTS)
+        line_rows = self._prepare_rows(lines_df, self.LINE_COLUMNS, {})
+
+        result = {'inserted': 0, 'updated': 0, 'skipped': 0, 'failed': 0, 'lines_inserted': 0, 'conflicts': []}
+
+        def conflict(row, invoice_no, action, reason):
+            result['conflicts'].append({'row': row, 'invoice_no': invoice_no, 'action': action, 'reason': reason})
+
+        conn = self.get_write_connection()
+        cursor = conn.cursor()
+
+        try:
+            existing = self._existing_keys(cursor, 'invoices', 'invoice_no', [r[0] for _, r in invoice_rows])
+
+            # סיווג שורות: חדשות / קיימות / כפולות בקובץ / חסרות מפתח
+            new_rows, update_rows, seen = [], [], set()
+            for idx, values in invoice_rows:
+                invoice_no = values[0]
+                if invoice_no is None:
+                    result['failed'] += 1
+                    conflict(idx, None, 'failed', 'missing invoice_no')
+                elif invoice_no in seen:
+                    result['skipped'] += 1
+                    conflict(idx, invoice_no, 'skipped', 'duplicate invoice_no in batch')
+                elif invoice_no in existing:
+                    seen.add(invoice_no)
+                    if on_conflict == 'upsert':
+                        update_rows.append(values)
+                        conflict(idx, invoice_no, 'updated', 'invoice_no already exists')
+                    else:
+                        result['skipped'] += 1
+                        conflict(idx, invoice_no, 'skipped', 'invoice_no already exists')
+                else:
+                    seen.add(invoice_no)
+                    new_rows.append(values)
+
+            written = {values[0] for values in new_rows} | {values[0] for values in update_rows}
+            replaced = {values[0] for values in update_rows}
+
+            accepted_lines = []
+            for idx, values in line_rows:
+                if values[0] in written:
+                    accepted_lines.append(values)
+                elif values[0] not in seen:
+                    conflict(idx, values[0], 'skipped', 'line without matching invoice in batch')
+
+            columns = ', '.join(self.INVOICE_COLUMNS)
+            placeholders = ', '.join('?' * len(self.INVOICE_COLUMNS))
+            insert_sql = f"INSERT INTO invoices ({columns}) VALUES ({placeholders})"
+            # ON CONFLICT DO UPDATE (ולא INSERT OR REPLACE) כדי שטריגרי vehicle_stats יופעלו כ-UPDATE
+            upsert_sql = insert_sql + " ON CONFLICT(invoice_no) DO UPDATE SET " + ', '.join(
+                f"{col} = excluded.{col}" for col in self.INVOICE_COLUMNS[1:]
+            )
+            line_sql = f"INSERT INTO invoice_lines ({', '.join(self.LINE_COLUMNS)}) VALUES ({', '.join('?' * len(self.LINE_COLUMNS))})"
+
+            cursor.execute("BEGIN")
+
+            # אינדקס החיפוש נבנה פעם אחת לכל חשבונית בסוף הטעינה, לא בטריגר לכל שורה
+            updater = DatabaseSchemaUpdater(self.db_path)
+            search_deferred = updater.defer_invoice_search(cursor)
+
+            for start in range(0, len(new_rows), batch_size):
+                cursor.executemany(insert_sql, new_rows[start:start + batch_size])
+
+            replaced_lines = {values[0] for values in accepted_lines} & replaced
+            replaced_list = [(invoice_no,) for invoice_no in replaced_lines]
+            for start in range(0, len(replaced_list), batch_size):
+                cursor.executemany("DELETE FROM invoice_lines WHERE invoice_no = ?", replaced_list[start:start + batch_size])
+
+            for start in range(0, len(update_rows), batch_size):
+                cursor.executemany(upsert_sql, update_rows[start:start + batch_size])
+
+            for start in range(0, len(accepted_lines), batch_size):
+                cursor.executemany(line_sql, accepted_lines[start:start + batch_size])
+
+            if search_deferred:
+                updater.refresh_invoice_search(cursor, written)
+
+            conn.commit()
+
+            result['inserted'] = len(new_rows)
+            result['updated'] = len(update_rows)
+            result['lines_inserted'] = len(accepted_lines)
+            return result
         except Exception as e:
             conn.rollback()
-            raise Exception(f"שגיאה בהוספת חשבונית: {str(e)}")
+            raise Exception(f"שגיאה בטעינת חשבוניות: {str(e)}")
         finally:
             conn.close()
-    
+
+    @staticmethod
+    def _to_dataframe(data):
+        """ממיר DataFrame / pyarrow.Table / list of dicts ל-DataFrame"""
+        if isinstance(data, pd.DataFrame):
+            return data
+        if hasattr(data, 'to_pandas'):  # pyarrow.Table / RecordBatch
+            return data.to_pandas()
+        return pd.DataFrame(data)
+
+    @staticmethod
+    def _prepare_rows(df, columns, defaults):
+        """
+        הופך DataFrame לרשימת (אינדקס שורה, tuple ערכים) לפי סדר העמודות.
+        תאריכים (datetime64) מומרים ל-YYYY-MM-DD, NaN ל-None, ועמודות חסרות מקבלות ברירת מחדל.
+        """
+        df = df.copy()
+        for col in columns:
+            if col not in df.columns:
+                df[col] = defaults.get(col)
+            elif pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = df[col].dt.strftime('%Y-%m-%d')
+        df = df[columns].astype(object)
+        df = df.where(pd.notna(df), None)
+        for col, default in defaults.items():
+            df[col] = df[col].where(df[col].notna(), default)
+        return list(zip(df.index, df.itertuples(index=False, name=None)))
+
+    @staticmethod
+    def _existing_keys(cursor, table, key_column, keys, chunk_size=500):
+        """מחזיר את תת-הקבוצה של המפתחות שכבר קיימים בטבלה (שאילתות IN במנות)"""
+        keys = list({k for k in keys if k is not None})
+        existing = set()
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            cursor.execute(
+                f"SELECT {key_column} FROM {table} WHERE {key_column} IN ({', '.join('?' * len(chunk))})",
+                chunk
+            )
+            existing.update(row[0] for row in cursor.fetchall())
+        return existing
+
     def delete_invoice(self, invoice_no):
         """מוחק חשבונית מהמסד נתונים"""
-        conn = self.get_connection()
+        conn = self.get_write_connection()
         cursor = conn.cursor()
         
         try:
@@ -188,7 +878,7 @@ class DatabaseManager:
         if update_date is None:
             update_date = datetime.now().strftime("%Y-%m-%d")
         
-        conn = self.get_connection()
+        conn = self.get_write_connection()
         cursor = conn.cursor()
         
         try:
@@ -205,15 +895,11 @@ class DatabaseManager:
     
     def get_invoice_by_no(self, invoice_no):
         """שולף חשבונית ספציפית לפי מספר"""
-        conn = self.get_connection()
         query = "SELECT * FROM invoices WHERE invoice_no = ?"
-        df = pd.read_sql_query(query, conn, params=(invoice_no,))
-        conn.close()
-        return df
+        return self._read_frame(query, params=(invoice_no,))
     
-    def search_invoices(self, vehicle_id=None, workshop=None, date_from=None, date_to=None):
+    def search_invoices(self, vehicle_id=None, workshop=None, date_from=None, date_to=None, typed=False):
         """חיפוש חשבוניות לפי קריטריונים"""
-        conn = self.get_connection()
         conditions = []
         params = []
 
@@ -232,9 +918,264 @@ class DatabaseManager:
 
         where_clause = " AND ".join(conditions) if conditions else "1=1"
         query = f"SELECT * FROM invoices WHERE {where_clause} ORDER BY date DESC"
-        df = pd.read_sql_query(query, conn, params=params if params else None)
-        conn.close()
-        return df
+        return self._read_frame(query, params=params if params else None, typed=typed)
+
+    def get_invoices_for_vehicles(self, vehicle_ids, typed=False, chunk_size=500):
+        """
+        חשבוניות של קבוצת רכבים (IN על האינדקס של vehicle_id, במנות של chunk_size),
+        בסדר הטבלה כמו get_all_invoices - בלי לטעון את כל החשבוניות.
+        לא נשמר במטמון: כל קבוצת רכבים היא מפתח אחר.
+        """
+        self.ensure_schema()
+        vehicle_ids = list(dict.fromkeys(vehicle_ids))
+        frames = []
+        for start in range(0, len(vehicle_ids), chunk_size):
+            chunk = vehicle_ids[start:start + chunk_size]
+            query = f"SELECT * FROM invoices WHERE vehicle_id IN ({', '.join('?' * len(chunk))}) ORDER BY rowid"
+            frames.append(self._query_frame(query, params=chunk, typed=typed))
+        if not frames:
+            return self._read_frame("SELECT * FROM invoices LIMIT 0", typed=typed)
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    # ===== Date Math (epoch-day) =====
+
+    @staticmethod
+    def epoch_day(value):
+        """
+        ממיר תאריך (date / datetime / 'YYYY-MM-DD' / Timestamp) למספר ימים מ-1970-01-01,
+        אותו ערך שבעמודות ה-_*_day. None / ערך לא תקין -> None.
+        """
+        if value is None or (not isinstance(value, str) and pd.isna(value)):
+            return None
+        if isinstance(value, datetime):
+            value = value.date()
+        elif not isinstance(value, date):
+            try:
+                value = datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+            except ValueError:
+                return None
+        return (value - EPOCH).days
+
+    def get_invoices_between(self, start=None, end=None, vehicle_id=None, typed=False):
+        """
+        חשבוניות בטווח תאריכים [start, end) - סינון על _date_day באינדקס
+        (השוואת שלמים, בלי תלות בפורמט מחרוזת התאריך).
+
+        Args:
+            start: תאריך התחלה כולל (None = ללא גבול)
+            end: תאריך סיום לא כולל (None = ללא גבול)
+            vehicle_id: סינון לרכב (אופציונלי)
+        """
+        conditions = []
+        params = []
+        for value, condition in ((start, "_date_day >= ?"), (end, "_date_day < ?")):
+            if value is None:
+                continue
+            day = self.epoch_day(value)
+            if day is None:
+                raise ValueError(f"תאריך לא תקין: {value}")
+            conditions.append(condition)
+            params.append(day)
+        if vehicle_id:
+            conditions.append("vehicle_id = ?")
+            params.append(vehicle_id)
+
+        where_clause = " AND ".join(conditions) if conditions else "1=1"
+        query = f"SELECT * FROM invoices WHERE {where_clause} ORDER BY _date_day, invoice_no"
+        return self._read_frame(query, params=params or None, typed=typed)
+
+    def get_vehicle_day_metrics(self, as_of=None):
+        """
+        הפרשי ימים לכל רכב, מחושבים ב-SQL מעמודות ה-_*_day (NULL כשהתאריך חסר / לא תקין):
+        days_in_fleet, days_since_last_test, days_until_next_test, days_until_retirement,
+        days_since_last_service (כולל חשבוניות שהועברו לארכיון).
+
+        Args:
+            as_of: תאריך הייחוס (ברירת מחדל: היום)
+        """
+        today = self.epoch_day(as_of if as_of is not None else date.today())
+        if today is None:
+            raise ValueError(f"תאריך לא תקין: {as_of}")
+
+        query = """
+        SELECT
+            v.vehicle_id,
+            ? - v._purchase_day as days_in_fleet,
+            ? - v._last_test_day as days_since_last_test,
+            v._next_test_day - ? as days_until_next_test,
+            v._retirement_day - ? as days_until_retirement,
+            ? - COALESCE(
+                (SELECT MAX(i._date_day) FROM invoices i WHERE i.vehicle_id = v.vehicle_id),
+                CAST(julianday(a.last_service_date) - 2440587.5 AS INTEGER)
+            ) as days_since_last_service
+        FROM vehicles v
+        LEFT JOIN vehicle_archive_stats a ON v.vehicle_id = a.vehicle_id
+        ORDER BY v.vehicle_id
+        """
+        return self._read_frame(query, params=(today,) * 5)
+
+    def get_service_test_timing(self, kind='routine'):
+        """
+        עיתוי כל טיפול ביחס לטסטים של הרכב, בימים (חשבון שלמים ב-SQL):
+        days_after_last_test = date - last_test_date, days_before_next_test = next_test_date - date.
+        רק רכבים עם שני תאריכי טסט תקינים וחשבוניות עם תאריך תקין.
+
+        Args:
+            kind: סוג הטיפול (None = כל הסוגים)
+        """
+        conditions = ["v._last_test_day IS NOT NULL", "v._next_test_day IS NOT NULL",
+                      "i._date_day IS NOT NULL"]
+        params = []
+        if kind is not None:
+            conditions.append("i.kind = ?")
+            params.append(kind)
+
+        query = f"""
+        SELECT
+            i.vehicle_id,
+            i.invoice_no,
+            i.date,
+            i.total,
+            i._date_day - v._last_test_day as days_after_last_test,
+            v._next_test_day - i._date_day as days_before_next_test
+        FROM invoices i
+        JOIN vehicles v ON v.vehicle_id = i.vehicle_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY i.vehicle_id, i._date_day, i.invoice_no
+        """
+        return self._read_frame(query, params=params or None)
+
+    def get_service_timeline(self, vehicle_id=None, latest_only=False, typed=False):
+        """
+        ציר הזמן של הטיפולים (view service_timeline): לכל חשבונית הטיפול הקודם של הרכב
+        (prev_date, prev_odometer_km), המרווח בק"מ ובימים (km_delta, days_delta) והדגל is_latest.
+        לרכב אחד - חיפוש באינדקס על החשבוניות שלו בלבד.
+
+        Args:
+            vehicle_id: רכב ספציפי (None = כל הצי)
+            latest_only: רק הטיפול האחרון של כל רכב
+        """
+        conditions = []
+        params = []
+        if vehicle_id:
+            conditions.append("vehicle_id = ?")
+            params.append(vehicle_id)
+        if latest_only:
+            conditions.append("is_latest")
+
+        where_sql = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"SELECT * FROM service_timeline{where_sql} ORDER BY vehicle_id, service_number"
+        return self._read_frame(query, params=params or None, typed=typed)
+
+    def get_service_intervals(self, vehicle_id=None):
+        """
+        סיכום מרווחי הטיפולים של כל רכב מתוך service_timeline.
+        מרווח שבו המונה ירד (km_delta שלילי - קריאה שגויה) לא נספר.
+
+        Args:
+            vehicle_id: רכב ספציפי (None = כל הצי)
+
+        Returns:
+            DataFrame: vehicle_id, intervals, avg_km_interval, min_km_interval, max_km_interval,
+                       interval_km (סה"כ ק"מ במרווחים), interval_days (סה"כ ימים באותם מרווחים)
+        """
+        vehicle_sql = " AND vehicle_id = ?" if vehicle_id else ""
+        query = f"""
+        SELECT
+            vehicle_id,
+            COUNT(*) as intervals,
+            AVG(km_delta) as avg_km_interval,
+            MIN(km_delta) as min_km_interval,
+            MAX(km_delta) as max_km_interval,
+            SUM(km_delta) as interval_km,
+            SUM(days_delta) as interval_days
+        FROM service_timeline
+        WHERE km_delta >= 0{vehicle_sql}
+        GROUP BY vehicle_id
+        ORDER BY vehicle_id
+        """
+        return self._read_frame(query, params=(vehicle_id,) if vehicle_id else None)
+
+    # ===== Full-Text Search =====
+
+    # שדות החיפוש באינדקס invoice_search (ראה DatabaseSchemaUpdater._migration_003_invoice_search)
+    TEXT_SEARCH_COLUMNS = ['invoice_no', 'vehicle_id', 'workshop', 'plate', 'make_model', 'descriptions']
+
+    def has_search_index(self):
+        """האם אינדקס ה-FTS5 invoice_search קיים בדאטה בייס (תשובה חיובית נשמרת במופע)"""
+        if not getattr(self, '_has_search_index', False):
+            query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'invoice_search'"
+            self._has_search_index = not self._read_frame(query).empty
+        return self._has_search_index
+
+    def search_text(self, query, limit=100):
+        """
+        חיפוש טקסט חופשי בחשבוניות: תיאורי שורות פירוט, מוסך, לוחית רישוי, דגם, מספר חשבונית ורכב.
+
+        כל מילה בחיפוש חייבת להופיע כתת-מחרוזת (AND בין מילים), ללא תלות ברישיות,
+        כך שבעברית גם מילים עם אותיות שימוש מחוברות ("השמן", "ובלמים") נמצאות.
+
+        Args:
+            query: טקסט החיפוש
+            limit: מספר תוצאות מקסימלי (None = ללא הגבלה)
+
+        Returns:
+            list: מספרי חשבוניות תואמים, הרלוונטיים ביותר (bm25) ראשונים
+        """
+        if not query or not query.strip():
+            return []
+        sql, params, ranked = self._text_search_sql(query)
+        if ranked:
+            sql += " ORDER BY rank"
+        sql, params = self._paginate(sql, params, limit)
+        return self._read_frame(sql, params=params)['invoice_no'].tolist()
+
+    def _text_search_sql(self, query):
+        """
+        בונה SELECT invoice_no לחיפוש טקסט חופשי.
+        מילים של 3 תווים ומעלה - MATCH על אינדקס ה-trigram; מילים קצרות יותר - LIKE.
+        ללא אינדקס FTS (SQLite ישן) - LIKE על invoices / invoice_lines.
+
+        Returns:
+            (sql, params, ranked) - ranked=True אם ניתן למיין לפי rank של FTS5
+        """
+        terms = query.split()
+
+        if not self.has_search_index():
+            conditions, params = [], []
+            for term in terms:
+                pattern = self._like_pattern(term)
+                conditions.append(
+                    "(" + " OR ".join(f"i.{c} LIKE ? ESCAPE '\\'" for c in self.TEXT_SEARCH_COLUMNS[:-1])
+                    + " OR EXISTS (SELECT 1 FROM invoice_lines l WHERE l.invoice_no = i.invoice_no"
+                    " AND l.description LIKE ? ESCAPE '\\'))"
+                )
+                params.extend([pattern] * len(self.TEXT_SEARCH_COLUMNS))
+            return "SELECT i.invoice_no FROM invoices i WHERE " + " AND ".join(conditions), params, False
+
+        conditions, params = [], []
+        fts_terms = [t for t in terms if len(t) >= 3]
+        if fts_terms:
+            conditions.append("invoice_search MATCH ?")
+            params.append(" AND ".join('"' + t.replace('"', '""') + '"' for t in fts_terms))
+        for term in terms:
+            if len(term) < 3:
+                # trigram לא מאנדקס מחרוזות קצרות מ-3 תווים
+                conditions.append(
+                    "(" + " OR ".join(f"{c} LIKE ? ESCAPE '\\'" for c in self.TEXT_SEARCH_COLUMNS) + ")"
+                )
+                params.extend([self._like_pattern(term)] * len(self.TEXT_SEARCH_COLUMNS))
+        return "SELECT invoice_no FROM invoice_search WHERE " + " AND ".join(conditions), params, bool(fts_terms)
+
+    def rebuild_search_index(self):
+        """
+        בונה מחדש את אינדקס החיפוש invoice_search.
+
+        Returns:
+            int: מספר החשבוניות באינדקס
+        """
+        self.ensure_schema()
+        return DatabaseSchemaUpdater(self.db_path).rebuild_invoice_search()
 
     # ===== Fleet Management Functions =====
 
@@ -258,7 +1199,7 @@ class DatabaseManager:
         Returns:
             bool: True אם הצליח
         """
-        conn = self.get_connection()
+        conn = self.get_write_connection()
         cursor = conn.cursor()
 
         try:
@@ -300,49 +1241,75 @@ class DatabaseManager:
         Returns:
             dict: {'success': int, 'failed': int, 'errors': list}
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        success_count = 0
-        failed_count = 0
-        errors = []
+        vehicles_df = self._to_dataframe(vehicles_df)
+
+        insert_sql = """
+            INSERT INTO vehicles (
+                vehicle_id, plate, make_model, year, initial_km,
+                purchase_date, assigned_to, last_test_date, next_test_date,
+                estimated_retirement_date, status
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """
 
-        for idx, row in vehicles_df.iterrows():
+        rows = []
+        for idx, row in zip(vehicles_df.index, vehicles_df.to_dict('records')):
+            rows.append((idx, (
+                row.get('vehicle_id'),
+                row.get('plate'),
+                row.get('make_model'),
+                row.get('year'),
+                row.get('initial_km', 0),
+                row.get('purchase_date'),
+                row.get('assigned_to', ''),
+                row.get('last_test_date', ''),
+                row.get('next_test_date', ''),
+                row.get('estimated_retirement_date', ''),
+                row.get('status', 'active')
+            )))
+
+        def work(cursor):
+            success_count = 0
+            failed_count = 0
+            errors = []
+
+            # זיהוי מוקדם של vehicle_id כפולים (בקובץ עצמו או קיימים בצי)
+            existing_ids = self._existing_keys(cursor, 'vehicles', 'vehicle_id', [values[0] for _, values in rows])
+            clean_rows = []
+            for idx, values in rows:
+                if values[0] in existing_ids:
+                    failed_count += 1
+                    errors.append(f"שורה {idx + 2}: UNIQUE constraint failed: vehicles.vehicle_id")
+                else:
+                    existing_ids.add(values[0])
+                    clean_rows.append((idx, values))
+
+            # מסלול מהיר: executemany אחד; SAVEPOINT כדי לבטל רק אותו אם הוא נכשל באמצע
+            cursor.execute("SAVEPOINT bulk_vehicles")
             try:
-                cursor.execute("""
-                    INSERT INTO vehicles (
-                        vehicle_id, plate, make_model, year, initial_km,
-                        purchase_date, assigned_to, last_test_date, next_test_date,
-                        estimated_retirement_date, status
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    row.get('vehicle_id'),
-                    row.get('plate'),
-                    row.get('make_model'),
-                    row.get('year'),
-                    row.get('initial_km', 0),
-                    row.get('purchase_date'),
-                    row.get('assigned_to', ''),
-                    row.get('last_test_date', ''),
-                    row.get('next_test_date', ''),
-                    row.get('estimated_retirement_date', ''),
-                    row.get('status', 'active')
-                ))
-                success_count += 1
-            except Exception as e:
-                failed_count += 1
-                errors.append(f"שורה {idx + 2}: {str(e)}")
-
-        conn.commit()
-        conn.close()
-
-        return {
-            'success': success_count,
-            'failed': failed_count,
-            'errors': errors
-        }
-
-    def get_fleet_overview(self):
+                cursor.executemany(insert_sql, [values for _, values in clean_rows])
+                cursor.execute("RELEASE SAVEPOINT bulk_vehicles")
+                success_count += len(clean_rows)
+            except sqlite3.Error:
+                # שגיאה אחרת - חזרה להכנסה שורה-שורה כדי לדווח על השורה הבעייתית
+                cursor.execute("ROLLBACK TO SAVEPOINT bulk_vehicles")
+                cursor.execute("RELEASE SAVEPOINT bulk_vehicles")
+                for idx, values in clean_rows:
+                    try:
+                        cursor.execute(insert_sql, values)
+                        success_count += 1
+                    except Exception as e:
+                        failed_count += 1
+                        errors.append(f"שורה {idx + 2}: {str(e)}")
+
+            return {
+                'success': success_count,
+                'failed': failed_count,
+                'errors': errors
+            }
+
+        return self._write(work, "שגיאה בהוספת רכבים")
+
+    def get_fleet_overview(self, typed=False):
         """
         שולף תצוגה מלאה של כל הצי עם כל הנתונים:
         - פרטי רכב
@@ -351,9 +1318,7 @@ class DatabaseManager:
         - תאריך גריטה משוער
         - סטטוס
         """
-        conn = self.get_connection()
-        query = """
-        SELECT
+        return self._read_vehicle_stats("""
             v.vehicle_id,
             v.plate,
             v.make_model,
@@ -364,7 +1329,40 @@ class DatabaseManager:
             v.last_test_date,
             v.next_test_date,
             v.estimated_retirement_date,
-            v.status,
+            v.status""", typed=typed)
+
+    # הסטטיסטיקות של רכב (v) מ-vehicle_stats (s) ומהסיכום של הארכיון (a) - ראה _read_vehicle_stats
+    VEHICLE_STATS_COLUMNS = """
+            MAX(COALESCE(s.last_service_date, a.last_service_date),
+                COALESCE(a.last_service_date, s.last_service_date)) as last_service_date,
+            MAX(COALESCE(s.current_km, a.current_km),
+                COALESCE(a.current_km, s.current_km)) as current_km,
+            COALESCE(s.total_services, 0) + COALESCE(a.total_services, 0) as total_services,
+            CASE WHEN s.total_cost IS NULL AND a.total_cost IS NULL THEN NULL
+                 ELSE COALESCE(s.total_cost, 0) + COALESCE(a.total_cost, 0) END as total_cost,
+            (COALESCE(s.total_cost, 0) + COALESCE(a.total_cost, 0))
+                / NULLIF(COALESCE(s.cost_count, 0) + COALESCE(a.cost_count, 0), 0) as avg_service_cost"""
+    VEHICLE_STATS_JOINS = """
+        LEFT JOIN vehicle_stats s ON v.vehicle_id = s.vehicle_id
+        LEFT JOIN vehicle_archive_stats a ON v.vehicle_id = a.vehicle_id"""
+
+    def _read_vehicle_stats(self, vehicle_columns, typed=False):
+        """
+        מצרף לעמודות הרכב את הסטטיסטיקות מטבלת הסיכום vehicle_stats
+        (מתוחזקת ע"י טריגרים) - O(vehicles) במקום אגרגציה על כל החשבוניות.
+        הסיכום של חשבוניות שהועברו לארכיון (vehicle_archive_stats) מצורף, כך שהסטטיסטיקות
+        מכסות את כל ההיסטוריה.
+        אם הטבלאות לא קיימות (מיגרציה לא הוחלה) - חוזר לאגרגציה הישירה.
+        """
+        query = f"""
+        SELECT
+            {vehicle_columns},{self.VEHICLE_STATS_COLUMNS}
+        FROM vehicles v{self.VEHICLE_STATS_JOINS}
+        ORDER BY v.vehicle_id
+        """
+        fallback_query = f"""
+        SELECT
+            {vehicle_columns},
             MAX(i.date) as last_service_date,
             MAX(i.odometer_km) as current_km,
             COUNT(i.invoice_no) as total_services,
@@ -375,16 +1373,313 @@ class DatabaseManager:
         GROUP BY v.vehicle_id
         ORDER BY v.vehicle_id
         """
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-        return df
+        try:
+            return self._read_frame(query, typed=typed)
+        except pd.errors.DatabaseError:
+            return self._read_frame(fallback_query, typed=typed)
+
+    def rebuild_vehicle_stats(self):
+        """
+        בונה מחדש את טבלת הסיכום vehicle_stats מתוך invoices.
+
+        Returns:
+            int: מספר הרכבים בטבלת הסיכום
+        """
+        self.ensure_schema()
+        return DatabaseSchemaUpdater(self.db_path).rebuild_vehicle_stats()
+
+    # ===== Yearly Archive =====
+
+    def archive_invoices(self, before=None, keep_months=None):
+        """
+        מעביר חשבוניות ישנות (ושורות הפירוט שלהן) לקבצי ארכיון שנתיים (ראה src/invoice_archive.py).
+        אחרי ההעברה שאילתות ברירת המחדל רואות רק את המחיצה החמה; include_archive=True
+        ב-get_all_invoices / get_invoice_lines / get_full_view / get_vehicle_history מחזיר הכל.
+
+        Args:
+            before: תאריך חיתוך - חשבוניות עם date < before עוברות לארכיון
+            keep_months: לחלופין - מספר החודשים האחרונים שנשארים בדאטה בייס החם
+
+        Returns:
+            dict: {שנה: מספר החשבוניות שהועברו}
+        """
+        if (before is None) == (keep_months is None):
+            raise ValueError("יש לציין before או keep_months (אחד מהם)")
+        if keep_months is not None:
+            before = (pd.Timestamp.today().normalize() - pd.DateOffset(months=int(keep_months))).strftime('%Y-%m-%d')
+
+        self.ensure_schema()
+        try:
+            return InvoiceArchive(self.db_path).archive_before(before)
+        except ValueError:
+            raise
+        except Exception as e:
+            raise Exception(f"שגיאה בהעברת חשבוניות לארכיון: {str(e)}")
+
+    def get_archive_partitions(self):
+        """מחיצות הארכיון: שנה, קובץ, מספר חשבוניות ומועד ההעברה האחרון"""
+        self.ensure_schema()
+        return self._read_frame("SELECT year, path, invoices, archived_at FROM archive_partitions ORDER BY year")
+
+    # ===== Change Feed =====
+
+    def get_change_version(self):
+        """
+        הגרסה האחרונה ב-change_log (0 אם היומן ריק).
+        צרכן שמתחיל לעקוב שומר אותה אחרי טעינה מלאה ומעביר אותה ל-get_changes_since.
+        """
+        self.ensure_schema()
+        df = self._read_frame("SELECT COALESCE(MAX(version), 0) AS version FROM change_log")
+        return int(df['version'].iloc[0])
+
+    def get_changes_since(self, version, tables=None, limit=None):
+        """
+        השינויים ב-invoices / invoice_lines / vehicles / custom_alerts מאז גרסה מסוימת
+        (נכתבים ע"י טריגרים - ראה מיגרציה 004).
+
+        Args:
+            version: הגרסה האחרונה שהצרכן כבר עיבד (0 = הכל)
+            tables: רשימת טבלאות לסינון (None = כולן)
+            limit: מספר שינויים מקסימלי (להמשך - הגרסה האחרונה שהתקבלה)
+
+        Returns:
+            DataFrame עם version, table_name, row_key, vehicle_id, op, changed_at
+            ממוין לפי version. row_key הוא invoice_no / vehicle_id / alert_id
+            (לשורות invoice_lines - מספר החשבונית).
+
+        Raises:
+            ValueError: אם שינויים אחרי version כבר נמחקו ב-prune_change_log -
+                        הצרכן צריך טעינה מלאה
+        """
+        self.ensure_schema()
+        state = self._read_frame("SELECT pruned_through FROM change_log_state WHERE id = 1")
+        pruned_through = int(state['pruned_through'].iloc[0]) if not state.empty else 0
+        if int(version) < pruned_through:
+            raise ValueError(
+                f"גרסה {version} ישנה מדי - היומן נוקה עד גרסה {pruned_through}, נדרשת טעינה מלאה"
+            )
+
+        conditions, params = ["version > ?"], [int(version)]
+        if tables:
+            tables = list(tables)
+            conditions.append(f"table_name IN ({', '.join('?' * len(tables))})")
+            params.extend(tables)
+        query = (
+            "SELECT version, table_name, row_key, vehicle_id, op, changed_at FROM change_log "
+            f"WHERE {' AND '.join(conditions)} ORDER BY version"
+        )
+        query, params = self._paginate(query, params, limit)
+        return self._read_frame(query, params=params)
+
+    def prune_change_log(self, through_version):
+        """
+        מוחק מהיומן את השינויים עד גרסה מסוימת (כולל) - למשל הגרסה הנמוכה שכל הצרכנים עיבדו.
+
+        Returns:
+            int: מספר השורות שנמחקו
+        """
+        self.ensure_schema()
+        conn = self.get_write_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM change_log WHERE version <= ?", (int(through_version),))
+            deleted = cursor.rowcount
+            cursor.execute(
+                "UPDATE change_log_state SET pruned_through = MAX(pruned_through, ?) WHERE id = 1",
+                (int(through_version),)
+            )
+            conn.commit()
+            return deleted
+        except Exception as e:
+            conn.rollback()
+            raise Exception(f"שגיאה בניקוי יומן השינויים: {str(e)}")
+        finally:
+            conn.close()
+
+    # ===== Parquet Snapshots =====
+
+    # מקורות הצילומים: הטבלאות והתצוגות הנגזרות שהדשבורד טוען בהפעלה
+    SNAPSHOT_SOURCES = {
+        'vehicles': "SELECT * FROM vehicles",
+        'invoices': "SELECT * FROM invoices",
+        'invoice_lines': "SELECT * FROM invoice_lines",
+        'vehicle_stats': "SELECT * FROM vehicle_stats",
+        'full_view': FULL_VIEW_QUERY
+    }
+
+    def export_snapshots(self, names=None):
+        """
+        כותב צילומי Parquet עדכניים (ראה src/data_snapshot.py).
+
+        Args:
+            names: רשימת מקורות מתוך SNAPSHOT_SOURCES (ברירת מחדל: כולם)
+
+        Returns:
+            dict: {שם: מספר שורות} לכל צילום שנכתב
+        """
+        self.ensure_schema()
+        store = get_snapshot_store(self.db_path)
+        written = {}
+        for name in names or self.SNAPSHOT_SOURCES:
+            if name not in self.SNAPSHOT_SOURCES:
+                raise ValueError(f"מקור צילום לא מוכר: {name}")
+            version = store.data_version()
+            df = self._query_frame(self.SNAPSHOT_SOURCES[name])
+            if store.write(name, df, version):
+                written[name] = len(df)
+        return written
+
+    def load_snapshot(self, name, columns=None, typed=False, refresh=True):
+        """
+        טוען מקור מצילום ה-Parquet שלו (memory-mapped, רק העמודות שהתבקשו).
+        אם הצילום חסר או ישן לפי גרסת הנתונים - קורא מ-SQLite, ואם refresh=True
+        כותב צילום חדש להפעלה הבאה. התוצאה זהה ל-get_full_view() / get_all_invoices() וכו'.
+
+        Args:
+            name: מקור מתוך SNAPSHOT_SOURCES
+            columns: רשימת עמודות (None = כל העמודות)
+            typed: המרת טיפוסים (ראה apply_dtypes)
+            refresh: כתיבת צילום חדש כשהקיים ישן
+        """
+        if name not in self.SNAPSHOT_SOURCES:
+            raise ValueError(f"מקור צילום לא מוכר: {name}")
+
+        self.ensure_schema()
+        store = get_snapshot_store(self.db_path)
+        # הגרסה נקראת לפני השליפה - commit במהלכה יסמן את הצילום כישן
+        version = store.data_version()
+        df = store.read(name, version, columns=columns)
+        if df is None:
+            df = self._read_frame(self.SNAPSHOT_SOURCES[name])
+            if refresh:
+                try:
+                    store.write(name, df, version)
+                except Exception as e:
+                    print(f"⚠️ Warning: snapshot '{name}' was not written: {e}")
+            if columns is not None:
+                df = df[list(columns)]
+        return self.apply_dtypes(df) if typed else df
+
+    # ===== Analytics (DuckDB) =====
+
+    # עמודות מותרות לקיבוץ ב-get_invoice_cost_summary
+    COST_SUMMARY_GROUPS = {'workshop', 'vehicle_id', 'kind', 'make_model', 'plate'}
+
+    def _get_analytics(self):
+        """
+        המנוע האנליטי (DuckDB), שנוצר בקריאה הראשונה - כך שבניית DatabaseManager לא
+        פותחת חיבור DuckDB ולא מצרפת את הקובץ. None = השאילתות רצות על SQLite.
+        """
+        if self._analytics_pending:
+            self._analytics_pending = False
+            install = os.getenv('DB_ANALYTICS_INSTALL_EXTENSION', 'false').lower() == 'true'
+            self._analytics = get_analytics_engine(self.db_path, install_extension=install)
+            if self._analytics is None and self._analytics_setting == 'duckdb':
+                print("⚠️ Warning: duckdb is not installed - analytics queries run on SQLite.")
+        return self._analytics
+
+    def get_analytics_backend(self):
+        """המנוע שמריץ את analytics_query: 'duckdb-attach', 'duckdb-mirror' או 'sqlite'"""
+        analytics = self._get_analytics()
+        if analytics is None:
+            return 'sqlite'
+        return f"duckdb-{analytics.mode}"
+
+    def analytics_query(self, query, params=None):
+        """
+        מריץ שאילתת אגרגציה על המנוע העמודתי (DuckDB) ומחזיר DataFrame.
+        בלי duckdb (או DB_ANALYTICS_ENGINE=sqlite) השאילתה רצה על SQLite - לכן יש לכתוב
+        SQL שתקף בשני המנועים. התוצאה נשמרת במטמון השאילתות עד ה-commit הבא.
+
+        Args:
+            query: שאילתת SELECT על invoices / invoice_lines / vehicles / vehicle_stats
+            params: פרמטרים לסימני ? בשאילתה
+        """
+        analytics = self._get_analytics()
+        if analytics is None:
+            return self._read_frame(query, params=params)
+
+        self.ensure_schema()
+        get_query_profiler().note_sql(query, params)
+        if self._cache is None:
+            return analytics.query(query, params)
+
+        key = ('analytics', query, tuple(params) if params else ())
+        version = self._cache.data_version()
+        df = self._cache.get(key, version)
+        if df is None:
+            df = analytics.query(query, params)
+            self._cache.put(key, version, df)
+        return df.copy()
+
+    def get_invoice_cost_summary(self, group_by, std=False):
+        """
+        סיכום עלויות החשבוניות לפי עמודה - count / sum / mean (ואופציונלית std),
+        כמו df.groupby(group_by)['total'].agg([...]) אחרי טעינת כל החשבוניות.
+
+        Args:
+            group_by: עמודת הקיבוץ (workshop, vehicle_id, kind, make_model, plate)
+            std: הוספת סטיית תקן מדגמית (ddof=1, NaN לקבוצה עם חשבונית אחת)
+
+        Returns:
+            DataFrame עם אינדקס group_by, ממוין לפי ערכי הקבוצה
+        """
+        if group_by not in self.COST_SUMMARY_GROUPS:
+            raise ValueError(f"עמודה לא מוכרת לקיבוץ: {group_by}")
+
+        # סטיית התקן מחושבת בשני מעברים (סטיות מהממוצע של הקבוצה) - יציב נומרית
+        # ותקף גם ב-SQLite שאין בו stddev
+        query = f"""
+        SELECT
+            i.{group_by} AS group_key,
+            COUNT(i.total) AS n,
+            COALESCE(SUM(i.total), 0) AS total_sum,
+            AVG(i.total) AS total_mean,
+            SUM((i.total - g.group_mean) * (i.total - g.group_mean)) AS sq_dev
+        FROM invoices i
+        JOIN (
+            SELECT {group_by}, AVG(total) AS group_mean
+            FROM invoices
+            WHERE {group_by} IS NOT NULL
+            GROUP BY {group_by}
+        ) g ON i.{group_by} = g.{group_by}
+        GROUP BY i.{group_by}
+        ORDER BY i.{group_by}
+        """
+        df = self.analytics_query(query)
+
+        summary = pd.DataFrame({
+            'count': df['n'].astype(np.int64),
+            'sum': df['total_sum'].astype(float),
+            'mean': df['total_mean'].astype(float)
+        })
+        if std:
+            n = summary['count']
+            summary['std'] = np.sqrt(df['sq_dev'].astype(float) / (n - 1)).where(n > 1)
+        summary.index = pd.Index(df['group_key'], name=group_by)
+        return summary
+
+    def get_monthly_costs(self):
+        """
+        סך עלויות החשבוניות לכל חודש.
+
+        Returns:
+            DataFrame עם העמודות month ('YYYY-MM') ו-total_cost, ממוין לפי חודש
+        """
+        return self.analytics_query("""
+        SELECT substr(date, 1, 7) AS month, COALESCE(SUM(total), 0) AS total_cost
+        FROM invoices
+        WHERE date IS NOT NULL
+        GROUP BY substr(date, 1, 7)
+        ORDER BY month
+        """)
 
     # ===== Chat History & Project Templates Functions =====
 
     def save_conversation(self, conversation_id, title, project_template_id=None):
         """שומר שיחה חדשה"""
         from datetime import datetime
-        conn = self.get_connection()
+        conn = self.get_write_connection()
         cursor = conn.cursor()
 
         try:
@@ -407,13 +1702,11 @@ class DatabaseManager:
         finally:
             conn.close()
 
-    def save_message(self, conversation_id, role, content):
-        """שומר הודעה בשיחה"""
+    def save_message(self, conversation_id, role, content, wait=True):
+        """שומר הודעה בשיחה (wait=False - החזרת Future במצב תור כתיבה)"""
         from datetime import datetime
-        conn = self.get_connection()
-        cursor = conn.cursor()
 
-        try:
+        def work(cursor):
             # הוספת ההודעה
             cursor.execute("""
                 INSERT INTO chat_messages
@@ -428,18 +1721,13 @@ class DatabaseManager:
                     last_updated = ?
                 WHERE conversation_id = ?
             """, (datetime.now().isoformat(), conversation_id))
-
-            conn.commit()
             return True
-        except Exception as e:
-            conn.rollback()
-            raise Exception(f"שגיאה בשמירת הודעה: {str(e)}")
-        finally:
-            conn.close()
+
+        return self._write(work, "שגיאה בשמירת הודעה", wait=wait)
 
     def get_conversation_history(self, conversation_id):
         """מחזיר את כל ההודעות בשיחה"""
-        conn = self.get_connection()
+        conn = self.get_read_connection()
         query = """
         SELECT role, content, timestamp
         FROM chat_messages
@@ -452,7 +1740,7 @@ class DatabaseManager:
 
     def get_all_conversations(self, limit=50):
         """מחזיר רשימת כל השיחות"""
-        conn = self.get_connection()
+        conn = self.get_read_connection()
         query = """
         SELECT
             c.conversation_id,
@@ -473,7 +1761,7 @@ class DatabaseManager:
 
     def delete_conversation(self, conversation_id):
         """מוחק שיחה והודעות שלה"""
-        conn = self.get_connection()
+        conn = self.get_write_connection()
         cursor = conn.cursor()
 
         try:
@@ -491,7 +1779,7 @@ class DatabaseManager:
 
     def get_all_templates(self):
         """מחזיר את כל תבניות הפרויקטים"""
-        conn = self.get_connection()
+        conn = self.get_read_connection()
         query = "SELECT * FROM project_templates ORDER BY template_name"
         df = pd.read_sql_query(query, conn)
         conn.close()
@@ -499,7 +1787,7 @@ class DatabaseManager:
 
     def get_template(self, template_id):
         """מחזיר תבנית ספציפית"""
-        conn = self.get_connection()
+        conn = self.get_read_connection()
         query = "SELECT * FROM project_templates WHERE template_id = ?"
         df = pd.read_sql_query(query, conn, params=(template_id,))
         conn.close()
@@ -508,7 +1796,7 @@ class DatabaseManager:
     def save_template(self, template_data):
         """שומר או מעדכן תבנית"""
         from datetime import datetime
-        conn = self.get_connection()
+        conn = self.get_write_connection()
         cursor = conn.cursor()
 
         try:
@@ -533,29 +1821,23 @@ class DatabaseManager:
         finally:
             conn.close()
 
-    def update_template_last_used(self, template_id):
-        """מעדכן מתי התבנית נוצלה לאחרונה"""
+    def update_template_last_used(self, template_id, wait=True):
+        """מעדכן מתי התבנית נוצלה לאחרונה (wait=False - החזרת Future במצב תור כתיבה)"""
         from datetime import datetime
-        conn = self.get_connection()
-        cursor = conn.cursor()
 
-        try:
+        def work(cursor):
             cursor.execute("""
                 UPDATE project_templates
                 SET last_used = ?
                 WHERE template_id = ?
             """, (datetime.now().isoformat(), template_id))
-            conn.commit()
             return True
-        except Exception as e:
-            conn.rollback()
-            raise Exception(f"שגיאה בעדכון תבנית: {str(e)}")
-        finally:
-            conn.close()
+
+        return self._write(work, "שגיאה בעדכון תבנית", wait=wait)
 
     def delete_template(self, template_id):
         """מוחק תבנית"""
-        conn = self.get_connection()
+        conn = self.get_write_connection()
         cursor = conn.cursor()
 
         try:
@@ -578,7 +1860,7 @@ class DatabaseManager:
 
         This table tracks email sync attempts and results.
         """
-        conn = self.get_connection()
+        conn = self.get_write_connection()
         cursor = conn.cursor()
 
         try:
@@ -602,7 +1884,7 @@ class DatabaseManager:
         finally:
             conn.close()
 
-    def log_email_sync(self, sync_data):
+    def log_email_sync(self, sync_data, wait=True):
         """
         Log email sync attempt to database.
 
@@ -615,6 +1897,7 @@ class DatabaseManager:
                 - processed_date: When email was processed
                 - invoice_numbers: Comma-separated invoice numbers found
                 - status: 'success' or 'failed'
+            wait: False = return a Future instead of waiting for the commit (write queue mode)
 
         Returns:
             bool: True if logged successfully
@@ -622,10 +1905,7 @@ class DatabaseManager:
         # Ensure table exists
         self.create_email_sync_table()
 
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        try:
+        def work(cursor):
             cursor.execute("""
                 INSERT OR REPLACE INTO email_sync_log
                 (email_message_id, subject, sender, received_date, processed_date, invoice_numbers, status)
@@ -639,14 +1919,13 @@ class DatabaseManager:
                 sync_data.get('invoice_numbers', ''),
                 sync_data.get('status', 'failed')
             ))
-            conn.commit()
             return True
+
+        try:
+            return self._write(work, "שגיאה בלוג סנכרון", wait=wait)
         except Exception as e:
-            conn.rollback()
-            print(f"שגיאה בלוג סנכרון: {str(e)}")
+            print(str(e))
             return False
-        finally:
-            conn.close()
 
     def get_email_sync_history(self, limit=20):
         """
@@ -661,7 +1940,7 @@ class DatabaseManager:
         # Ensure table exists
         self.create_email_sync_table()
 
-        conn = self.get_connection()
+        conn = self.get_read_connection()
 
         try:
             query = """
@@ -696,7 +1975,7 @@ class DatabaseManager:
         Returns:
             bool: True if invoice exists (is duplicate), False otherwise
         """
-        conn = self.get_connection()
+        conn = self.get_read_connection()
         cursor = conn.cursor()
 
         try:
@@ -741,7 +2020,7 @@ class DatabaseManager:
         Returns:
             bool: True if deleted successfully, False otherwise
         """
-        conn = self.get_connection()
+        conn = self.get_write_connection()
         cursor = conn.cursor()
 
         try:
@@ -763,7 +2042,7 @@ class DatabaseManager:
         Returns:
             bool: True if deleted successfully, False otherwise
         """
-        conn = self.get_connection()
+        conn = self.get_write_connection()
         cursor = conn.cursor()
 
         try:
@@ -784,7 +2063,7 @@ class DatabaseManager:
         Returns:
             bool: True if deleted successfully, False otherwise
         """
-        conn = self.get_connection()
+        conn = self.get_write_connection()
         cursor = conn.cursor()
 
         try:
@@ -807,7 +2086,7 @@ class DatabaseManager:
 
         This table stores user-defined custom alerts per vehicle.
         """
-        conn = self.get_connection()
+        conn = self.get_write_connection()
         cursor = conn.cursor()
 
         try:
@@ -826,6 +2105,11 @@ class DatabaseManager:
                     FOREIGN KEY (vehicle_id) REFERENCES vehicles(vehicle_id)
                 )
             """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_custom_alerts_vehicle_active
+                ON custom_alerts(vehicle_id, is_active)
+            """)
+            DatabaseSchemaUpdater(self.db_path).create_change_log_triggers(cursor, 'custom_alerts')
             conn.commit()
             return True
         except Exception as e:
@@ -834,7 +2118,7 @@ class DatabaseManager:
         finally:
             conn.close()
 
-    def add_custom_alert(self, alert_data):
+    def add_custom_alert(self, alert_data, wait=True):
         """
         Add a new custom alert for a vehicle.
 
@@ -847,6 +2131,7 @@ class DatabaseManager:
                 - created_by: Username who created the alert
                 - due_date: Optional due date for the alert
                 - notes: Optional additional notes
+            wait: False = return a Future instead of waiting for the commit (write queue mode)
 
         Returns:
             int: alert_id of created alert
@@ -856,10 +2141,7 @@ class DatabaseManager:
         # Ensure table exists
         self.create_custom_alerts_table()
 
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        try:
+        def work(cursor):
             cursor.execute("""
                 INSERT INTO custom_alerts
                 (vehicle_id, alert_title, alert_message, severity, created_at, created_by, due_date, notes)
@@ -874,15 +2156,9 @@ class DatabaseManager:
                 alert_data.get('due_date'),
                 alert_data.get('notes')
             ))
+            return cursor.lastrowid
 
-            conn.commit()
-            alert_id = cursor.lastrowid
-            return alert_id
-        except Exception as e:
-            conn.rollback()
-            raise Exception(f"שגיאה בהוספת התראה מותאמת אישית: {str(e)}")
-        finally:
-            conn.close()
+        return self._write(work, "שגיאה בהוספת התראה מותאמת אישית", wait=wait)
 
     def get_custom_alerts(self, vehicle_id=None, active_only=True):
         """
@@ -898,13 +2174,13 @@ class DatabaseManager:
         # Ensure table exists
         self.create_custom_alerts_table()
 
-        conn = self.get_connection()
-
         query = "SELECT * FROM custom_alerts"
         conditions = []
+        params = []
 
         if vehicle_id:
-            conditions.append(f"vehicle_id = '{vehicle_id}'")
+            conditions.append("vehicle_id = ?")
+            params.append(vehicle_id)
         if active_only:
             conditions.append("is_active = 1")
 
@@ -913,10 +2189,7 @@ class DatabaseManager:
 
         query += " ORDER BY created_at DESC"
 
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-
-        return df
+        return self._read_frame(query, params=params if params else None)
 
     def update_custom_alert(self, alert_id, updates):
         """
@@ -929,7 +2202,7 @@ class DatabaseManager:
         Returns:
             bool: True if updated successfully
         """
-        conn = self.get_connection()
+        conn = self.get_write_connection()
         cursor = conn.cursor()
 
         try:
@@ -983,4 +2256,427 @@ class DatabaseManager:
             int: Count of active alerts
         """
         df = self.get_custom_alerts(vehicle_id=vehicle_id, active_only=True)
-        return len(df)
\ No newline at end of file
+        return len(df)
+    # ===== Rule Alerts (Rules Engine) =====
+
+    def get_rule_alerts(self, vehicle_id=None, rule_name=None):
+        """
+        Get persisted rules engine alerts (see FleetRulesEngine.refresh_alerts).
+
+        Args:
+            vehicle_id: Specific vehicle to filter (None = all vehicles)
+            rule_name: Specific rule to filter (None = all rules)
+
+        Returns:
+            DataFrame with vehicle_id, alert_index, rule_name, severity, alert_json,
+            in evaluation order (vehicle_id, then alert_index)
+        """
+        conditions = []
+        params = []
+
+        if vehicle_id:
+            conditions.append("vehicle_id = ?")
+            params.append(vehicle_id)
+        if rule_name:
+            conditions.append("rule_name = ?")
+            params.append(rule_name)
+
+        where_clause = " AND ".join(conditions) if conditions else "1=1"
+        query = f"""
+            SELECT vehicle_id, alert_index, rule_name, severity, alert_json
+            FROM rule_alerts WHERE {where_clause}
+            ORDER BY vehicle_id, alert_index
+        """
+        return self._read_frame(query, params=params if params else None)
+
+    def get_rule_alert_vehicles(self):
+        """
+        Get the input fingerprint each vehicle's persisted alerts were evaluated from.
+
+        Returns:
+            DataFrame with vehicle_id, change_version, rules_hash, evaluated_day,
+            fleet_avg_cost, alert_count, evaluated_at
+        """
+        return self._read_frame("SELECT * FROM rule_alert_vehicles ORDER BY vehicle_id")
+
+    def save_rule_alerts(self, vehicle_states, alerts, removed_vehicle_ids=(), wait=True):
+        """
+        Replace the persisted alerts of the evaluated vehicles (one transaction).
+
+        Args:
+            vehicle_states: List of dicts (vehicle_id, change_version, rules_hash,
+                            evaluated_day, fleet_avg_cost, alert_count) - one per evaluated vehicle
+            alerts: List of (vehicle_id, alert_index, rule_name, severity, alert_json) tuples
+            removed_vehicle_ids: Vehicles that no longer exist - their alerts are deleted
+            wait: False = return a Future instead of waiting for the commit (write queue mode)
+
+        Returns:
+            int: Number of alerts written
+        """
+        from datetime import datetime
+
+        evaluated_at = datetime.now().isoformat(timespec='seconds')
+        cleared = [(state['vehicle_id'],) for state in vehicle_states]
+        cleared += [(vehicle_id,) for vehicle_id in removed_vehicle_ids]
+
+        def work(cursor):
+            cursor.executemany("DELETE FROM rule_alerts WHERE vehicle_id = ?", cleared)
+            cursor.executemany("DELETE FROM rule_alert_vehicles WHERE vehicle_id = ?", cleared)
+            cursor.executemany("""
+                INSERT INTO rule_alert_vehicles
+                (vehicle_id, change_version, rules_hash, evaluated_day, fleet_avg_cost, alert_count, evaluated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [
+                (state['vehicle_id'], int(state['change_version']), state['rules_hash'],
+                 state['evaluated_day'], None if pd.isna(state['fleet_avg_cost']) else float(state['fleet_avg_cost']),
+                 int(state['alert_count']), evaluated_at)
+                for state in vehicle_states
+            ])
+            cursor.executemany("""
+                INSERT INTO rule_alerts (vehicle_id, alert_index, rule_name, severity, alert_json)
+                VALUES (?, ?, ?, ?, ?)
+            """, alerts)
+            return len(alerts)
+
+        return self._write(work, "שגיאה בשמירת התראות ה-Rules Engine", wait=wait)
+
+    # ===== Alert Events (Rules Scheduler) =====
+
+    # Ordering of rule alert severities - a higher rank on the same (vehicle, rule) is an escalation
+    ALERT_SEVERITY_RANK = {'INFO': 1, 'WARNING': 2, 'URGENT': 3}
+
+    def record_alert_events(self, started_at, vehicles=0, evaluated=0, error=None, wait=True):
+        """
+        Record a rules scheduler run and diff the persisted rule_alerts against the
+        previous run (one transaction, so two schedulers can't emit the same event twice).
+
+        The latest event of each (vehicle, rule) is the state of the previous run:
+        - an alert with no open state is 'new'
+        - an open state with no alert is 'resolved'
+        - a higher severity is 'escalated', a lower one 'deescalated'
+
+        Args:
+            started_at: Run start time (ISO string)
+            vehicles: Fleet size
+            evaluated: Vehicles re-evaluated in this run
+            error: Error message of a failed evaluation - the run is recorded without a diff
+
+        Returns:
+            Dict with run_id and the number of events of each type
+        """
+        from datetime import datetime
+
+        rank = self.ALERT_SEVERITY_RANK
+
+        def work(cursor):
+            cursor.execute("""
+                INSERT INTO rule_scheduler_runs (started_at, vehicles, evaluated, error)
+                VALUES (?, ?, ?, ?)
+            """, (started_at, int(vehicles), int(evaluated), error))
+            run_id = cursor.lastrowid
+            counts = {'new': 0, 'resolved': 0, 'escalated': 0, 'deescalated': 0}
+
+            events = []
+            if error is None:
+                current = {}
+                cursor.execute("""
+                    SELECT vehicle_id, rule_name, severity, alert_json
+                    FROM rule_alerts ORDER BY vehicle_id, alert_index
+                """)
+                for vehicle_id, rule_name, severity, alert_json in cursor.fetchall():
+                    key = (vehicle_id, rule_name)
+                    if key not in current or rank.get(severity, 0) > rank.get(current[key][0], 0):
+                        current[key] = (severity, alert_json)
+
+                # SQLite takes the bare columns from the row of MAX(event_id)
+                cursor.execute("""
+                    SELECT vehicle_id, rule_name, event_type, severity, alert_json, MAX(event_id)
+                    FROM alert_events GROUP BY vehicle_id, rule_name
+                """)
+                previous = {
+                    (vehicle_id, rule_name): (severity, alert_json)
+                    for vehicle_id, rule_name, event_type, severity, alert_json, _ in cursor.fetchall()
+                    if event_type != 'resolved'
+                }
+
+                for key, (severity, alert_json) in current.items():
+                    if key not in previous:
+                        events.append(('new', key, severity, None, alert_json))
+                        continue
+                    previous_severity = previous[key][0]
+                    if rank.get(severity, 0) > rank.get(previous_severity, 0):
+                        events.append(('escalated', key, severity, previous_severity, alert_json))
+                    elif rank.get(severity, 0) < rank.get(previous_severity, 0):
+                        events.append(('deescalated', key, severity, previous_severity, alert_json))
+                for key, (severity, alert_json) in previous.items():
+                    if key not in current:
+                        events.append(('resolved', key, severity, severity, alert_json))
+
+            created_at = datetime.now().isoformat(timespec='seconds')
+            cursor.executemany("""
+                INSERT INTO alert_events
+                (run_id, event_type, vehicle_id, rule_name, severity, previous_severity, alert_json, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, [
+                (run_id, event_type, vehicle_id, rule_name, severity, previous_severity, alert_json, created_at)
+                for event_type, (vehicle_id, rule_name), severity, previous_severity, alert_json in events
+            ])
+            for event_type, *_ in events:
+                counts[event_type] += 1
+
+            cursor.execute("""
+                UPDATE rule_scheduler_runs SET finished_at = ?, events = ? WHERE run_id = ?
+            """, (created_at, len(events), run_id))
+            return {'run_id': run_id, **counts}
+
+        return self._write(work, "שגיאה ברישום אירועי ההתראות", wait=wait)
+
+    def get_alert_events(self, after_event_id=0, vehicle_id=None, event_type=None, limit=None):
+        """
+        Get alert events in stream order (oldest first).
+
+        Args:
+            after_event_id: Only events after this id (a consumer's last seen event)
+            vehicle_id: Specific vehicle to filter (None = all vehicles)
+            event_type: 'new' / 'resolved' / 'escalated' / 'deescalated' (None = all)
+            limit: Maximum number of events (None = all)
+
+        Returns:
+            DataFrame of alert_events rows
+        """
+        conditions = ["event_id > ?"]
+        params = [int(after_event_id)]
+
+        if vehicle_id:
+            conditions.append("vehicle_id = ?")
+            params.append(vehicle_id)
+        if event_type:
+            conditions.append("event_type = ?")
+            params.append(event_type)
+
+        query = f"SELECT * FROM alert_events WHERE {' AND '.join(conditions)} ORDER BY event_id"
+        if limit:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        return self._read_frame(query, params=params)
+
+    def get_pending_alert_events(self, max_attempts=5, limit=500):
+        """
+        Get events not yet delivered to the notification channels (the outbox).
+
+        Args:
+            max_attempts: Events that already failed this many times are skipped
+            limit: Maximum number of events per delivery batch
+
+        Returns:
+            DataFrame of alert_events rows, oldest first
+        """
+        query = """
+            SELECT * FROM alert_events
+            WHERE delivered_at IS NULL AND delivery_attempts < ?
+            ORDER BY event_id LIMIT ?
+        """
+        return self._query_frame(query, params=[int(max_attempts), int(limit)])
+
+    def mark_alert_events_delivered(self, event_ids, error=None, wait=True):
+        """
+        Record a delivery attempt of alert events.
+
+        Args:
+            event_ids: Events that were sent together
+            error: Error message of a failed attempt (None = delivered)
+
+        Returns:
+            int: Number of events updated
+        """
+        from datetime import datetime
+
+        delivered_at = None if error else datetime.now().isoformat(timespec='seconds')
+        rows = [(delivered_at, error, int(event_id)) for event_id in event_ids]
+
+        def work(cursor):
+            cursor.executemany("""
+                UPDATE alert_events
+                SET delivered_at = ?, delivery_error = ?, delivery_attempts = delivery_attempts + 1
+                WHERE event_id = ?
+            """, rows)
+            return len(rows)
+
+        return self._write(work, "שגיאה בעדכון משלוח אירועי ההתראות", wait=wait)
+
+    def get_rule_scheduler_runs(self, limit=20):
+        """
+        Get the latest rules scheduler runs (newest first).
+
+        Returns:
+            DataFrame with run_id, started_at, finished_at, vehicles, evaluated, events, error
+        """
+        return self._read_frame(
+            "SELECT * FROM rule_scheduler_runs ORDER BY run_id DESC LIMIT ?", params=[int(limit)]
+        )
+
+    # ===== Rule Definitions (Rules Engine) =====
+
+    # Per-vehicle values the declarative rules compare against (see FleetRulesEngine.compile_rules).
+    # Bound parameters: :vehicle_ids (JSON array or NULL = all vehicles), :fleet_avg_cost
+    # (NULL = average of the selected vehicles), :today (epoch day) and :after_midnight
+    # (1 unless "now" is exactly midnight - days until a future date are floored like timedelta.days).
+    RULE_INPUTS_CTE = f"""
+        scope AS MATERIALIZED (
+            SELECT
+                v.vehicle_id, v.plate, v.initial_km, v.purchase_date, v.estimated_retirement_date,
+                v._purchase_day AS purchase_day, v._retirement_day AS retirement_day,{VEHICLE_STATS_COLUMNS}
+            FROM vehicles v{VEHICLE_STATS_JOINS}
+            WHERE :vehicle_ids IS NULL OR v.vehicle_id IN (SELECT value FROM json_each(:vehicle_ids))
+        ),
+        fleet AS (
+            SELECT COALESCE(:fleet_avg_cost, (SELECT AVG(avg_service_cost) FROM scope)) AS fleet_avg_cost
+        ),
+        inputs AS MATERIALIZED (
+            SELECT
+                ROW_NUMBER() OVER (ORDER BY s.vehicle_id) - 1 AS vehicle_position,
+                s.vehicle_id, s.plate, s.initial_km, s.purchase_date, s.estimated_retirement_date,
+                s.last_service_date, s.current_km, s.total_services, s.total_cost, s.avg_service_cost,
+                s.current_km AS current_km_value,
+                (s.last_service_date IS NOT NULL AND s.current_km IS NOT NULL) AS has_service,
+                -- km of the latest service interval (from initial_km for a first service)
+                COALESCE(MAX(r.odometer_km - COALESCE((
+                    SELECT i.odometer_km FROM invoices i
+                    WHERE i.vehicle_id = s.vehicle_id AND i.date IS NOT NULL
+                    ORDER BY i.date DESC, i.odometer_km DESC, i.rowid DESC LIMIT 1 OFFSET 1
+                ), s.initial_km), 0), 0) AS km_since_service,
+                COALESCE(:today - CAST(julianday(s.last_service_date) - 2440587.5 AS INTEGER), 0)
+                    AS days_since_service,
+                (:today - s.purchase_day) / 365.25 AS vehicle_age_years,
+                s.retirement_day - :today - :after_midnight AS days_until_retirement,
+                (:today - s.purchase_day) / 30.44 AS service_months,
+                s.current_km - s.initial_km AS km_driven,
+                (s.current_km - s.initial_km) / MAX(1, (:today - s.purchase_day) / 30.44) AS km_per_month,
+                EXISTS (SELECT 1 FROM invoices i WHERE i.vehicle_id = s.vehicle_id) AS has_invoices,
+                r.total AS recent_cost, r.date AS recent_date, r.workshop AS recent_workshop,
+                CASE WHEN s.avg_service_cost = 0 THEN 1 ELSE s.avg_service_cost END AS anomaly_avg_cost,
+                f.fleet_avg_cost,
+                s.avg_service_cost / NULLIF(f.fleet_avg_cost, 0) AS cost_ratio,
+                COALESCE((
+                    SELECT i.workshop FROM invoices i
+                    WHERE i.vehicle_id = s.vehicle_id AND i.workshop IS NOT NULL
+                    GROUP BY i.workshop ORDER BY COUNT(*) DESC, i.workshop LIMIT 1
+                ), 'N/A') AS most_common_workshop
+            FROM scope s
+            CROSS JOIN fleet f
+            -- the latest service (is_latest of service_timeline; the view itself would be
+            -- computed for the whole fleet, the index lookup reads only this vehicle)
+            LEFT JOIN invoices r ON r.rowid = (
+                SELECT i.rowid FROM invoices i
+                WHERE i.vehicle_id = s.vehicle_id AND i.date IS NOT NULL
+                ORDER BY i.date DESC, i.odometer_km DESC, i.rowid DESC LIMIT 1
+            )
+        )"""
+
+    # Columns of RULE_INPUTS_CTE that rule conditions may reference
+    RULE_INPUT_COLUMNS = {
+        'vehicle_id', 'plate', 'initial_km', 'purchase_date', 'estimated_retirement_date',
+        'last_service_date', 'current_km', 'total_services', 'total_cost', 'avg_service_cost',
+        'current_km_value', 'has_service', 'km_since_service', 'days_since_service',
+        'vehicle_age_years', 'days_until_retirement', 'service_months', 'km_driven', 'km_per_month',
+        'has_invoices', 'recent_cost', 'recent_date', 'recent_workshop', 'anomaly_avg_cost',
+        'fleet_avg_cost', 'cost_ratio', 'most_common_workshop'
+    }
+
+    def query_rule_matches(self, predicates, today, after_midnight=1, vehicle_ids=None, fleet_avg_cost=None):
+        """
+        Evaluate compiled rule predicates over all vehicles in one SQLite query.
+
+        Args:
+            predicates: List of (rule_order, rule_name, severity, predicate_sql, params) where
+                        predicate_sql uses named parameters from params (unique per rule)
+            today: Current day as days since 1970-01-01
+            after_midnight: 1 if the evaluation time is past midnight (see RULE_INPUTS_CTE)
+            vehicle_ids: Vehicles to evaluate (None = all vehicles)
+            fleet_avg_cost: Fleet average for cost_ratio (None = average of the evaluated vehicles)
+
+        Returns:
+            DataFrame with one row per match: rule_name, severity, rule_order and the
+            RULE_INPUTS_CTE columns, ordered by vehicle_id then rule_order
+        """
+        self.ensure_schema()
+        params = {
+            'today': int(today),
+            'after_midnight': int(after_midnight),
+            'vehicle_ids': json.dumps(list(vehicle_ids)) if vehicle_ids is not None else None,
+            'fleet_avg_cost': None if fleet_avg_cost is None or pd.isna(fleet_avg_cost) else float(fleet_avg_cost)
+        }
+        selects = []
+        for rule_order, rule_name, severity, predicate_sql, predicate_params in predicates:
+            params[f'rule_{int(rule_order)}_name'] = rule_name
+            params[f'rule_{int(rule_order)}_severity'] = severity
+            params.update(predicate_params)
+            selects.append(
+                f"SELECT :rule_{int(rule_order)}_name AS rule_name, :rule_{int(rule_order)}_severity AS severity, "
+                f"{int(rule_order)} AS rule_order, inputs.* FROM inputs WHERE {predicate_sql}"
+            )
+        if not selects:
+            selects.append("SELECT NULL AS rule_name, NULL AS severity, NULL AS rule_order, inputs.* FROM inputs WHERE 0")
+
+        query = (
+            f"WITH {self.RULE_INPUTS_CTE}\n"
+            + "\nUNION ALL\n".join(selects)
+            + "\nORDER BY vehicle_position, rule_order"
+        )
+        return self._query_frame(query, params=params)
+
+    def get_rule_definitions(self):
+        """
+        Get the stored declarative rule definitions.
+
+        Returns:
+            DataFrame with rule_group, position, definition_json, updated_at (in evaluation order)
+        """
+        return self._read_frame(
+            "SELECT rule_group, position, definition_json, updated_at FROM rule_definitions "
+            "ORDER BY position, rule_group"
+        )
+
+    def save_rule_definitions(self, definitions, replace=True, wait=True):
+        """
+        Store rule definitions.
+
+        Args:
+            definitions: List of (rule_group, position, definition_json) tuples
+            replace: True = overwrite existing groups; False = only add missing groups
+            wait: False = return a Future instead of waiting for the commit (write queue mode)
+
+        Returns:
+            int: Number of definitions written
+        """
+        from datetime import datetime
+
+        updated_at = datetime.now().isoformat(timespec='seconds')
+        rows = [(group, int(position), definition_json, updated_at) for group, position, definition_json in definitions]
+        conflict = (
+            "DO UPDATE SET position = excluded.position, definition_json = excluded.definition_json, "
+            "updated_at = excluded.updated_at"
+        ) if replace else "DO NOTHING"
+
+        def work(cursor):
+            cursor.executemany(f"""
+                INSERT INTO rule_definitions (rule_group, position, definition_json, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(rule_group) {conflict}
+            """, rows)
+            return len(rows)
+
+        return self._write(work, "שגיאה בשמירת הגדרות הכללים", wait=wait)
+
+    def delete_rule_definition(self, rule_group):
+        """
+        Delete a rule definition group.
+
+        Returns:
+            bool: True if a definition was deleted
+        """
+        def work(cursor):
+            cursor.execute("DELETE FROM rule_definitions WHERE rule_group = ?", (rule_group,))
+            return cursor.rowcount > 0
+
+        return self._write(work, "שגיאה במחיקת הגדרת כלל")
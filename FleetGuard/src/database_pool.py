@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Database Connection Pool
+מאגר חיבורי SQLite ממוחזרים (thread-local) עבור DatabaseManager
+
+כל Thread מקבל חיבור קריאה וחיבור כתיבה משלו שנשארים פתוחים בין קריאות.
+החיבורים מוגדרים ב-WAL journal mode עם PRAGMAs מכווננים (cache, mmap, synchronous),
+כך שקוראים לא נחסמים ע"י כותבים ואין עלות פתיחת חיבור בכל שאילתה.
+"""
+
+import os
+import sqlite3
+import threading
+
+
+# PRAGMAs שמוחלים על כל חיבור חדש במאגר
+POOL_PRAGMAS = {
+    'synchronous': 'NORMAL',     # בטוח ב-WAL, חוסך fsync בכל commit
+    'cache_size': -20000,        # ~20MB page cache לכל חיבור (ערך שלילי = KiB)
+    'mmap_size': 268435456,      # 256MB memory-mapped I/O
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,        # המתנה של עד 5 שניות לנעילה במקום כישלון מיידי
+}
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    חיבור SQLite ממוחזר.
+
+    close() לא סוגר את החיבור בפועל אלא מחזיר אותו למאגר (עם rollback לטרנזקציה פתוחה),
+    כך שהקוד הקיים ב-DatabaseManager (conn.close() ב-finally) ממשיך לעבוד ללא שינוי.
+    """
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def release(self):
+        """סוגר את החיבור בפועל"""
+        super().close()
+
+
+class ConnectionPool:
+    """
+    מאגר חיבורים לקובץ SQLite יחיד.
+
+    Attributes:
+        db_path: נתיב לקובץ הדאטה בייס
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []  # [(thread, connection)]
+        self._wal_enabled = False
+
+    def get_read_connection(self):
+        """מחזיר את חיבור הקריאה של ה-Thread הנוכחי (query_only)"""
+        conn = getattr(self._local, 'read', None)
+        if conn is None:
+            conn = self._open(read_only=True)
+            self._local.read = conn
+        return conn
+
+    def get_write_connection(self):
+        """מחזיר את חיבור הכתיבה של ה-Thread הנוכחי"""
+        conn = getattr(self._local, 'write', None)
+        if conn is None:
+            conn = self._open(read_only=False)
+            self._local.write = conn
+        return conn
+
+    def _open(self, read_only):
+        """פותח חיבור חדש ומחיל עליו את הגדרות המאגר"""
+        if not os.path.exists(self.db_path):
+            raise FileNotFoundError(f"❌ Database not found at: {self.db_path}")
+
+        self._prune_dead_threads()
+
+        # check_same_thread=False כדי שניתן יהיה לסגור חיבורים של Threads שהסתיימו;
+        # בפועל כל חיבור משמש רק את ה-Thread שפתח אותו (thread-local)
+        conn = sqlite3.connect(self.db_path, factory=PooledConnection, check_same_thread=False)
+
+        if not self._wal_enabled:
+            # journal_mode נשמר בקובץ עצמו - מספיק להגדיר פעם אחת
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._wal_enabled = True
+
+        for pragma, value in POOL_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma}={value}")
+
+        if read_only:
+            conn.execute("PRAGMA query_only=1")
+
+        with self._lock:
+            self._connections.append((threading.current_thread(), conn))
+        return conn
+
+    def _prune_dead_threads(self):
+        """סוגר חיבורים של Threads שכבר הסתיימו (למשל Threads של Streamlit reruns)"""
+        with self._lock:
+            alive = []
+            for thread, conn in self._connections:
+                if thread.is_alive():
+                    alive.append((thread, conn))
+                else:
+                    try:
+                        conn.release()
+                    except sqlite3.Error:
+                        pass
+            self._connections = alive
+
+    def close_all(self):
+        """סוגר את כל החיבורים במאגר (כל ה-Threads)"""
+        with self._lock:
+            for _, conn in self._connections:
+                try:
+                    conn.release()
+                except sqlite3.Error:
+                    pass
+            self._connections = []
+            self._local = threading.local()
+
+    def __len__(self):
+        return len(self._connections)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(db_path):
+    """
+    מחזיר את המאגר המשותף לקובץ הדאטה בייס.
+
+    המאגר משותף לכל מופעי DatabaseManager באותו תהליך שמצביעים לאותו קובץ,
+    כך שגם מודולים שיוצרים DatabaseManager() משלהם משתמשים באותם חיבורים.
+    """
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(key)
+            _pools[key] = pool
+        return pool
@@ -1,14 +1,75 @@
 # -*- coding: utf-8 -*-
 """
 Database Schema Update - Adding Fleet Management Fields
++ Versioned migrations (tracked via PRAGMA user_version)
 """
 
 import sqlite3
 import os
+import argparse
 from datetime import datetime, timedelta
 import random
 
 class DatabaseSchemaUpdater:
+    # מיגרציות ממוספרות: (גרסה, תיאור, שם מתודה).
+    # הגרסה האחרונה שהוחלה נשמרת ב-PRAGMA user_version של קובץ הדאטה בייס.
+    MIGRATIONS = [
+        (1, 'secondary indexes for hot query paths', '_migration_001_secondary_indexes'),
+        (2, 'trigger-maintained vehicle_stats summary table', '_migration_002_vehicle_stats'),
+        (3, 'FTS5 full-text search index over invoices', '_migration_003_invoice_search'),
+        (4, 'trigger-written change_log feed', '_migration_004_change_log'),
+        (5, 'yearly invoice archive bookkeeping', '_migration_005_archive_partitions'),
+        (6, 'generated epoch-day columns for date math', '_migration_006_epoch_days'),
+        (7, 'persisted rules engine alerts', '_migration_007_rule_alerts'),
+        (8, 'declarative rule definitions', '_migration_008_rule_definitions'),
+        (9, 'rules scheduler alert event stream', '_migration_009_alert_events'),
+        (10, 'service_timeline window view', '_migration_010_service_timeline'),
+    ]
+
+    # אינדקסים משניים לנתיבי השאילתות החמים:
+    # get_vehicle_history / search_invoices / get_vehicle_with_stats (vehicle_id + date),
+    # get_full_view (JOIN על invoice_no), get_custom_alerts, get_conversation_history
+    SECONDARY_INDEXES = {
+        'idx_invoices_vehicle_date': ('invoices', 'vehicle_id, date'),
+        'idx_invoices_date': ('invoices', 'date'),
+        'idx_invoice_lines_invoice_no': ('invoice_lines', 'invoice_no, line_no'),
+        'idx_custom_alerts_vehicle_active': ('custom_alerts', 'vehicle_id, is_active'),
+        'idx_chat_messages_conversation': ('chat_messages', 'conversation_id'),
+    }
+
+    # מספר ימים מ-1970-01-01 של עמודת תאריך TEXT ('YYYY-MM-DD'); NULL לערך ריק / לא תקין
+    EPOCH_DAY_SQL = "CAST(julianday({column}) - 2440587.5 AS INTEGER)"
+
+    # עמודות epoch-day מחושבות (GENERATED VIRTUAL): {טבלה: {עמודה: עמודת התאריך}}.
+    # מתחילות ב-_ כי הן פרט מימושי - DatabaseManager לא מחזיר אותן ב-DataFrames
+    DAY_COLUMNS = {
+        'invoices': {'_date_day': 'date'},
+        'vehicles': {
+            '_purchase_day': 'purchase_date',
+            '_last_test_day': 'last_test_date',
+            '_next_test_day': 'next_test_date',
+            '_retirement_day': 'estimated_retirement_date',
+        },
+    }
+    # אינדקסים על עמודות ה-day שמסננים לפיהן (טווחי תאריכים, טסטים / גריטה קרובים)
+    DAY_INDEXES = {
+        'idx_invoices_date_day': ('invoices', '_date_day'),
+        'idx_invoices_vehicle_date_day': ('invoices', 'vehicle_id, _date_day'),
+        'idx_vehicles_next_test_day': ('vehicles', '_next_test_day'),
+        'idx_vehicles_retirement_day': ('vehicles', '_retirement_day'),
+    }
+
+    # טבלאות שנרשמות ב-change_log: (עמודת מפתח, ביטוי vehicle_id של השורה עם {ref} = NEW / OLD).
+    # שורות invoice_lines נרשמות לפי מספר החשבונית שלהן.
+    CHANGE_LOG_TABLES = {
+        'invoices': ('invoice_no', '{ref}.vehicle_id'),
+        'invoice_lines': (
+            'invoice_no', '(SELECT vehicle_id FROM invoices WHERE invoice_no = {ref}.invoice_no)'
+        ),
+        'vehicles': ('vehicle_id', '{ref}.vehicle_id'),
+        'custom_alerts': ('alert_id', '{ref}.vehicle_id'),
+    }
+
     def __init__(self, db_path=None):
         if db_path is None:
             base_dir = os.path.dirname(os.path.dirname(__file__))
@@ -42,6 +103,9 @@ class DatabaseSchemaUpdater:
                 except sqlite3.OperationalError as e:
                     print(f"⚠️ Column {col_name} might already exist: {e}")
 
+        # עמודות ה-day של עמודות התאריך שנוספו עכשיו
+        self.add_day_columns(cursor)
+
         conn.commit()
         conn.close()
         print("[SUCCESS] Schema update completed!")
@@ -102,8 +166,651 @@ class DatabaseSchemaUpdater:
         conn.close()
         print(f"[SUCCESS] Updated {len(vehicles)} vehicles with sample fleet management data!")
 
+    # ===== Versioned Migrations =====
+
+    def get_schema_version(self):
+        """מחזיר את גרסת הסכמה הנוכחית (PRAGMA user_version)"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            conn.close()
+
+    def apply_migrations(self, analyze=True):
+        """
+        מחיל את כל המיגרציות שטרם הוחלו, כל אחת בטרנזקציה נפרדת.
+
+        Args:
+            analyze: להריץ ANALYZE בסוף אם הוחלה מיגרציה כלשהי,
+                     כדי שה-query planner יכיר את האינדקסים החדשים
+
+        Returns:
+            list: גרסאות המיגרציות שהוחלו בריצה זו
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        applied = []
+
+        try:
+            current_version = cursor.execute("PRAGMA user_version").fetchone()[0]
+
+            for version, description, method_name in self.MIGRATIONS:
+                if version <= current_version:
+                    continue
+
+                cursor.execute("BEGIN")
+                try:
+                    getattr(self, method_name)(cursor)
+                    cursor.execute(f"PRAGMA user_version = {int(version)}")
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+
+                applied.append(version)
+                print(f"[OK] Migration {version:03d} applied: {description}")
+
+            if applied and analyze:
+                cursor.execute("ANALYZE")
+                conn.commit()
+        finally:
+            conn.close()
+
+        return applied
+
+    def analyze(self):
+        """מעדכן סטטיסטיקות ל-query planner (ANALYZE)"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("ANALYZE")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _table_exists(self, cursor, table_name):
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)
+        )
+        return cursor.fetchone() is not None
+
+    def _migration_001_secondary_indexes(self, cursor):
+        """
+        אינדקסים משניים ל-invoices, invoice_lines, custom_alerts, chat_messages.
+        טבלאות שעדיין לא קיימות מדולגות - הן יוצרות את האינדקס בעצמן בעת היצירה.
+        """
+        for index_name, (table_name, columns) in self.SECONDARY_INDEXES.items():
+            if not self._table_exists(cursor, table_name):
+                continue
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name}({columns})"
+            )
+
+    def _migration_002_vehicle_stats(self, cursor):
+        """
+        טבלת סיכום vehicle_stats - שורה לכל רכב, מתוחזקת ע"י טריגרים על invoices:
+        - INSERT: עדכון אינקרמנטלי O(1) (MAX / COUNT / SUM)
+        - UPDATE / DELETE: חישוב מחדש של הרכב המושפע בלבד (דרך idx_invoices_vehicle_date)
+
+        הערה: INSERT OR REPLACE על invoices לא מפעיל טריגר DELETE (אלא אם recursive_triggers),
+        לכן עדכון חשבונית קיימת צריך להיעשות ב-UPDATE / ON CONFLICT DO UPDATE.
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS vehicle_stats (
+                vehicle_id TEXT PRIMARY KEY,
+                last_service_date TEXT,
+                current_km INTEGER,
+                total_services INTEGER NOT NULL DEFAULT 0,
+                total_cost REAL,
+                cost_count INTEGER NOT NULL DEFAULT 0  -- חשבוניות עם total (למכנה של הממוצע)
+            )
+        """)
+
+        refresh_sql = """
+                DELETE FROM vehicle_stats WHERE vehicle_id = {ref}.vehicle_id;
+                INSERT INTO vehicle_stats
+                    (vehicle_id, last_service_date, current_km, total_services, total_cost, cost_count)
+                SELECT vehicle_id, MAX(date), MAX(odometer_km), COUNT(invoice_no), SUM(total), COUNT(total)
+                FROM invoices
+                WHERE vehicle_id = {ref}.vehicle_id
+                GROUP BY vehicle_id;"""
+
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_invoices_stats_insert
+            AFTER INSERT ON invoices
+            WHEN NEW.vehicle_id IS NOT NULL
+            BEGIN
+                INSERT INTO vehicle_stats
+                    (vehicle_id, last_service_date, current_km, total_services, total_cost, cost_count)
+                VALUES (
+                    NEW.vehicle_id, NEW.date, NEW.odometer_km,
+                    NEW.invoice_no IS NOT NULL, NEW.total, NEW.total IS NOT NULL
+                )
+                ON CONFLICT(vehicle_id) DO UPDATE SET
+                    last_service_date = MAX(COALESCE(last_service_date, excluded.last_service_date),
+                                            COALESCE(excluded.last_service_date, last_service_date)),
+                    current_km = MAX(COALESCE(current_km, excluded.current_km),
+                                     COALESCE(excluded.current_km, current_km)),
+                    total_services = total_services + excluded.total_services,
+                    total_cost = CASE WHEN excluded.total_cost IS NULL THEN total_cost
+                                      ELSE COALESCE(total_cost, 0) + excluded.total_cost END,
+                    cost_count = cost_count + excluded.cost_count;
+            END
+        """)
+
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_invoices_stats_delete
+            AFTER DELETE ON invoices
+            WHEN OLD.vehicle_id IS NOT NULL
+            BEGIN{refresh_sql.format(ref='OLD')}
+            END
+        """)
+
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_invoices_stats_update
+            AFTER UPDATE OF invoice_no, vehicle_id, date, odometer_km, total ON invoices
+            BEGIN{refresh_sql.format(ref='OLD')}{refresh_sql.format(ref='NEW')}
+            END
+        """)
+
+        self._rebuild_vehicle_stats(cursor)
+
+    def _rebuild_vehicle_stats(self, cursor):
+        """בונה מחדש את כל טבלת vehicle_stats מתוך invoices"""
+        cursor.execute("DELETE FROM vehicle_stats")
+        cursor.execute("""
+            INSERT INTO vehicle_stats
+                (vehicle_id, last_service_date, current_km, total_services, total_cost, cost_count)
+            SELECT vehicle_id, MAX(date), MAX(odometer_km), COUNT(invoice_no), SUM(total), COUNT(total)
+            FROM invoices
+            WHERE vehicle_id IS NOT NULL
+            GROUP BY vehicle_id
+        """)
+
+    def _fts5_available(self, cursor):
+        """האם ה-SQLite המקומי תומך ב-FTS5 עם tokenizer מסוג trigram (SQLite 3.34+)"""
+        try:
+            cursor.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x, tokenize='trigram')")
+            cursor.execute("DROP TABLE temp._fts5_probe")
+            return True
+        except sqlite3.OperationalError:
+            return False
+
+    def _migration_003_invoice_search(self, cursor):
+        """
+        אינדקס חיפוש טקסט חופשי invoice_search (FTS5) - מסמך אחד לכל חשבונית:
+        מספר חשבונית, רכב, מוסך, לוחית רישוי, דגם ותיאורי כל שורות הפירוט.
+
+        tokenizer מסוג trigram: התאמת תת-מחרוזת כמו בחיפוש הקודם, בלי תלות בפיצול מילים -
+        בעברית מילית מחוברת ("השמן", "ובלמים") עדיין נמצאת בחיפוש "שמן" / "בלמים".
+
+        invoice_search_docs ממפה invoice_no -> rowid במסמכי ה-FTS, כך שהטריגרים
+        מעדכנים מסמך בודד לפי מפתח במקום סריקה של טבלת ה-FTS.
+        invoice_search_control.deferred מאפשר לטעינה מרוכזת להשהות את הטריגרים בתוך
+        הטרנזקציה שלה ולבנות את המסמכים המושפעים פעם אחת בסוף (ראה defer_invoice_search).
+        אם FTS5 / trigram לא זמינים - המיגרציה מדלגת ו-search_text חוזר ל-LIKE.
+        """
+        if not self._fts5_available(cursor):
+            print("⚠️ FTS5 trigram tokenizer not available - text search will use LIKE")
+            return
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS invoice_search_docs (
+                doc_id INTEGER PRIMARY KEY,
+                invoice_no TEXT NOT NULL UNIQUE
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS invoice_search_control (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                deferred INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.execute("INSERT OR IGNORE INTO invoice_search_control (id, deferred) VALUES (1, 0)")
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS invoice_search USING fts5(
+                invoice_no, vehicle_id, workshop, plate, make_model, descriptions,
+                tokenize = 'trigram'
+            )
+        """)
+
+        remove_sql = """
+                DELETE FROM invoice_search
+                WHERE rowid = (SELECT doc_id FROM invoice_search_docs WHERE invoice_no = {ref}.invoice_no);"""
+        refresh_sql = remove_sql + """
+                INSERT OR IGNORE INTO invoice_search_docs (invoice_no)
+                SELECT invoice_no FROM invoices WHERE invoice_no = {ref}.invoice_no;
+                INSERT INTO invoice_search
+                    (rowid, invoice_no, vehicle_id, workshop, plate, make_model, descriptions)
+                SELECT d.doc_id, i.invoice_no, i.vehicle_id, i.workshop, i.plate, i.make_model,
+                       (SELECT group_concat(l.description, ' ') FROM invoice_lines l
+                        WHERE l.invoice_no = i.invoice_no)
+                FROM invoices i
+                JOIN invoice_search_docs d ON d.invoice_no = i.invoice_no
+                WHERE i.invoice_no = {ref}.invoice_no;"""
+        drop_sql = remove_sql + """
+                DELETE FROM invoice_search_docs WHERE invoice_no = {ref}.invoice_no;"""
+
+        triggers = {
+            'trg_invoices_search_insert': ("AFTER INSERT ON invoices", refresh_sql.format(ref='NEW')),
+            'trg_invoices_search_update': (
+                "AFTER UPDATE OF invoice_no, vehicle_id, workshop, plate, make_model ON invoices",
+                drop_sql.format(ref='OLD') + refresh_sql.format(ref='NEW')
+            ),
+            'trg_invoices_search_delete': ("AFTER DELETE ON invoices", drop_sql.format(ref='OLD')),
+            'trg_invoice_lines_search_insert': ("AFTER INSERT ON invoice_lines", refresh_sql.format(ref='NEW')),
+            'trg_invoice_lines_search_update': (
+                "AFTER UPDATE OF invoice_no, description ON invoice_lines",
+                refresh_sql.format(ref='OLD') + refresh_sql.format(ref='NEW')
+            ),
+            'trg_invoice_lines_search_delete': ("AFTER DELETE ON invoice_lines", refresh_sql.format(ref='OLD')),
+        }
+        for trigger_name, (event, body) in triggers.items():
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {trigger_name}
+            {event}
+            WHEN (SELECT deferred FROM invoice_search_control) = 0
+            BEGIN{body}
+            END
+            """)
+
+        self._rebuild_invoice_search(cursor)
+
+    def _migration_004_change_log(self, cursor):
+        """
+        יומן שינויים change_log - שורה לכל INSERT / UPDATE / DELETE ב-invoices, invoice_lines,
+        vehicles ו-custom_alerts, נכתבת ע"י טריגרים (גם כתיבות שעוקפות את DatabaseManager).
+
+        version הוא AUTOINCREMENT - עולה תמיד ולא ממוחזר גם אחרי ניקוי היומן, כך שצרכן
+        ששמר את הגרסה האחרונה שראה מקבל ב-get_changes_since בדיוק את מה שהשתנה מאז.
+        change_log_state.pruned_through - הגרסה האחרונה שנמחקה ב-prune_change_log.
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS change_log (
+                version INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                row_key TEXT,
+                vehicle_id TEXT,
+                op TEXT NOT NULL CHECK (op IN ('insert', 'update', 'delete')),
+                changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS change_log_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                pruned_through INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.execute("INSERT OR IGNORE INTO change_log_state (id, pruned_through) VALUES (1, 0)")
+
+        for table_name in self.CHANGE_LOG_TABLES:
+            self.create_change_log_triggers(cursor, table_name)
+
+    def create_change_log_triggers(self, cursor, table_name):
+        """
+        יוצר את טריגרי change_log לטבלה. טבלה שעדיין לא קיימת (custom_alerts נוצרת בשימוש הראשון)
+        מדולגת - היא קוראת לזה בעצמה בעת היצירה. ללא change_log (מיגרציה 004 לא הוחלה) - לא עושה כלום.
+        """
+        if not self._table_exists(cursor, 'change_log') or not self._table_exists(cursor, table_name):
+            return
+
+        key_column, vehicle_expr = self.CHANGE_LOG_TABLES[table_name]
+        log_sql = """
+                INSERT INTO change_log (table_name, row_key, vehicle_id, op)
+                VALUES ('{table}', {ref}.{key}, {vehicle}, '{op}');"""
+
+        def entry(ref, op):
+            return log_sql.format(
+                table=table_name, ref=ref, key=key_column, vehicle=vehicle_expr.format(ref=ref), op=op
+            )
+
+        # עדכון שמשנה את המפתח נרשם גם כמחיקה של המפתח הישן
+        key_moved = f"""
+                INSERT INTO change_log (table_name, row_key, vehicle_id, op)
+                SELECT '{table_name}', OLD.{key_column}, {vehicle_expr.format(ref='OLD')}, 'delete'
+                WHERE OLD.{key_column} IS NOT NEW.{key_column};"""
+
+        triggers = {
+            f'trg_{table_name}_changes_insert': ("AFTER INSERT", entry('NEW', 'insert')),
+            f'trg_{table_name}_changes_update': ("AFTER UPDATE", key_moved + entry('NEW', 'update')),
+            f'trg_{table_name}_changes_delete': ("AFTER DELETE", entry('OLD', 'delete')),
+        }
+        for trigger_name, (event, body) in triggers.items():
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {trigger_name}
+            {event} ON {table_name}
+            BEGIN{body}
+            END
+            """)
+
+    def _migration_005_archive_partitions(self, cursor):
+        """
+        רישום מחיצות הארכיון השנתיות (ראה src/invoice_archive.py):
+        - archive_partitions: שנה -> קובץ הארכיון ומספר החשבוניות בו
+        - vehicle_archive_stats: הסטטיסטיקות של החשבוניות שהועברו לארכיון, באותו מבנה
+          כמו vehicle_stats, כך שסיכומי הרכב ממשיכים לכלול את כל ההיסטוריה
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS archive_partitions (
+                year INTEGER PRIMARY KEY,
+                path TEXT NOT NULL,
+                invoices INTEGER NOT NULL DEFAULT 0,
+                archived_at TEXT
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS vehicle_archive_stats (
+                vehicle_id TEXT PRIMARY KEY,
+                last_service_date TEXT,
+                current_km INTEGER,
+                total_services INTEGER NOT NULL DEFAULT 0,
+                total_cost REAL,
+                cost_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+
+    def _migration_006_epoch_days(self, cursor):
+        """
+        עמודות epoch-day מחושבות (ראה DAY_COLUMNS) + אינדקסים, כך שסינון טווחי תאריכים
+        והפרשי ימים רצים כחשבון שלמים ב-SQL במקום strptime / pd.to_datetime לכל שורה.
+        העמודות VIRTUAL - לא תופסות מקום בקובץ, מחושבות בקריאה ונשמרות רק באינדקסים.
+        """
+        self.add_day_columns(cursor)
+
+    def _migration_007_rule_alerts(self, cursor):
+        """
+        התראות ה-Rules Engine שחושבו, כדי שהטאב יקרא אותן במקום להעריך את כל הצי בכל ביקור:
+        - rule_alerts: ההתראות של כל רכב (JSON של ה-dict), לפי סדר ההערכה
+        - rule_alert_vehicles: טביעת האצבע של הקלט שממנו חושבו ההתראות של כל רכב -
+          גרסת change_log, hash של הספים, היום (לכללים תלויי זמן) וממוצע העלות של הצי.
+          רכב מוערך מחדש רק כשאחד מהם השתנה (ראה FleetRulesEngine.refresh_alerts)
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS rule_alerts (
+                vehicle_id TEXT NOT NULL,
+                alert_index INTEGER NOT NULL,
+                rule_name TEXT NOT NULL,
+                severity TEXT NOT NULL,
+                alert_json TEXT NOT NULL,
+                PRIMARY KEY (vehicle_id, alert_index)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS rule_alert_vehicles (
+                vehicle_id TEXT PRIMARY KEY,
+                change_version INTEGER NOT NULL,
+                rules_hash TEXT NOT NULL,
+                evaluated_day TEXT NOT NULL,
+                fleet_avg_cost REAL,
+                alert_count INTEGER NOT NULL DEFAULT 0,
+                evaluated_at TEXT
+            )
+        """)
+
+    def _migration_008_rule_definitions(self, cursor):
+        """
+        הגדרות הכללים של ה-Rules Engine (JSON לכל קבוצת כללים: ספים + תנאים), כך שארגון
+        יכול לשנות ספים ולהוסיף כללים בלי שינוי קוד. הכללים המובנים נכתבים ע"י
+        FleetRulesEngine בשימוש הראשון (DEFAULT_RULE_DEFINITIONS).
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS rule_definitions (
+                rule_group TEXT PRIMARY KEY,
+                position INTEGER NOT NULL DEFAULT 0,
+                definition_json TEXT NOT NULL,
+                updated_at TEXT
+            )
+        """)
+
+    def _migration_009_alert_events(self, cursor):
+        """
+        זרם האירועים של מתזמן הכללים (ראה RulesScheduler):
+        - rule_scheduler_runs: כל הרצה - מתי, כמה רכבים הוערכו וכמה אירועים נוצרו
+        - alert_events: התראה חדשה (new), התראה שנפתרה (resolved) או התראה שהחמירה
+          (escalated) ביחס להרצה הקודמת. האירוע האחרון של כל (רכב, כלל) הוא המצב
+          שמולו ההרצה הבאה משווה. delivered_at / delivery_attempts משמשים כ-outbox
+          למשלוח ב-webhook / אימייל - אירוע שלא נמסר נשלח שוב בהרצה הבאה
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS rule_scheduler_runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at TEXT NOT NULL,
+                finished_at TEXT,
+                vehicles INTEGER NOT NULL DEFAULT 0,
+                evaluated INTEGER NOT NULL DEFAULT 0,
+                events INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS alert_events (
+                event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id INTEGER NOT NULL,
+                event_type TEXT NOT NULL,
+                vehicle_id TEXT NOT NULL,
+                rule_name TEXT NOT NULL,
+                severity TEXT NOT NULL,
+                previous_severity TEXT,
+                alert_json TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                delivered_at TEXT,
+                delivery_attempts INTEGER NOT NULL DEFAULT 0,
+                delivery_error TEXT
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_alert_events_vehicle_rule
+            ON alert_events(vehicle_id, rule_name, event_id)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_alert_events_pending
+            ON alert_events(event_id) WHERE delivered_at IS NULL
+        """)
+
+    def _migration_010_service_timeline(self, cursor):
+        """
+        ציר הזמן של הטיפולים של כל רכב: view עם window functions שמחזיר לכל חשבונית
+        את הטיפול הקודם של אותו רכב (תאריך, קילומטראז'), את המרווח בק"מ ובימים ודגל
+        לטיפול האחרון. הסדר: תאריך, קילומטראז', rowid (חשבוניות בלי תאריך לא בציר).
+
+        view ולא טבלה - אין מה לתחזק בטריגרים: האינדקס (vehicle_id, date, odometer_km)
+        נותן את הסדר בלי מיון, ו-SQLite דוחף סינון לפי vehicle_id לתוך ה-view, כך
+        ששליפה של רכב אחד קוראת רק את החשבוניות שלו
+        """
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_invoices_vehicle_timeline
+            ON invoices(vehicle_id, date, odometer_km)
+        """)
+        cursor.execute("DROP VIEW IF EXISTS service_timeline")
+        cursor.execute("""
+            CREATE VIEW service_timeline AS
+            SELECT
+                rowid AS invoice_rowid,
+                invoice_no,
+                vehicle_id,
+                date,
+                _date_day AS date_day,
+                odometer_km,
+                kind,
+                total,
+                workshop,
+                ROW_NUMBER() OVER w AS service_number,
+                LAG(date) OVER w AS prev_date,
+                LAG(odometer_km) OVER w AS prev_odometer_km,
+                odometer_km - LAG(odometer_km) OVER w AS km_delta,
+                _date_day - LAG(_date_day) OVER w AS days_delta,
+                (LEAD(rowid) OVER w IS NULL) AS is_latest
+            FROM invoices
+            WHERE vehicle_id IS NOT NULL AND date IS NOT NULL
+            WINDOW w AS (PARTITION BY vehicle_id ORDER BY date, odometer_km, rowid)
+        """)
+
+    def add_day_columns(self, cursor):
+        """
+        מוסיף את עמודות ה-day החסרות (ואת האינדקסים שלהן) לעמודות תאריך קיימות.
+        עמודות תאריך שעדיין לא קיימות (vehicles לפני update_schema) מדולגות.
+        """
+        for table_name, day_columns in self.DAY_COLUMNS.items():
+            if not self._table_exists(cursor, table_name):
+                continue
+            cursor.execute(f"PRAGMA table_xinfo({table_name})")
+            existing = {col[1] for col in cursor.fetchall()}
+            for day_column, date_column in day_columns.items():
+                if day_column in existing or date_column not in existing:
+                    continue
+                expression = self.EPOCH_DAY_SQL.format(column=date_column)
+                cursor.execute(
+                    f"ALTER TABLE {table_name} ADD COLUMN {day_column} INTEGER "
+                    f"GENERATED ALWAYS AS ({expression}) VIRTUAL"
+                )
+
+        for index_name, (table_name, columns) in self.DAY_INDEXES.items():
+            if not self._table_exists(cursor, table_name):
+                continue
+            cursor.execute(f"PRAGMA table_xinfo({table_name})")
+            existing = {col[1] for col in cursor.fetchall()}
+            if all(col.strip() in existing for col in columns.split(',')):
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name}({columns})")
+
+    def _index_invoice_documents(self, cursor, refresh_only=False):
+        """
+        כותב מסמכי חיפוש לכל החשבוניות, או (refresh_only) רק לאלו שב-temp.invoice_search_refresh.
+        מסמכים קיימים של אותן חשבוניות חייבים להימחק לפני כן.
+        """
+        def only(column):
+            return f"AND {column} IN (SELECT invoice_no FROM temp.invoice_search_refresh)" if refresh_only else ""
+
+        cursor.execute(f"""
+            INSERT INTO invoice_search_docs (invoice_no)
+            SELECT invoice_no FROM invoices WHERE invoice_no IS NOT NULL {only('invoice_no')}
+        """)
+        cursor.execute(f"""
+            INSERT INTO invoice_search
+                (rowid, invoice_no, vehicle_id, workshop, plate, make_model, descriptions)
+            SELECT d.doc_id, i.invoice_no, i.vehicle_id, i.workshop, i.plate, i.make_model, l.descriptions
+            FROM invoice_search_docs d
+            JOIN invoices i ON i.invoice_no = d.invoice_no
+            LEFT JOIN (
+                SELECT invoice_no, group_concat(description, ' ') AS descriptions
+                FROM invoice_lines
+                WHERE 1 = 1 {only('invoice_no')}
+                GROUP BY invoice_no
+            ) l ON l.invoice_no = d.invoice_no
+            WHERE 1 = 1 {only('d.invoice_no')}
+        """)
+
+    def _rebuild_invoice_search(self, cursor):
+        """בונה מחדש את אינדקס החיפוש invoice_search מתוך invoices + invoice_lines"""
+        cursor.execute("DELETE FROM invoice_search")
+        cursor.execute("DELETE FROM invoice_search_docs")
+        self._index_invoice_documents(cursor)
+        cursor.execute("INSERT INTO invoice_search (invoice_search) VALUES ('optimize')")
+
+    def defer_invoice_search(self, cursor):
+        """
+        משהה את טריגרי אינדקס החיפוש עד refresh_invoice_search, בתוך הטרנזקציה הפתוחה של cursor
+        (חיבורים אחרים לא רואים את ההשהיה; rollback מבטל אותה).
+
+        Returns:
+            bool: False אם אין אינדקס חיפוש בדאטה בייס
+        """
+        if not self._table_exists(cursor, 'invoice_search_control'):
+            return False
+        cursor.execute("UPDATE invoice_search_control SET deferred = 1")
+        return True
+
+    def refresh_invoice_search(self, cursor, invoice_nos):
+        """
+        בונה מחדש את מסמכי החיפוש של החשבוניות שהשתנו (פעולה אחת לכל הטעינה במקום טריגר לכל שורה)
+        ומחזיר את הטריגרים לפעולה.
+        """
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS invoice_search_refresh (invoice_no TEXT PRIMARY KEY)")
+        cursor.execute("DELETE FROM temp.invoice_search_refresh")
+        cursor.executemany(
+            "INSERT OR IGNORE INTO temp.invoice_search_refresh (invoice_no) VALUES (?)",
+            ((invoice_no,) for invoice_no in invoice_nos)
+        )
+        cursor.execute("""
+            DELETE FROM invoice_search WHERE rowid IN (
+                SELECT d.doc_id FROM temp.invoice_search_refresh r
+                JOIN invoice_search_docs d ON d.invoice_no = r.invoice_no
+            )
+        """)
+        cursor.execute("""
+            DELETE FROM invoice_search_docs
+            WHERE invoice_no IN (SELECT invoice_no FROM temp.invoice_search_refresh)
+        """)
+        self._index_invoice_documents(cursor, refresh_only=True)
+        cursor.execute("DELETE FROM temp.invoice_search_refresh")
+        cursor.execute("UPDATE invoice_search_control SET deferred = 0")
+
+    def rebuild_invoice_search(self):
+        """
+        בונה מחדש את אינדקס החיפוש (למשל אחרי טעינה ישירה ל-SQLite שעקפה את הטריגרים).
+
+        Returns:
+            int: מספר החשבוניות באינדקס
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN")
+            self._rebuild_invoice_search(cursor)
+            conn.commit()
+            cursor.execute("SELECT COUNT(*) FROM invoice_search_docs")
+            return cursor.fetchone()[0]
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def rebuild_vehicle_stats(self):
+        """
+        בונה מחדש את vehicle_stats (למשל אחרי טעינה ישירה ל-SQLite שעקפה את הטריגרים).
+
+        Returns:
+            int: מספר הרכבים בטבלת הסיכום
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN")
+            self._rebuild_vehicle_stats(cursor)
+            conn.commit()
+            cursor.execute("SELECT COUNT(*) FROM vehicle_stats")
+            return cursor.fetchone()[0]
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FleetGuard database schema tools")
+    parser.add_argument(
+        'command', nargs='?', default='all',
+        choices=['all', 'migrate', 'analyze', 'rebuild-stats', 'rebuild-search', 'sample-data'],
+        help="all = update schema + migrations + sample data (default)"
+    )
+    args = parser.parse_args()
+
     updater = DatabaseSchemaUpdater()
-    updater.update_schema()
-    updater.populate_sample_data()
+    if args.command in ('all', 'sample-data'):
+        updater.update_schema()
+    if args.command in ('all', 'migrate'):
+        applied = updater.apply_migrations()
+        print(f"[SUCCESS] Schema version: {updater.get_schema_version()} ({len(applied)} migrations applied)")
+    if args.command == 'rebuild-stats':
+        updater.apply_migrations()
+        count = updater.rebuild_vehicle_stats()
+        print(f"[SUCCESS] vehicle_stats rebuilt for {count} vehicles!")
+    if args.command == 'rebuild-search':
+        updater.apply_migrations()
+        count = updater.rebuild_invoice_search()
+        print(f"[SUCCESS] invoice_search rebuilt for {count} invoices!")
+    if args.command == 'analyze':
+        updater.analyze()
+        print("[SUCCESS] ANALYZE completed!")
+    if args.command in ('all', 'sample-data'):
+        updater.populate_sample_data()
@@ -64,15 +64,14 @@ class FleetAnalyzer:
         תובנות אסטרטגיות - לשימוש Agent H
         """
         fleet_df = self.get_fleet_status_summary()
-        invoices_df = self.db.get_all_invoices()
 
         insights = {
             'reliability_by_model': self._analyze_reliability(fleet_df),
             'cost_efficiency': self._analyze_cost_efficiency(fleet_df),
             'replacement_recommendations': self._get_replacement_recommendations(fleet_df),
             'top_performers': self._get_top_performers(fleet_df),
-            'cost_trends': self._analyze_cost_trends(invoices_df),
-            'workshop_comparison': self._compare_workshops(invoices_df)
+            'cost_trends': self._analyze_cost_trends(),
+            'workshop_comparison': self._compare_workshops()
         }
 
         return insights
@@ -191,32 +190,24 @@ class FleetAnalyzer:
         return top_5[['vehicle_id', 'plate', 'make_model', 'annual_cost',
                       'total_services', 'performance_score']].to_dict('records')
 
-    def _analyze_cost_trends(self, invoices_df):
-        """ניתוח מגמות עלויות"""
-        if invoices_df.empty:
+    def _analyze_cost_trends(self):
+        """ניתוח מגמות עלויות (אגרגציה חודשית על המנוע האנליטי)"""
+        monthly_costs = self.db.get_monthly_costs()
+        if monthly_costs.empty:
             return {}
 
-        invoices_df['date'] = pd.to_datetime(invoices_df['date'])
-        invoices_df['year_month'] = invoices_df['date'].dt.to_period('M')
-
-        monthly_costs = invoices_df.groupby('year_month')['total'].sum().reset_index()
-        monthly_costs.columns = ['month', 'total_cost']
-        monthly_costs['month'] = monthly_costs['month'].astype(str)
-
         return {
             'monthly_trend': monthly_costs.to_dict('records'),
             'avg_monthly': monthly_costs['total_cost'].mean()
         }
 
-    def _compare_workshops(self, invoices_df):
+    def _compare_workshops(self):
         """השוואת מוסכים"""
-        if invoices_df.empty:
+        summary = self.db.get_invoice_cost_summary('workshop')
+        if summary.empty:
             return {}
 
-        by_workshop = invoices_df.groupby('workshop').agg({
-            'total': ['mean', 'sum', 'count']
-        }).reset_index()
-
+        by_workshop = summary.reset_index()[['workshop', 'mean', 'sum', 'count']]
         by_workshop.columns = ['workshop', 'avg_cost', 'total_cost', 'invoice_count']
         by_workshop = by_workshop.sort_values('avg_cost')
 
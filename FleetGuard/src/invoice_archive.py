@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Invoice Archive
+מחיצות ארכיון שנתיות לחשבוניות ישנות
+
+חשבוניות (ושורות הפירוט שלהן) ישנות מתאריך חיתוך עוברות מ-fleet.db לקובץ SQLite
+נפרד לכל שנה (archive/fleet_<year>.db ליד קובץ הדאטה בייס). הדאטה בייס ה"חם"
+נשאר קטן - השאילתות הרגילות (get_all_invoices, get_full_view...) רואות רק אותו.
+
+להיסטוריה מלאה connect() פותח חיבור שמצרף (ATTACH) את כל קבצי הארכיון ומגדיר
+את ה-views הזמניים invoices_all / invoice_lines_all (UNION ALL של כל המחיצות).
+ה-views זמניים (TEMP) כי view רגיל ב-main לא יכול להפנות לדאטה בייס מצורף.
+
+סטטיסטיקות הרכבים לא מאבדות את ההיסטוריה: הסכומים של מה שהועבר נצברים
+ב-vehicle_archive_stats ומצורפים ל-vehicle_stats בקריאה (ראה DatabaseManager).
+
+שימוש:
+    python -m src.invoice_archive --keep-months 36
+    python -m src.invoice_archive --before 2024-01-01
+"""
+
+import argparse
+import os
+import sqlite3
+from datetime import date, datetime
+
+from src.database_schema_update import DatabaseSchemaUpdater
+
+
+# הטבלאות שמועברות לארכיון, ושמות ה-views של ההיסטוריה המלאה
+ARCHIVE_TABLES = {'invoices': 'invoices_all', 'invoice_lines': 'invoice_lines_all'}
+
+
+class InvoiceArchive:
+    """
+    ניהול קבצי הארכיון השנתיים של קובץ דאטה בייס אחד.
+
+    Attributes:
+        db_path: נתיב לקובץ הדאטה בייס החם
+        archive_dir: תיקיית קבצי הארכיון (ברירת מחדל: archive/ ליד קובץ הדאטה בייס)
+    """
+
+    def __init__(self, db_path, archive_dir=None):
+        self.db_path = os.path.abspath(db_path)
+        self.archive_dir = archive_dir or os.path.join(os.path.dirname(self.db_path), 'archive')
+        self._prefix = os.path.splitext(os.path.basename(self.db_path))[0]
+
+    def archive_path(self, year):
+        """נתיב קובץ הארכיון של שנה"""
+        return os.path.join(self.archive_dir, f"{self._prefix}_{int(year)}.db")
+
+    def get_years(self):
+        """השנים שיש להן קובץ ארכיון (לפי archive_partitions), מהישנה לחדשה"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            if not self._has_partitions(conn.cursor()):
+                return []
+            rows = conn.execute("SELECT year FROM archive_partitions ORDER BY year").fetchall()
+            return [row[0] for row in rows]
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _has_partitions(cursor):
+        """האם טבלת archive_partitions קיימת (מיגרציה 005 הוחלה)"""
+        cursor.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'archive_partitions'")
+        return cursor.fetchone() is not None
+
+    # ===== Full History =====
+
+    def connect(self):
+        """
+        חיבור ל-fleet.db עם כל קבצי הארכיון מצורפים וה-views הזמניים invoices_all /
+        invoice_lines_all. בלי ארכיון ה-views הם פשוט הטבלאות החמות.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            years = [year for year in self.get_years() if os.path.exists(self.archive_path(year))]
+            limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+            if len(years) > limit:
+                raise Exception(f"יותר מדי קבצי ארכיון ({len(years)}) - SQLite מאפשר לצרף עד {limit}")
+
+            for year in years:
+                conn.execute(f"ATTACH DATABASE ? AS archive_{int(year)}", (self.archive_path(year),))
+
+            for table, view in ARCHIVE_TABLES.items():
+                columns = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+                selects = [f"SELECT {', '.join(columns)} FROM main.{table}"]
+                for year in years:
+                    schema = f"archive_{int(year)}"
+                    existing = {row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")}
+                    # עמודה שנוספה לטבלה החמה אחרי ההעברה לארכיון -> NULL
+                    projection = ', '.join(col if col in existing else f"NULL AS {col}" for col in columns)
+                    selects.append(f"SELECT {projection} FROM {schema}.{table}")
+                conn.execute(f"CREATE TEMP VIEW {view} AS " + " UNION ALL ".join(selects))
+            return conn
+        except Exception:
+            conn.close()
+            raise
+
+    # ===== Archiving =====
+
+    def archive_before(self, cutoff):
+        """
+        מעביר לארכיון את כל החשבוניות עם date < cutoff (ואת שורות הפירוט שלהן),
+        טרנזקציה אחת לכל שנה. הרצה חוזרת אחרי כישלון באמצע בטוחה (INSERT OR REPLACE).
+
+        Args:
+            cutoff: תאריך חיתוך ('YYYY-MM-DD' / date / datetime)
+
+        Returns:
+            dict: {שנה: מספר החשבוניות שהועברו}
+        """
+        if isinstance(cutoff, (date, datetime)):
+            cutoff = cutoff.strftime('%Y-%m-%d')
+        cutoff = str(cutoff)
+        try:
+            datetime.strptime(cutoff[:10], '%Y-%m-%d')
+        except ValueError:
+            raise ValueError(f"תאריך חיתוך לא תקין: {cutoff}")
+
+        updater = DatabaseSchemaUpdater(self.db_path)
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        cursor = conn.cursor()
+        moved = {}
+        try:
+            if not self._has_partitions(cursor):
+                raise Exception("טבלאות הארכיון לא קיימות (מיגרציה 005 לא הוחלה)")
+
+            cursor.execute("""
+                SELECT DISTINCT substr(date, 1, 4) FROM invoices
+                WHERE date < ? AND date IS NOT NULL ORDER BY 1
+            """, (cutoff,))
+            years = [int(row[0]) for row in cursor.fetchall() if row[0] and row[0].isdigit()]
+
+            os.makedirs(self.archive_dir, exist_ok=True)
+            for year in years:
+                moved[year] = self._archive_year(cursor, updater, year, cutoff)
+        finally:
+            conn.close()
+        return moved
+
+    def _archive_year(self, cursor, updater, year, cutoff):
+        """מעביר את החשבוניות של שנה אחת לקובץ הארכיון שלה"""
+        cursor.execute("ATTACH DATABASE ? AS archive", (self.archive_path(year),))
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                for table in ARCHIVE_TABLES:
+                    sql = cursor.execute(
+                        "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+                    ).fetchone()[0]
+                    cursor.execute(sql.replace("CREATE TABLE ", "CREATE TABLE IF NOT EXISTS archive.", 1))
+                cursor.execute("CREATE INDEX IF NOT EXISTS archive.idx_invoices_vehicle_date ON invoices(vehicle_id, date)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS archive.idx_invoice_lines_invoice_no ON invoice_lines(invoice_no, line_no)")
+
+                cursor.execute("CREATE TEMP TABLE IF NOT EXISTS archive_batch (invoice_no TEXT PRIMARY KEY)")
+                cursor.execute("DELETE FROM temp.archive_batch")
+                cursor.execute("""
+                    INSERT INTO temp.archive_batch (invoice_no)
+                    SELECT invoice_no FROM main.invoices
+                    WHERE date < ? AND substr(date, 1, 4) = ? AND invoice_no IS NOT NULL
+                """, (cutoff, str(year)))
+                count = cursor.execute("SELECT COUNT(*) FROM temp.archive_batch").fetchone()[0]
+
+                batch = "SELECT invoice_no FROM temp.archive_batch"
+                invoice_columns = self._shared_columns(cursor, 'invoices')
+                line_columns = self._shared_columns(cursor, 'invoice_lines')
+                cursor.execute(f"""
+                    INSERT OR REPLACE INTO archive.invoices ({invoice_columns})
+                    SELECT {invoice_columns} FROM main.invoices WHERE invoice_no IN ({batch})
+                """)
+                cursor.execute(f"DELETE FROM archive.invoice_lines WHERE invoice_no IN ({batch})")
+                cursor.execute(f"""
+                    INSERT INTO archive.invoice_lines ({line_columns})
+                    SELECT {line_columns} FROM main.invoice_lines WHERE invoice_no IN ({batch})
+                """)
+
+                # צבירת הסטטיסטיקות של מה שעובר, לפני שטריגרי vehicle_stats מוחקים אותן
+                cursor.execute(f"""
+                    INSERT INTO vehicle_archive_stats
+                        (vehicle_id, last_service_date, current_km, total_services, total_cost, cost_count)
+                    SELECT vehicle_id, MAX(date), MAX(odometer_km), COUNT(invoice_no), SUM(total), COUNT(total)
+                    FROM main.invoices
+                    WHERE invoice_no IN ({batch}) AND vehicle_id IS NOT NULL
+                    GROUP BY vehicle_id
+                    ON CONFLICT(vehicle_id) DO UPDATE SET
+                        last_service_date = MAX(COALESCE(last_service_date, excluded.last_service_date),
+                                                COALESCE(excluded.last_service_date, last_service_date)),
+                        current_km = MAX(COALESCE(current_km, excluded.current_km),
+                                         COALESCE(excluded.current_km, current_km)),
+                        total_services = total_services + excluded.total_services,
+                        total_cost = CASE WHEN excluded.total_cost IS NULL THEN total_cost
+                                          ELSE COALESCE(total_cost, 0) + excluded.total_cost END,
+                        cost_count = cost_count + excluded.cost_count
+                """)
+
+                archived = [row[0] for row in cursor.execute(batch).fetchall()]
+                search_deferred = updater.defer_invoice_search(cursor)
+                cursor.execute(f"DELETE FROM main.invoice_lines WHERE invoice_no IN ({batch})")
+                cursor.execute(f"DELETE FROM main.invoices WHERE invoice_no IN ({batch})")
+                if search_deferred:
+                    updater.refresh_invoice_search(cursor, archived)
+
+                cursor.execute("""
+                    INSERT INTO archive_partitions (year, path, invoices, archived_at)
+                    VALUES (?, ?, (SELECT COUNT(*) FROM archive.invoices), ?)
+                    ON CONFLICT(year) DO UPDATE SET
+                        path = excluded.path,
+                        invoices = excluded.invoices,
+                        archived_at = excluded.archived_at
+                """, (year, os.path.basename(self.archive_path(year)), datetime.now().isoformat()))
+
+                cursor.execute("DELETE FROM temp.archive_batch")
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+        finally:
+            cursor.execute("DETACH DATABASE archive")
+        return count
+
+    @staticmethod
+    def _shared_columns(cursor, table):
+        """העמודות שקיימות גם בטבלה החמה וגם בטבלת הארכיון"""
+        archived = {row[1] for row in cursor.execute(f"PRAGMA archive.table_info({table})")}
+        return ', '.join(
+            row[1] for row in cursor.execute(f"PRAGMA main.table_info({table})") if row[1] in archived
+        )
+
+
+if __name__ == "__main__":
+    from src.database_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="FleetGuard yearly invoice archive")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--before', help="archive invoices dated before YYYY-MM-DD")
+    group.add_argument('--keep-months', type=int, help="keep this many recent months in the live database")
+    parser.add_argument('--db', help="database path (default: data/database/fleet.db)")
+    args = parser.parse_args()
+
+    db = DatabaseManager(args.db)
+    db.apply_migrations()
+    if args.keep_months is not None:
+        moved = db.archive_invoices(keep_months=args.keep_months)
+    else:
+        moved = db.archive_invoices(before=args.before)
+    if not moved:
+        print("Nothing to archive")
+    for year, count in moved.items():
+        print(f"[OK] {year}: {count} invoices -> {InvoiceArchive(db.db_path).archive_path(year)}")
@@ -12,7 +12,7 @@ Date: December 2025
 
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import timedelta
 from typing import Dict, List, Tuple, Optional
 
 
@@ -134,66 +134,35 @@ class MaintenanceAnalytics:
         """
         try:
             fleet_df = self.db.get_fleet_overview()
-            invoices_df = self.db.get_all_invoices()
-
-            if fleet_df.empty or invoices_df.empty:
-                return {'error': 'No data available for analysis'}
 
-            # סיווג טיפולים לפי עיתוי
-            on_time_services = []
-            late_services = []
-            early_services = []
-
-            for _, vehicle in fleet_df.iterrows():
-                vehicle_id = vehicle['vehicle_id']
-                last_test = vehicle.get('last_test_date')
-                next_test = vehicle.get('next_test_date')
+            # עיתוי טיפולי routine ביחס לטסטים - הפרשי הימים מחושבים ב-SQL
+            timing = self.db.get_service_test_timing(kind='routine')
 
-                if not last_test or not next_test:
-                    continue
+            if fleet_df.empty or timing.empty:
+                return {'error': 'No data available for analysis'}
 
-                try:
-                    last_test_dt = datetime.strptime(str(last_test), '%Y-%m-%d')
-                    next_test_dt = datetime.strptime(str(next_test), '%Y-%m-%d')
-                except (ValueError, TypeError):
-                    continue
+            timing = timing[timing['vehicle_id'].isin(fleet_df['vehicle_id'])]
 
-                # קבלת טיפולי routine
-                vehicle_invoices = invoices_df[
-                    (invoices_df['vehicle_id'] == vehicle_id) &
-                    (invoices_df['kind'] == 'routine')
-                ]
-
-                for _, invoice in vehicle_invoices.iterrows():
-                    try:
-                        invoice_date = datetime.strptime(str(invoice['date']), '%Y-%m-%d')
-                        invoice_cost = invoice['total']
-
-                        days_after_last = (invoice_date - last_test_dt).days
-                        days_before_next = (next_test_dt - invoice_date).days
-
-                        # סיווג לפי עיתוי
-                        if days_after_last >= 0:  # אחרי הטיפול האחרון
-                            if days_before_next >= -30:  # עד 30 יום איחור
-                                on_time_services.append({
-                                    'vehicle_id': vehicle_id,
-                                    'cost': invoice_cost,
-                                    'delay_days': -days_before_next if days_before_next < 0 else 0
-                                })
-                            else:  # יותר מ-30 יום איחור
-                                late_services.append({
-                                    'vehicle_id': vehicle_id,
-                                    'cost': invoice_cost,
-                                    'delay_days': -days_before_next
-                                })
-                        else:  # לפני הטיפול האחרון (מוקדם)
-                            early_services.append({
-                                'vehicle_id': vehicle_id,
-                                'cost': invoice_cost,
-                                'early_days': abs(days_after_last)
-                            })
-                    except (ValueError, TypeError):
-                        continue
+            # סיווג טיפולים לפי עיתוי
+            after_last = timing['days_after_last_test'] >= 0  # אחרי הטיפול האחרון
+            within_grace = timing['days_before_next_test'] >= -30  # עד 30 יום איחור
+            on_time_df = timing[after_last & within_grace]
+            late_df = timing[after_last & ~within_grace]
+            early_df = timing[~after_last]  # לפני הטיפול האחרון (מוקדם)
+
+            on_time_services = [
+                {'vehicle_id': row.vehicle_id, 'cost': row.total,
+                 'delay_days': max(-row.days_before_next_test, 0)}
+                for row in on_time_df.itertuples(index=False)
+            ]
+            late_services = [
+                {'vehicle_id': row.vehicle_id, 'cost': row.total, 'delay_days': -row.days_before_next_test}
+                for row in late_df.itertuples(index=False)
+            ]
+            early_services = [
+                {'vehicle_id': row.vehicle_id, 'cost': row.total, 'early_days': abs(row.days_after_last_test)}
+                for row in early_df.itertuples(index=False)
+            ]
 
             # חישוב סטטיסטיקות
             on_time_costs = [s['cost'] for s in on_time_services] if on_time_services else [0]
@@ -258,6 +227,7 @@ class MaintenanceAnalytics:
                 return {'error': 'No data available for analysis'}
 
             vehicle_profiles = []
+            compliance_scores = self._calculate_compliance_scores()
 
             for _, vehicle in fleet_df.iterrows():
                 vehicle_id = vehicle['vehicle_id']
@@ -269,7 +239,7 @@ class MaintenanceAnalytics:
                     continue
 
                 # חישוב compliance score (מ-driver analysis)
-                compliance = self._calculate_vehicle_compliance(vehicle, invoices_df)
+                compliance = compliance_scores.get(vehicle_id, 50.0)
 
                 # סיווג לקטגוריות
                 if compliance >= 70:
@@ -329,47 +299,15 @@ class MaintenanceAnalytics:
         except Exception as e:
             return {'error': f'Analysis failed: {str(e)}'}
 
-    def _calculate_vehicle_compliance(self, vehicle_data, invoices_df) -> float:
-        """חישוב אחוז עמידה בזמנים לרכב בודד"""
-        try:
-            vehicle_id = vehicle_data['vehicle_id']
-            last_test = vehicle_data.get('last_test_date')
-            next_test = vehicle_data.get('next_test_date')
-
-            if not last_test or not next_test:
-                return 50.0
-
-            last_test_dt = datetime.strptime(str(last_test), '%Y-%m-%d')
-            next_test_dt = datetime.strptime(str(next_test), '%Y-%m-%d')
-
-            vehicle_invoices = invoices_df[
-                (invoices_df['vehicle_id'] == vehicle_id) &
-                (invoices_df['kind'] == 'routine')
-            ]
-
-            if vehicle_invoices.empty:
-                return 50.0
-
-            total = 0
-            on_time = 0
-
-            for _, invoice in vehicle_invoices.iterrows():
-                try:
-                    invoice_date = datetime.strptime(str(invoice['date']), '%Y-%m-%d')
-                    days_after_last = (invoice_date - last_test_dt).days
-                    days_before_next = (next_test_dt - invoice_date).days
-
-                    if days_after_last >= 0:
-                        total += 1
-                        if days_before_next >= -30:
-                            on_time += 1
-                except:
-                    continue
-
-            return (on_time / total * 100) if total > 0 else 50.0
-
-        except:
-            return 50.0
+    def _calculate_compliance_scores(self) -> Dict[str, float]:
+        """
+        אחוז עמידה בזמנים לכל רכב: מתוך טיפולי ה-routine שאחרי הטסט האחרון,
+        כמה בוצעו עד 30 יום אחרי הטסט הבא. רכב בלי תאריכי טסט / טיפולים -> חסר (50.0 ברירת מחדל)
+        """
+        timing = self.db.get_service_test_timing(kind='routine')
+        after_last = timing[timing['days_after_last_test'] >= 0]
+        grouped = (after_last['days_before_next_test'] >= -30).groupby(after_last['vehicle_id'])
+        return (grouped.sum() / grouped.count() * 100).to_dict()
 
     def _interpret_km_correlation(self, correlation: float) -> str:
         """פרשנות למתאם בין ק"מ לטיפולים"""
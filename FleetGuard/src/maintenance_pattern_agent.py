@@ -3,7 +3,6 @@ Maintenance Pattern Agent - CrewAI
 מזהה דפוסי תקלות לפי קילומטראז' נסוע
 """
 
-import pandas as pd
 from datetime import datetime
 from src.database_manager import DatabaseManager
 
@@ -28,16 +27,15 @@ class MaintenancePatternAgent:
             dict: תוצאות ניתוח עם דפוסים מזוהים
         """
         # שליפת נתונים
+        # typed=True - התאריכים כבר מגיעים כ-datetime64 מהטעינה
         if vehicle_id:
-            invoices = self.db.get_vehicle_history(vehicle_id)
+            invoices = self.db.get_vehicle_history(vehicle_id, typed=True)
         else:
-            invoices = self.db.get_all_invoices()
+            invoices = self.db.get_all_invoices(typed=True)
         
         if invoices.empty:
             return {"error": "אין נתונים לניתוח"}
         
-        # המרת תאריכים
-        invoices['date'] = pd.to_datetime(invoices['date'])
         invoices = invoices.sort_values('date')
         
         # חישוב קילומטראז' בין טיפולים
@@ -46,7 +44,7 @@ class MaintenancePatternAgent:
             'routine_services': self._analyze_routine_patterns(invoices),
             'major_repairs': self._analyze_major_repairs(invoices),
             'cost_trends': self._analyze_cost_trends(invoices),
-            'km_intervals': self._analyze_km_intervals(invoices)
+            'km_intervals': self._analyze_km_intervals(vehicle_id)
         }
         
         return patterns
@@ -112,7 +110,7 @@ class MaintenancePatternAgent:
             return {"message": "לא נמצאו תקלות גדולות"}
         
         # קבוצת לפי סוג תקלה
-        by_kind = major.groupby('kind').agg({
+        by_kind = major.groupby('kind', observed=True).agg({
             'odometer_km': ['min', 'max', 'mean'],
             'total': 'mean'
         }).round(0)
@@ -147,32 +145,18 @@ class MaintenancePatternAgent:
             "trend": "עולה" if len(cost_by_km_range) > 1 and cost_by_km_range[-1]['avg_cost'] > cost_by_km_range[0]['avg_cost'] else "יציב"
         }
     
-    def _analyze_km_intervals(self, invoices):
-        """מנתח מרווחי קילומטראז' בין טיפולים"""
-        invoices_sorted = invoices.sort_values(['vehicle_id', 'odometer_km'])
-        
+    def _analyze_km_intervals(self, vehicle_id=None):
+        """מנתח מרווחי קילומטראז' בין טיפולים (לפי סדר הטיפולים ב-service_timeline)"""
+        intervals = self.db.get_service_intervals(vehicle_id)
+
         intervals_by_vehicle = {}
-        
-        for vehicle_id in invoices_sorted['vehicle_id'].unique():
-            vehicle_invoices = invoices_sorted[invoices_sorted['vehicle_id'] == vehicle_id]
-            
-            if len(vehicle_invoices) < 2:
-                continue
-            
-            intervals = []
-            for i in range(1, len(vehicle_invoices)):
-                prev_km = vehicle_invoices.iloc[i-1]['odometer_km']
-                curr_km = vehicle_invoices.iloc[i]['odometer_km']
-                interval = curr_km - prev_km
-                intervals.append(interval)
-            
-            if intervals:
-                intervals_by_vehicle[vehicle_id] = {
-                    'avg_interval': round(sum(intervals) / len(intervals)),
-                    'min_interval': min(intervals),
-                    'max_interval': max(intervals)
-                }
-        
+        for row in intervals.itertuples(index=False):
+            intervals_by_vehicle[row.vehicle_id] = {
+                'avg_interval': round(row.avg_km_interval),
+                'min_interval': int(row.min_km_interval),
+                'max_interval': int(row.max_km_interval)
+            }
+
         return intervals_by_vehicle
     
     def get_maintenance_recommendations(self, vehicle_id):
@@ -35,8 +35,9 @@ class MLPredictor:
             # טעינת מודל
             if model_path.exists():
                 try:
-                    # Try joblib first (preferred for sklearn models)
-                    self.model = joblib.load(model_path)
+                    # Try joblib first (preferred for sklearn models).
+                    # mmap_mode: מערכי numpy של המודל ממופים מהדיסק במקום להיטען לזיכרון
+                    self.model = joblib.load(model_path, mmap_mode='r')
                     print(f"[OK] Model loaded: {model_path}")
                 except Exception as e:
                     # Fallback to pickle
@@ -60,12 +60,10 @@ class PredictiveMaintenanceAgent:
         if last_service:
             days_since_service = (datetime.now() - last_service).days
             if days_since_service > 0:
-                history = self.db.get_vehicle_history(vehicle_id)
-                if len(history) >= 2:
-                    km_driven = history['odometer_km'].iloc[0] - history['odometer_km'].iloc[-1]
-                    total_days = (pd.to_datetime(history['date'].iloc[0]) -
-                                pd.to_datetime(history['date'].iloc[-1])).days
-                    km_per_day = km_driven / total_days if total_days > 0 else 30
+                # ק"מ וימים במרווחים שבין הטיפולים (service_timeline)
+                intervals = self.db.get_service_intervals(vehicle_id)
+                if not intervals.empty and intervals['interval_days'].iloc[0] > 0:
+                    km_per_day = float(intervals['interval_km'].iloc[0] / intervals['interval_days'].iloc[0])
                 else:
                     km_per_day = 30  # ברירת מחדל
             else:
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Query Result Cache
+מטמון תוצאות שאילתות (DataFrames) עבור DatabaseManager
+
+המטמון מבוטל אוטומטית בכל שינוי בדאטה בייס, לפי PRAGMA data_version:
+חיבור "בודק" ייעודי שאף פעם לא כותב רואה את data_version משתנה בכל commit
+של כל חיבור אחר - באותו תהליך (DatabaseManager, סקריפטים) או בתהליך אחר.
+הזיכרון חסום (בתים + מספר רשומות) עם פינוי LRU.
+"""
+
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class QueryCache:
+    """
+    מטמון LRU של DataFrames לקובץ SQLite יחיד.
+
+    Attributes:
+        db_path: נתיב לקובץ הדאטה בייס
+        max_bytes: תקרת זיכרון כוללת לתוצאות השמורות
+        max_entries: מספר תוצאות מקסימלי
+    """
+
+    def __init__(self, db_path, max_bytes=64 * 1024 * 1024, max_entries=256):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()  # key -> (DataFrame, size_bytes)
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+        self._probe = None
+        self._probe_file_id = None
+        self._probe_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # ===== Data Version =====
+
+    def data_version(self):
+        """
+        מחזיר מזהה גרסה לנתונים הנוכחיים: (זהות הקובץ, PRAGMA data_version).
+        זהות הקובץ (inode) מזהה גם מחיקה ויצירה מחדש של fleet.db (למשל generate_data.py).
+        """
+        stat = os.stat(self.db_path)
+        file_id = (stat.st_dev, stat.st_ino)
+
+        with self._probe_lock:
+            if self._probe is None or file_id != self._probe_file_id:
+                if self._probe is not None:
+                    self._probe.close()
+                self._probe = sqlite3.connect(self.db_path, check_same_thread=False)
+                self._probe_file_id = file_id
+            version = self._probe.execute("PRAGMA data_version").fetchone()[0]
+
+        return file_id, version
+
+    # ===== Cache Operations =====
+
+    def get(self, key, version):
+        """מחזיר תוצאה שמורה עבור key אם היא מאותה גרסת נתונים, אחרת None"""
+        with self._lock:
+            if version != self._version:
+                self._reset(version)
+                self.misses += 1
+                return None
+
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, version, df):
+        """שומר תוצאה (אם היא עדיין מהגרסה הנוכחית ולא גדולה מכל המטמון)"""
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if version != self._version:
+                return
+
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+            self._entries[key] = (df, size)
+            self._bytes += size
+
+            # פינוי LRU עד שחוזרים לתקרות
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def clear(self):
+        """מרוקן את המטמון"""
+        with self._lock:
+            self._reset(self._version)
+
+    def _reset(self, version):
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self._bytes = 0
+        self._version = version
+
+    def stats(self):
+        """סטטיסטיקות שימוש במטמון"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+                'invalidations': self.invalidations
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_query_cache(db_path, max_bytes=64 * 1024 * 1024, max_entries=256):
+    """
+    מחזיר את המטמון המשותף לקובץ הדאטה בייס (משותף לכל מופעי DatabaseManager בתהליך).
+    התקרות נקבעות ביצירה הראשונה.
+    """
+    key = os.path.abspath(db_path)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = QueryCache(key, max_bytes=max_bytes, max_entries=max_entries)
+            _caches[key] = cache
+        return cache
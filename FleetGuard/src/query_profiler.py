@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""
+Query Profiler
+מדידת ביצועים (opt-in) למתודות של DatabaseManager
+
+לכל קריאה למתודה נמדדים: זמן, מספר שורות, זיכרון ה-DataFrame ומי קרא לה (קובץ:פונקציה:שורה).
+לכל מתודה נשמר חלון מתגלגל של זמנים (p50 / p95 / p99), וקריאות שחורגות מהסף
+נכתבות ל-slow query log (JSON lines) יחד עם EXPLAIN QUERY PLAN של השאילתות שהריצו.
+
+הפעלה: DB_PROFILE_ENABLED=true (או get_query_profiler().enable())
+סף: DB_SLOW_QUERY_MS (ברירת מחדל 250)
+דוח: python -m src.query_profiler
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import inspect
+import argparse
+import functools
+import threading
+from collections import deque, Counter
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from src.utils.path_resolver import path_resolver
+
+
+# קבצים שלא נחשבים "קורא" (מחפשים את הקוד שמחוץ לשכבת הדאטה בייס)
+_INTERNAL_FILES = ('database_manager.py', 'query_profiler.py', 'query_cache.py', 'database_pool.py')
+
+
+class QueryProfiler:
+    """
+    אוסף מדידות לכל מתודה.
+
+    Attributes:
+        enabled: האם המדידה פעילה
+        slow_ms: סף (מילישניות) לכתיבה ל-slow query log
+        window: גודל החלון המתגלגל לחישוב אחוזונים
+        slow_log_path: קובץ ה-slow query log (JSON lines)
+        snapshot_path: קובץ JSON עם הדוח האחרון (נקרא ע"י ה-CLI)
+    """
+
+    SNAPSHOT_EVERY = 200  # שמירת דוח לקובץ כל N מדידות
+
+    def __init__(self, enabled=False, slow_ms=250, window=1000, slow_log_path=None, snapshot_path=None):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.window = window
+        self.slow_log_path = slow_log_path or str(path_resolver.get_path('logs/slow_queries.jsonl'))
+        self.snapshot_path = snapshot_path or str(path_resolver.get_path('logs/query_stats.json'))
+
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._records = 0
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        """מאפס את כל המדידות"""
+        with self._lock:
+            self._stats = {}
+            self._records = 0
+
+    # ===== Recording =====
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def note_sql(self, query, params=None):
+        """נקרא מ-DatabaseManager עם כל שאילתה שרצה, לשיוך לקריאה הפעילה (עבור EXPLAIN)"""
+        if not self.enabled:
+            return
+        # משויך לכל הקריאות הפעילות (גם מתודה עוטפת כמו page_full_view -> page_rows)
+        for statements in self._stack():
+            statements.append((query, params))
+
+    def profile_call(self, manager, method_name, func, args, kwargs):
+        """מריץ מתודה של DatabaseManager ומודד אותה"""
+        caller = self._find_caller()
+        statements = []
+        stack = self._stack()
+        stack.append(statements)
+        start = time.perf_counter()
+        try:
+            result = func(manager, *args, **kwargs)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            stack.pop()
+
+        if inspect.isgenerator(result):
+            return self._profile_generator(manager, method_name, result, elapsed_ms, caller, statements)
+
+        self._record(manager, method_name, elapsed_ms, result, caller, statements)
+        return result
+
+    def _profile_generator(self, manager, method_name, generator, elapsed_ms, caller, statements):
+        """מודד generator (iter_*) לאורך כל האיטרציה - נרשם כשהוא מסתיים"""
+        rows, nbytes = 0, 0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    chunk = next(generator)
+                except StopIteration:
+                    elapsed_ms += (time.perf_counter() - start) * 1000
+                    break
+                elapsed_ms += (time.perf_counter() - start) * 1000
+                chunk_rows, chunk_bytes = self._measure(chunk)
+                rows += chunk_rows or 0
+                nbytes += chunk_bytes or 0
+                yield chunk
+        finally:
+            self._record(manager, method_name, elapsed_ms, None, caller, statements, rows=rows, nbytes=nbytes)
+
+    @staticmethod
+    def _measure(result):
+        """(שורות, בתים) של תוצאת מתודה"""
+        if isinstance(result, pd.DataFrame):
+            return len(result), int(result.memory_usage(deep=True).sum())
+        if isinstance(result, tuple) and result and isinstance(result[0], pd.DataFrame):
+            return QueryProfiler._measure(result[0])
+        if isinstance(result, (list, set)):
+            return len(result), None
+        if isinstance(result, dict) and 'success' in result:
+            return result.get('success'), None
+        return None, None
+
+    def _record(self, manager, method_name, elapsed_ms, result, caller, statements, rows=None, nbytes=None):
+        if result is not None:
+            rows, nbytes = self._measure(result)
+
+        with self._lock:
+            stats = self._stats.get(method_name)
+            if stats is None:
+                stats = self._stats[method_name] = {
+                    'times': deque(maxlen=self.window),
+                    'calls': 0, 'total_ms': 0.0, 'rows': 0, 'bytes': 0, 'slow': 0,
+                    'callers': Counter()
+                }
+            stats['times'].append(elapsed_ms)
+            stats['calls'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['rows'] += rows or 0
+            stats['bytes'] += nbytes or 0
+            stats['callers'][caller] += 1
+            is_slow = elapsed_ms >= self.slow_ms
+            if is_slow:
+                stats['slow'] += 1
+            self._records += 1
+            save_snapshot = self._records % self.SNAPSHOT_EVERY == 0
+
+        if is_slow:
+            self._log_slow(manager, method_name, elapsed_ms, rows, nbytes, caller, statements)
+        if save_snapshot:
+            self.save_snapshot()
+
+    @staticmethod
+    def _find_caller():
+        """הפריים הראשון מחוץ לשכבת הדאטה בייס: 'קובץ:פונקציה:שורה'"""
+        frame = sys._getframe(2)
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if not filename.endswith(_INTERNAL_FILES) and 'functools' not in filename:
+                return f"{os.path.basename(filename)}:{frame.f_code.co_name}:{frame.f_lineno}"
+            frame = frame.f_back
+        return 'unknown'
+
+    # ===== Slow Query Log =====
+
+    def _log_slow(self, manager, method_name, elapsed_ms, rows, nbytes, caller, statements):
+        entry = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'method': method_name,
+            'ms': round(elapsed_ms, 2),
+            'rows': rows,
+            'bytes': nbytes,
+            'caller': caller,
+            'queries': [
+                {
+                    'sql': ' '.join(query.split()),
+                    'params': [str(p) for p in (params or [])][:20],
+                    'plan': self.explain(manager.db_path, query, params)
+                }
+                for query, params in statements
+            ]
+        }
+        try:
+            os.makedirs(os.path.dirname(self.slow_log_path), exist_ok=True)
+            with open(self.slow_log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        except OSError as e:
+            print(f"⚠️ Slow query log write failed: {str(e)}")
+
+    @staticmethod
+    def explain(db_path, query, params=None):
+        """EXPLAIN QUERY PLAN לשאילתה (רשימת שורות התוכנית)"""
+        try:
+            conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+            try:
+                rows = conn.execute(f"EXPLAIN QUERY PLAN {query}", list(params or [])).fetchall()
+            finally:
+                conn.close()
+            return [row[-1] for row in rows]
+        except sqlite3.Error as e:
+            return [f"EXPLAIN failed: {str(e)}"]
+
+    # ===== Reporting =====
+
+    def report(self):
+        """
+        דוח לפי מתודה, ממוין לפי זמן כולל (המתודות שהכי כדאי לשפר ראשונות).
+
+        Returns:
+            DataFrame: method, calls, total_ms, p50_ms, p95_ms, p99_ms, max_ms,
+                       avg_rows, avg_kb, slow, top_caller
+        """
+        with self._lock:
+            rows = []
+            for method_name, stats in self._stats.items():
+                times = np.fromiter(stats['times'], dtype=float)
+                p50, p95, p99 = np.percentile(times, [50, 95, 99])
+                rows.append({
+                    'method': method_name,
+                    'calls': stats['calls'],
+                    'total_ms': round(stats['total_ms'], 1),
+                    'p50_ms': round(p50, 2),
+                    'p95_ms': round(p95, 2),
+                    'p99_ms': round(p99, 2),
+                    'max_ms': round(times.max(), 2),
+                    'avg_rows': round(stats['rows'] / stats['calls'], 1),
+                    'avg_kb': round(stats['bytes'] / stats['calls'] / 1024, 1),
+                    'slow': stats['slow'],
+                    'top_caller': stats['callers'].most_common(1)[0][0]
+                })
+        columns = ['method', 'calls', 'total_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms',
+                   'avg_rows', 'avg_kb', 'slow', 'top_caller']
+        return pd.DataFrame(rows, columns=columns).sort_values('total_ms', ascending=False).reset_index(drop=True)
+
+    def save_snapshot(self):
+        """שומר את הדוח הנוכחי ל-snapshot_path (עבור ה-CLI)"""
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+            snapshot = {
+                'saved_at': datetime.now().isoformat(timespec='seconds'),
+                'pid': os.getpid(),
+                'slow_ms': self.slow_ms,
+                'methods': self.report().to_dict(orient='records')
+            }
+            with open(self.snapshot_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"⚠️ Query stats snapshot failed: {str(e)}")
+
+    def read_slow_log(self, limit=50):
+        """מחזיר את limit הרשומות האחרונות מה-slow query log"""
+        if not os.path.exists(self.slow_log_path):
+            return []
+        with open(self.slow_log_path, encoding='utf-8') as f:
+            lines = deque(f, maxlen=limit)
+        return [json.loads(line) for line in lines if line.strip()]
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_query_profiler():
+    """מחזיר את ה-QueryProfiler של התהליך (מוגדר לפי DB_PROFILE_ENABLED / DB_SLOW_QUERY_MS)"""
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = QueryProfiler(
+                enabled=os.getenv('DB_PROFILE_ENABLED', 'false').lower() == 'true',
+                slow_ms=float(os.getenv('DB_SLOW_QUERY_MS', '250'))
+            )
+        return _profiler
+
+
+def profile_methods(cls):
+    """
+    עוטף את כל המתודות הציבוריות של cls במדידה, פרט לאלו שב-cls.PROFILE_EXCLUDE.
+    כשהמדידה כבויה העלות היא בדיקת דגל אחת לכל קריאה.
+    """
+    profiler = get_query_profiler()
+    exclude = getattr(cls, 'PROFILE_EXCLUDE', set())
+
+    def wrap(name, func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if not profiler.enabled:
+                return func(self, *args, **kwargs)
+            return profiler.profile_call(self, name, func, args, kwargs)
+        return wrapper
+
+    for name, member in list(vars(cls).items()):
+        if name.startswith('_') or name in exclude or not inspect.isfunction(member):
+            continue
+        setattr(cls, name, wrap(name, member))
+    return cls
+
+
+def print_report(snapshot_path=None, slow_log_path=None, top=20, slow=10):
+    """מדפיס את הדוח האחרון שנשמר ואת השאילתות האיטיות האחרונות"""
+    profiler = QueryProfiler(snapshot_path=snapshot_path, slow_log_path=slow_log_path)
+
+    if os.path.exists(profiler.snapshot_path):
+        with open(profiler.snapshot_path, encoding='utf-8') as f:
+            snapshot = json.load(f)
+        print(f"📊 Query stats (saved {snapshot['saved_at']}, pid {snapshot['pid']}, slow >= {snapshot['slow_ms']}ms)")
+        report = pd.DataFrame(snapshot['methods'])
+        with pd.option_context('display.max_columns', None, 'display.width', 200):
+            print(report.head(top).to_string(index=False) if not report.empty else "(no calls recorded)")
+    else:
+        print(f"⚠️ No query stats snapshot at {profiler.snapshot_path} (run with DB_PROFILE_ENABLED=true)")
+
+    entries = profiler.read_slow_log(limit=slow)
+    print(f"\n🐢 Last {len(entries)} slow queries ({profiler.slow_log_path})")
+    for entry in entries:
+        print(f"\n[{entry['timestamp']}] {entry['method']} {entry['ms']}ms rows={entry['rows']} caller={entry['caller']}")
+        for query in entry['queries']:
+            print(f"  SQL: {query['sql'][:200]}")
+            for step in query['plan']:
+                print(f"    -> {step}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FleetGuard query profiler report")
+    parser.add_argument('--snapshot', help="query stats snapshot (default: logs/query_stats.json)")
+    parser.add_argument('--slow-log', help="slow query log (default: logs/slow_queries.jsonl)")
+    parser.add_argument('--top', type=int, default=20, help="methods to show")
+    parser.add_argument('--slow', type=int, default=10, help="slow queries to show")
+    args = parser.parse_args()
+    print_report(args.snapshot, args.slow_log, top=args.top, slow=args.slow)
@@ -14,12 +14,92 @@ Author: FleetGuard AI System
 Date: 2025-12-18
 """
 
+import hashlib
+import json
+import os
+import zlib
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import numpy as np
 
 
+# Built-in rules as declarative definitions, one group per threshold category.
+# Each alert's `when` is a list of [metric, op, operand] conditions (all must hold), where
+# metric is a column of DatabaseManager.RULE_INPUTS_CTE and operand is a literal,
+# "$param" (a threshold of the group), or {"metric"|"param"|"value": ..., "times"|"plus": operand}.
+# Organizations can edit thresholds (update_rule_threshold) or store extra groups
+# (save_rule_definition) - definitions live in the rule_definitions table.
+DEFAULT_RULE_DEFINITIONS = [
+    {
+        'group': 'maintenance_overdue',
+        'params': {
+            'km_threshold': 10000,      # Max km in the latest service interval
+            'days_threshold': 180       # Max days since last service
+        },
+        'alerts': [
+            {'rule_name': 'maintenance_overdue_km', 'severity': 'URGENT',
+             'when': [['has_service', '=', 1], ['km_since_service', '>', '$km_threshold']]},
+            {'rule_name': 'maintenance_overdue_time', 'severity': 'URGENT',
+             'when': [['has_service', '=', 1], ['days_since_service', '>', '$days_threshold']]}
+        ]
+    },
+    {
+        'group': 'cost_anomaly',
+        'params': {
+            'multiplier': 2.0           # Alert if cost > 2x average
+        },
+        'alerts': [
+            {'rule_name': 'cost_anomaly', 'severity': 'WARNING',
+             'when': [['has_invoices', '=', 1], ['avg_service_cost', 'not_null', None],
+                      ['recent_cost', '>', {'metric': 'anomaly_avg_cost', 'times': '$multiplier'}]]}
+        ]
+    },
+    {
+        'group': 'retirement_warning',
+        'params': {
+            'days_threshold': 90,       # Warn if retirement < 90 days
+            'age_years': 10,            # Warn if vehicle age > 10 years
+            'km_threshold': 300000      # Warn if total km > 300,000
+        },
+        'alerts': [
+            {'rule_name': 'retirement_approaching', 'severity': 'INFO',
+             'when': [['days_until_retirement', '<', '$days_threshold']]},
+            {'rule_name': 'vehicle_too_old', 'severity': 'WARNING',
+             'when': [['vehicle_age_years', '>', '$age_years']]},
+            {'rule_name': 'high_mileage', 'severity': 'WARNING',
+             'when': [['current_km_value', '>', '$km_threshold']]}
+        ]
+    },
+    {
+        'group': 'high_utilization',
+        'params': {
+            'km_per_month_threshold': 3000  # High usage threshold
+        },
+        'alerts': [
+            {'rule_name': 'high_utilization', 'severity': 'INFO',
+             'when': [['km_per_month', '>', '$km_per_month_threshold']]}
+        ]
+    },
+    {
+        'group': 'workshop_quality',
+        'params': {
+            'cost_increase_threshold': 0.5  # 50% above fleet average
+        },
+        'alerts': [
+            {'rule_name': 'workshop_expensive', 'severity': 'INFO',
+             'when': [['has_invoices', '=', 1],
+                      ['cost_ratio', '>', {'value': 1, 'plus': '$cost_increase_threshold'}]]}
+        ]
+    }
+]
+
+# Comparison operators allowed in rule conditions (op -> SQL)
+RULE_OPERATORS = {'>': '>', '>=': '>=', '<': '<', '<=': '<=', '=': '=', '!=': '!=',
+                  'is_null': 'IS NULL', 'not_null': 'IS NOT NULL'}
+
+
 class FleetRulesEngine:
     """
     Rules Engine for fleet management - provides logic-based alerts.
@@ -28,6 +108,27 @@ class FleetRulesEngine:
     and detecting rule violations in real-time.
     """
 
+    # Order in which a vehicle's alerts are emitted (same order as the check_* methods)
+    RULE_ORDER = [
+        'maintenance_overdue_km',
+        'maintenance_overdue_time',
+        'cost_anomaly',
+        'retirement_approaching',
+        'vehicle_too_old',
+        'high_mileage',
+        'high_utilization',
+        'workshop_expensive'
+    ]
+
+    # Columns of an evaluate_rules_frame() result that the alert dicts are built from
+    ALERT_COLUMNS = {
+        'rule_name', 'severity', 'vehicle_id', 'plate', 'last_service_date', 'purchase_date',
+        'estimated_retirement_date', 'total_services', 'avg_service_cost', 'current_km_value',
+        'km_since_service', 'days_since_service', 'recent_cost', 'recent_date', 'recent_workshop',
+        'anomaly_avg_cost', 'days_until_retirement', 'vehicle_age_years', 'service_months',
+        'km_driven', 'km_per_month', 'fleet_avg_cost', 'most_common_workshop'
+    }
+
     def __init__(self, db_manager):
         """
         Initialize Rules Engine with database connection.
@@ -37,34 +138,147 @@ class FleetRulesEngine:
         """
         self.db = db_manager
 
-        # Define rule thresholds (can be customized per organization)
-        self.rules = {
-            'maintenance_overdue': {
-                'km_threshold': 10000,      # Max km since last service
-                'days_threshold': 180       # Max days since last service
-            },
-            'cost_anomaly': {
-                'multiplier': 2.0           # Alert if cost > 2x average
-            },
-            'retirement_warning': {
-                'days_threshold': 90,       # Warn if retirement < 90 days
-                'age_years': 10,            # Warn if vehicle age > 10 years
-                'km_threshold': 300000      # Warn if total km > 300,000
-            },
-            'high_utilization': {
-                'km_per_month_threshold': 3000  # High usage threshold
-            },
-            'workshop_quality': {
-                'cost_increase_threshold': 0.5  # 50% above fleet average
-            }
-        }
+        # Rule definitions (stored in the database, built-in defaults otherwise);
+        # self.rules maps each group to its thresholds - the same dicts as the definitions' params
+        self.definitions = self._load_definitions()
+        self.rules = {definition['group']: definition['params'] for definition in self.definitions}
+
+    # ===== Rule Definitions =====
 
-    def evaluate_all_rules(self, vehicle_id: Optional[str] = None) -> Dict:
+    def _load_definitions(self) -> List[Dict]:
+        """Load the stored definitions, adding any built-in group the database doesn't have yet."""
+        defaults = json.loads(json.dumps(DEFAULT_RULE_DEFINITIONS))
+        if self.db is None:
+            return defaults
+
+        stored = self.db.get_rule_definitions()
+        known = set(stored['rule_group'])
+        missing = [(d['group'], position, json.dumps(d, ensure_ascii=False))
+                   for position, d in enumerate(defaults) if d['group'] not in known]
+        if missing:
+            self.db.save_rule_definitions(missing, replace=False)
+            stored = self.db.get_rule_definitions()
+
+        return [json.loads(definition_json) for definition_json in stored['definition_json']]
+
+    def save_rule_definition(self, definition: Dict, position: Optional[int] = None) -> bool:
+        """
+        Add or replace a rule group (validated by compiling it).
+
+        Args:
+            definition: {'group': name, 'params': {threshold: value}, 'alerts': [
+                            {'rule_name', 'severity', 'when': [[metric, op, operand], ...],
+                             'message' / 'recommendation': templates formatted with the metrics}]}
+            position: Evaluation order of the group (None = keep / append)
+        """
+        self._compile_group(definition, start_order=0)
+
+        groups = [d['group'] for d in self.definitions]
+        if definition['group'] in groups:
+            index = groups.index(definition['group'])
+            self.definitions[index] = definition
+        else:
+            index = len(self.definitions)
+            self.definitions.append(definition)
+        if position is not None:
+            self.definitions.insert(position, self.definitions.pop(index))
+        self.rules = {d['group']: d['params'] for d in self.definitions}
+
+        if self.db is not None:
+            self.db.save_rule_definitions([
+                (d['group'], i, json.dumps(d, ensure_ascii=False)) for i, d in enumerate(self.definitions)
+            ])
+        return True
+
+    def compile_rules(self) -> List[tuple]:
+        """
+        Compile every enabled rule to a SQL predicate over DatabaseManager.RULE_INPUTS_CTE.
+
+        Returns:
+            List of (rule_order, rule_name, severity, predicate_sql, params) in evaluation order
+        """
+        predicates = []
+        for definition in self.definitions:
+            predicates.extend(self._compile_group(definition, start_order=len(predicates)))
+        return predicates
+
+    def _compile_group(self, definition: Dict, start_order: int) -> List[tuple]:
+        params = definition.get('params', {})
+        compiled = []
+        for alert in definition.get('alerts', []):
+            if not alert.get('enabled', True):
+                continue
+            rule_order = start_order + len(compiled)
+            if alert.get('severity') not in ('URGENT', 'WARNING', 'INFO'):
+                raise ValueError(f"Rule {alert.get('rule_name')}: severity must be URGENT, WARNING or INFO")
+            bound = {}
+            conditions = [self._compile_condition(condition, params, bound, f"rule_{rule_order}_p")
+                          for condition in alert.get('when', [])]
+            predicate = " AND ".join(f"({c})" for c in conditions) if conditions else "1"
+            compiled.append((rule_order, alert['rule_name'], alert['severity'], predicate, bound))
+        return compiled
+
+    def _compile_condition(self, condition, params: Dict, bound: Dict, prefix: str) -> str:
+        metric, op, operand = (list(condition) + [None])[:3]
+        if op not in RULE_OPERATORS:
+            raise ValueError(f"Unknown operator in rule condition: {op}")
+        column = self._compile_operand({'metric': metric}, params, bound, prefix)
+        if op in ('is_null', 'not_null'):
+            return f"{column} {RULE_OPERATORS[op]}"
+        return f"{column} {RULE_OPERATORS[op]} {self._compile_operand(operand, params, bound, prefix)}"
+
+    def _compile_operand(self, operand, params: Dict, bound: Dict, prefix: str) -> str:
+        """Literal / "$param" / {"metric"|"param"|"value": ..., "times"|"plus": operand} -> SQL."""
+        if isinstance(operand, str) and operand.startswith('$'):
+            operand = {'param': operand[1:]}
+        if not isinstance(operand, dict):
+            operand = {'value': operand}
+
+        if 'metric' in operand:
+            metric = operand['metric']
+            if metric not in self._input_columns():
+                raise ValueError(f"Unknown metric in rule condition: {metric}")
+            sql = metric
+        else:
+            if 'param' in operand:
+                if operand['param'] not in params:
+                    raise ValueError(f"Unknown rule parameter: {operand['param']}")
+                value = params[operand['param']]
+            else:
+                value = operand.get('value')
+            if isinstance(value, (dict, list)):
+                raise ValueError(f"Invalid rule operand: {value}")
+            name = f"{prefix}{len(bound)}"
+            bound[name] = value
+            sql = f":{name}"
+
+        for arithmetic, symbol in (('times', '*'), ('plus', '+')):
+            if arithmetic in operand:
+                sql = f"({sql} {symbol} {self._compile_operand(operand[arithmetic], params, bound, prefix)})"
+        return sql
+
+    def _input_columns(self) -> set:
+        columns = getattr(self.db, 'RULE_INPUT_COLUMNS', None)
+        if columns is None:
+            from src.database_manager import DatabaseManager
+            columns = DatabaseManager.RULE_INPUT_COLUMNS
+        return columns
+
+    def evaluate_all_rules(self, vehicle_id: Optional[str] = None, method: str = 'sql',
+                           workers: Optional[int] = None) -> Dict:
         """
         Evaluate all rules for one vehicle or entire fleet.
 
         Args:
             vehicle_id: Specific vehicle to check (None = all vehicles)
+            method: 'sql' - the compiled rule definitions in one SQLite query (evaluate_rules_sql);
+                    'parallel' - the same query over vehicle shards in a process pool
+                    (evaluate_rules_parallel);
+                    'vectorized' - built-in rules column-wise in pandas (evaluate_rules_frame);
+                    'loop' - built-in rules per vehicle (check_* methods).
+                    All of them produce the same alerts for the built-in rules; only 'sql'
+                    and 'parallel' evaluate organization-specific rule definitions.
+            workers: Process count for 'parallel' (None = CPU count)
 
         Returns:
             Dict with structure:
@@ -74,14 +288,15 @@ class FleetRulesEngine:
                 'stats': {summary statistics}
             }
         """
+        if method not in ('sql', 'parallel', 'vectorized', 'loop'):
+            raise ValueError(f"Unknown evaluation method: {method}")
+
         # Get vehicle data with statistics
         vehicles_df = self.db.get_vehicle_with_stats()
-        invoices_df = self.db.get_all_invoices()
 
         # Filter to specific vehicle if requested
         if vehicle_id:
             vehicles_df = vehicles_df[vehicles_df['vehicle_id'] == vehicle_id]
-            invoices_df = invoices_df[invoices_df['vehicle_id'] == vehicle_id]
 
         if vehicles_df.empty:
             return {
@@ -91,23 +306,46 @@ class FleetRulesEngine:
             }
 
         # Collect all alerts
-        all_alerts = []
-
-        for _, vehicle in vehicles_df.iterrows():
-            vehicle_invoices = invoices_df[
-                invoices_df['vehicle_id'] == vehicle['vehicle_id']
-            ]
-
-            # Run all rule checks
-            all_alerts.extend(self.check_maintenance_overdue(vehicle))
-            all_alerts.extend(self.check_cost_anomaly(vehicle, vehicle_invoices, vehicles_df))
-            all_alerts.extend(self.check_retirement_readiness(vehicle))
-            all_alerts.extend(self.check_high_utilization(vehicle))
-            all_alerts.extend(self.check_workshop_quality(vehicle, vehicle_invoices, vehicles_df))
+        if method == 'sql':
+            # Fleet average from the same frame the pandas paths average over
+            fleet_avg_cost = vehicles_df['avg_service_cost'].mean()
+            alerts_df = self.evaluate_rules_sql(vehicle_ids=[vehicle_id] if vehicle_id else None,
+                                                fleet_avg_cost=fleet_avg_cost)
+            all_alerts = self.alerts_to_dicts(alerts_df)
+        elif method == 'parallel':
+            alerts_df = self.evaluate_rules_parallel(vehicles_df['vehicle_id'].tolist(),
+                                                     fleet_avg_cost=vehicles_df['avg_service_cost'].mean(),
+                                                     workers=workers)
+            all_alerts = self.alerts_to_dicts(alerts_df)
+        else:
+            invoices_df = self.db.get_all_invoices()
+            if vehicle_id:
+                invoices_df = invoices_df[invoices_df['vehicle_id'] == vehicle_id]
+
+            if method == 'vectorized':
+                all_alerts = self.alerts_to_dicts(self.evaluate_rules_frame(vehicles_df, invoices_df))
+            else:
+                all_alerts = []
+
+                for _, vehicle in vehicles_df.iterrows():
+                    vehicle_invoices = invoices_df[
+                        invoices_df['vehicle_id'] == vehicle['vehicle_id']
+                    ]
+
+                    # Run all rule checks
+                    all_alerts.extend(self.check_maintenance_overdue(vehicle, vehicle_invoices))
+                    all_alerts.extend(self.check_cost_anomaly(vehicle, vehicle_invoices, vehicles_df))
+                    all_alerts.extend(self.check_retirement_readiness(vehicle))
+                    all_alerts.extend(self.check_high_utilization(vehicle))
+                    all_alerts.extend(self.check_workshop_quality(vehicle, vehicle_invoices, vehicles_df))
 
         # Add custom alerts
         all_alerts.extend(self.get_custom_alerts(vehicle_id))
 
+        return self._summarize_alerts(all_alerts, len(vehicles_df))
+
+    def _summarize_alerts(self, all_alerts: List[Dict], vehicles_checked: int) -> Dict:
+        """Wrap alerts with the overall alert level and severity counts."""
         # Determine overall alert level
         severity_counts = {
             'URGENT': sum(1 for a in all_alerts if a['severity'] == 'URGENT'),
@@ -130,20 +368,608 @@ class FleetRulesEngine:
                 'urgent_count': severity_counts['URGENT'],
                 'warning_count': severity_counts['WARNING'],
                 'info_count': severity_counts['INFO'],
-                'vehicles_checked': len(vehicles_df)
+                'vehicles_checked': vehicles_checked
             }
         }
 
-    def check_maintenance_overdue(self, vehicle: pd.Series) -> List[Dict]:
+    # ===== Persisted Alerts (incremental evaluation) =====
+
+    def rules_hash(self) -> str:
+        """Fingerprint of the rule definitions - changing any threshold or rule re-evaluates the fleet."""
+        return hashlib.sha1(json.dumps(self.definitions, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+    def get_alerts(self, vehicle_id: Optional[str] = None, refresh: bool = True) -> Dict:
+        """
+        Same result as evaluate_all_rules(), read from the persisted rule_alerts table.
+
+        Vehicles whose inputs changed are re-evaluated first (see refresh_alerts), so
+        a page render with no changes only reads the stored alerts. Custom alerts are
+        not evaluated and are always read live from their table.
+
+        Args:
+            vehicle_id: Specific vehicle to show (None = all vehicles). Unlike
+                        evaluate_all_rules(vehicle_id), the workshop rule compares the
+                        vehicle with the whole fleet's average cost.
+            refresh: False = read the alerts as last stored by the rules scheduler
+                     (evaluated anyway if nothing was stored yet)
+        """
+        vehicles_checked = len(self.db.get_rule_alert_vehicles()) if not refresh else 0
+        if refresh or vehicles_checked == 0:
+            vehicles_checked = self.refresh_alerts()['vehicles']
+
+        if vehicle_id:
+            vehicles_df = self.db.get_vehicle_with_stats()
+            if not (vehicles_df['vehicle_id'] == vehicle_id).any():
+                return {
+                    'alerts': [],
+                    'alert_level': 'info',
+                    'stats': {'total_alerts': 0}
+                }
+            vehicles_checked = 1
+
+        stored = self.db.get_rule_alerts(vehicle_id=vehicle_id)
+        all_alerts = [json.loads(alert_json) for alert_json in stored['alert_json']]
+        all_alerts.extend(self.get_custom_alerts(vehicle_id))
+
+        return self._summarize_alerts(all_alerts, vehicles_checked)
+
+    def refresh_alerts(self) -> Dict:
+        """
+        Re-evaluate only the vehicles whose stored alerts are stale and persist the result.
+
+        A vehicle is re-evaluated when:
+        - its invoices or vehicle row changed (change_log version newer than its fingerprint)
+        - the thresholds changed (rules_hash)
+        - the day changed (time-based rules: days since service, age, retirement)
+        - the fleet average cost changed and the vehicle has, or now qualifies for,
+          a workshop_expensive alert
+        - it has never been evaluated
+
+        Returns:
+            Dict with 'evaluated' (vehicles re-evaluated), 'removed' and 'vehicles' (fleet size)
+        """
+        # The change version is read before the data so a concurrent write is picked up next time
+        change_version = self.db.get_change_version()
+        vehicles_df = self.db.get_vehicle_with_stats()
+        state = self.db.get_rule_alert_vehicles().set_index('vehicle_id')
+
+        today = datetime.now().strftime('%Y-%m-%d')
+        rules_hash = self.rules_hash()
+        fleet_avg_cost = vehicles_df['avg_service_cost'].mean() if not vehicles_df.empty else np.nan
+
+        stale = self._stale_vehicles(vehicles_df, state, today, rules_hash, fleet_avg_cost)
+        removed = [vid for vid in state.index if vid not in set(vehicles_df['vehicle_id'])]
+        if not stale and not removed:
+            return {'evaluated': 0, 'removed': 0, 'vehicles': len(vehicles_df)}
+
+        stale_df = vehicles_df[vehicles_df['vehicle_id'].isin(stale)]
+        alerts_df = self.evaluate_rules_sql(
+            vehicle_ids=None if len(stale_df) == len(vehicles_df) else stale_df['vehicle_id'].tolist(),
+            fleet_avg_cost=fleet_avg_cost
+        )
+        rows = []
+        alert_counts = {}
+        for alert in self.alerts_to_dicts(alerts_df):
+            alert_index = alert_counts.get(alert['vehicle_id'], 0)
+            alert_counts[alert['vehicle_id']] = alert_index + 1
+            rows.append((alert['vehicle_id'], alert_index, alert['rule_name'], alert['severity'],
+                         json.dumps(alert, ensure_ascii=False, default=str)))
+
+        vehicle_states = [
+            {
+                'vehicle_id': vid,
+                'change_version': change_version,
+                'rules_hash': rules_hash,
+                'evaluated_day': today,
+                'fleet_avg_cost': fleet_avg_cost,
+                'alert_count': alert_counts.get(vid, 0)
+            }
+            for vid in stale_df['vehicle_id']
+        ]
+        self.db.save_rule_alerts(vehicle_states, rows, removed_vehicle_ids=removed)
+        return {'evaluated': len(vehicle_states), 'removed': len(removed), 'vehicles': len(vehicles_df)}
+
+    def _stale_vehicles(self, vehicles_df: pd.DataFrame, state: pd.DataFrame, today: str,
+                        rules_hash: str, fleet_avg_cost: float) -> List[str]:
+        """Vehicle ids whose persisted alerts no longer match their inputs."""
+        vehicle_ids = vehicles_df['vehicle_id']
+        known = vehicle_ids.isin(state.index)
+        stored = state.reindex(vehicle_ids)
+
+        stale = ~known
+        stale |= known & ((stored['rules_hash'] != rules_hash) | (stored['evaluated_day'] != today)).to_numpy()
+
+        # Invoices / vehicle rows changed since the vehicle's fingerprint
+        if known.any():
+            since = int(stored['change_version'].min())
+            try:
+                changes = self.db.get_changes_since(since, tables=['invoices', 'vehicles'])
+                latest = changes.groupby('vehicle_id')['version'].max()
+                changed = vehicle_ids.map(latest) > stored['change_version'].to_numpy()
+                stale |= changed.fillna(False).to_numpy()
+            except ValueError:
+                # The change log was pruned past the fingerprint - re-evaluate everything
+                stale |= True
+
+        # Fleet average moved: only the workshop rule depends on it
+        stored_avg = stored['fleet_avg_cost'].to_numpy(dtype=float)
+        same_avg = (stored_avg == fleet_avg_cost) | (np.isnan(stored_avg) & pd.isna(fleet_avg_cost))
+        if not same_avg.all():
+            workshop_alerts = set(self.db.get_rule_alerts(rule_name='workshop_expensive')['vehicle_id'])
+            threshold = 1 + self.rules['workshop_quality']['cost_increase_threshold']
+            if pd.isna(fleet_avg_cost) or fleet_avg_cost == 0:
+                qualifies = pd.Series(False, index=vehicles_df.index)
+            else:
+                avg_cost = self._numeric(self._or_default(vehicles_df['avg_service_cost'], 0))
+                qualifies = avg_cost / fleet_avg_cost > threshold
+            affected = vehicle_ids.isin(workshop_alerts) | qualifies
+            stale |= (~same_avg & affected.to_numpy())
+
+        return vehicle_ids[np.asarray(stale, dtype=bool)].tolist()
+
+    # ===== SQL Evaluation =====
+
+    def evaluate_rules_sql(self, vehicle_ids: Optional[List[str]] = None,
+                           fleet_avg_cost: Optional[float] = None) -> pd.DataFrame:
+        """
+        Evaluate the compiled rule definitions in one SQLite query (see compile_rules).
+
+        Only the per-vehicle inputs and the matching rows leave SQLite - invoices are
+        never loaded into pandas.
+
+        Args:
+            vehicle_ids: Vehicles to evaluate (None = all vehicles)
+            fleet_avg_cost: Fleet average service cost for the workshop rule
+                            (None = average of the evaluated vehicles)
+
+        Returns:
+            Alerts DataFrame in the same layout as evaluate_rules_frame()
+        """
+        today, after_midnight = self._evaluation_day()
+        return self.db.query_rule_matches(self.compile_rules(), today, after_midnight,
+                                          vehicle_ids=vehicle_ids, fleet_avg_cost=fleet_avg_cost)
+
+    @staticmethod
+    def _evaluation_day() -> tuple:
+        """Today's epoch day and the after-midnight flag the SQL rules compare dates with."""
+        now = datetime.now()
+        today = (now.date() - datetime(1970, 1, 1).date()).days
+        after_midnight = 0 if now == datetime.combine(now.date(), datetime.min.time()) else 1
+        return today, after_midnight
+
+    # ===== Parallel Evaluation =====
+
+    @staticmethod
+    def shard_vehicle_ids(vehicle_ids: List[str], shards: int) -> List[List[str]]:
+        """
+        Split vehicle ids into shards by a stable hash of the id (CRC32), so a vehicle
+        always lands in the same shard whatever the process or run. Empty shards are dropped.
+        """
+        buckets = [[] for _ in range(max(1, shards))]
+        for vid in vehicle_ids:
+            buckets[zlib.crc32(str(vid).encode('utf-8')) % len(buckets)].append(vid)
+        return [bucket for bucket in buckets if bucket]
+
+    def evaluate_rules_parallel(self, vehicle_ids: Optional[List[str]] = None,
+                                fleet_avg_cost: Optional[float] = None,
+                                workers: Optional[int] = None,
+                                executor: Optional[ProcessPoolExecutor] = None) -> pd.DataFrame:
+        """
+        Evaluate the compiled rule definitions over vehicle shards in a process pool.
+
+        Each worker opens its own SQLite connection and runs the rules query for its
+        shard only (vehicles, stats and invoices of other shards are never read). The
+        fleet average cost is computed once by the driver so the workshop rule compares
+        every shard with the whole fleet. The merged result is sorted like evaluate_rules_sql().
+
+        Args:
+            vehicle_ids: Vehicles to evaluate (None = all vehicles)
+            fleet_avg_cost: Fleet average service cost (None = average of the evaluated vehicles)
+            workers: Number of processes / shards (None = CPU count; 1 = in this process)
+            executor: Existing ProcessPoolExecutor to reuse (skips the pool start-up cost)
+
+        Returns:
+            Alerts DataFrame in the same layout as evaluate_rules_frame()
+        """
+        if vehicle_ids is None or fleet_avg_cost is None:
+            vehicles_df = self.db.get_vehicle_with_stats()
+            if vehicle_ids is None:
+                vehicle_ids = vehicles_df['vehicle_id'].tolist()
+            else:
+                vehicles_df = vehicles_df[vehicles_df['vehicle_id'].isin(vehicle_ids)]
+            fleet_avg_cost = vehicles_df['avg_service_cost'].mean()
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        predicates = self.compile_rules()
+        today, after_midnight = self._evaluation_day()
+        fleet_avg_cost = None if pd.isna(fleet_avg_cost) else float(fleet_avg_cost)
+
+        shards = self.shard_vehicle_ids(vehicle_ids, workers)
+        if workers <= 1 or len(shards) <= 1:
+            return self.db.query_rule_matches(predicates, today, after_midnight,
+                                              vehicle_ids=vehicle_ids, fleet_avg_cost=fleet_avg_cost)
+
+        args = [(self.db.db_path, predicates, today, after_midnight, shard, fleet_avg_cost) for shard in shards]
+        if executor is not None:
+            frames = list(executor.map(_evaluate_shard, *zip(*args)))
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as pool:
+                frames = list(pool.map(_evaluate_shard, *zip(*args)))
+
+        matched = [frame for frame in frames if not frame.empty]
+        if not matched:
+            return frames[0]
+        merged = pd.concat(matched, ignore_index=True)
+        # vehicle_position is per shard - renumber in the query's global order (vehicle_id)
+        merged['vehicle_position'] = pd.Index(sorted(vehicle_ids)).get_indexer(merged['vehicle_id'])
+        return merged.sort_values(['vehicle_position', 'rule_order'], kind='stable', ignore_index=True)
+
+    # ===== Vectorized Evaluation =====
+
+    def evaluate_rules_frame(self, vehicles_df: pd.DataFrame, invoices_df: pd.DataFrame,
+                             fleet_avg_cost: Optional[float] = None) -> pd.DataFrame:
+        """
+        Evaluate every rule for every vehicle as column-wise masks over one joined frame.
+
+        Mirrors the check_* methods rule by rule (same thresholds, same handling of
+        missing / unparsable values), so alerts_to_dicts() of the result equals the
+        per-vehicle loop output.
+
+        Args:
+            vehicles_df: Vehicles with statistics (get_vehicle_with_stats)
+            invoices_df: Invoices of those vehicles
+            fleet_avg_cost: Fleet average service cost for the workshop rule
+                            (None = average of vehicles_df, as in the loop)
+
+        Returns:
+            DataFrame with one row per alert, in the loop's order (vehicle order, then
+            RULE_ORDER): rule_name, severity, vehicle_id, plate and the fleet columns
+            the alert messages are built from
+        """
+        fleet = self._build_rules_frame(vehicles_df, invoices_df, fleet_avg_cost)
+        rules = self.rules
+
+        masks = {
+            'maintenance_overdue_km': fleet['has_service']
+                & (fleet['km_since_service'] > rules['maintenance_overdue']['km_threshold']),
+            'maintenance_overdue_time': fleet['has_service']
+                & (fleet['days_since_service'] > rules['maintenance_overdue']['days_threshold']),
+            'cost_anomaly': fleet['has_invoices'] & fleet['avg_service_cost'].notna()
+                & (fleet['recent_cost'] > fleet['anomaly_avg_cost'] * rules['cost_anomaly']['multiplier']),
+            'retirement_approaching': fleet['days_until_retirement'].notna()
+                & (fleet['days_until_retirement'] < rules['retirement_warning']['days_threshold']),
+            'vehicle_too_old': fleet['vehicle_age_years'] > rules['retirement_warning']['age_years'],
+            'high_mileage': fleet['current_km_value'] > rules['retirement_warning']['km_threshold'],
+            'high_utilization': fleet['km_per_month'] > rules['high_utilization']['km_per_month_threshold'],
+            'workshop_expensive': fleet['has_invoices']
+                & (fleet['cost_ratio'] > 1 + rules['workshop_quality']['cost_increase_threshold'])
+        }
+        severities = {
+            'maintenance_overdue_km': 'URGENT',
+            'maintenance_overdue_time': 'URGENT',
+            'cost_anomaly': 'WARNING',
+            'retirement_approaching': 'INFO',
+            'vehicle_too_old': 'WARNING',
+            'high_mileage': 'WARNING',
+            'high_utilization': 'INFO',
+            'workshop_expensive': 'INFO'
+        }
+
+        frames = []
+        for rule_order, rule_name in enumerate(self.RULE_ORDER):
+            hits = fleet[masks[rule_name].fillna(False).astype(bool)]
+            if hits.empty:
+                continue
+            frames.append(hits.assign(rule_name=rule_name, severity=severities[rule_name], rule_order=rule_order))
+
+        if not frames:
+            return pd.DataFrame(columns=['rule_name', 'severity', 'vehicle_id', 'plate'])
+
+        alerts = pd.concat(frames)
+        alerts = alerts.sort_values(['vehicle_position', 'rule_order'], kind='stable')
+        return alerts.reset_index(drop=True)
+
+    def _build_rules_frame(self, vehicles_df: pd.DataFrame, invoices_df: pd.DataFrame,
+                           fleet_avg_cost: Optional[float] = None) -> pd.DataFrame:
+        """One row per vehicle with every value the rules compare against."""
+        now = pd.Timestamp(datetime.now())
+        fleet = vehicles_df.reset_index(drop=True).copy()
+        fleet['vehicle_position'] = np.arange(len(fleet))
+
+        initial_km = self._numeric(self._or_default(self._column(fleet, 'initial_km', 0), 0))
+        current_km = self._numeric(self._or_default(self._column(fleet, 'current_km', 0), 0))
+        avg_service_cost = self._column(fleet, 'avg_service_cost', 0)
+        fleet['avg_service_cost'] = avg_service_cost
+        fleet['current_km_value'] = current_km
+
+        # Maintenance overdue
+        fleet['has_service'] = (self._column(fleet, 'last_service_date', None).notna()
+                                & self._column(fleet, 'current_km', 0).notna())
+        # Latest service on each vehicle's timeline (the is_latest rows of service_timeline)
+        vehicle_ids = fleet['vehicle_id']
+        latest = self._latest_services(invoices_df)
+        latest_km = vehicle_ids.map(latest['odometer_km'])
+        previous_km = vehicle_ids.map(latest['prev_odometer_km'])
+        previous_km = previous_km.fillna(self._numeric(self._column(fleet, 'initial_km', None)))
+        fleet['km_since_service'] = (latest_km - previous_km).clip(lower=0).fillna(0)
+        last_service = self._parse_dates(self._column(fleet, 'last_service_date', None))
+        fleet['days_since_service'] = (now - last_service).dt.days.fillna(0).astype(int)
+
+        # Retirement / age / utilization (purchase date)
+        purchase = self._parse_dates(self._column(fleet, 'purchase_date', ''))
+        days_in_service = (now - purchase).dt.days
+        # NaN when the purchase date is missing / unparsable (the loop reports age 0)
+        fleet['vehicle_age_years'] = days_in_service / 365.25
+        retirement = self._parse_dates(self._column(fleet, 'estimated_retirement_date', None))
+        fleet['days_until_retirement'] = (retirement - now).dt.days
+        fleet['service_months'] = days_in_service / 30.44  # before the 1-month floor
+        fleet['km_driven'] = current_km - initial_km
+        fleet['km_per_month'] = fleet['km_driven'] / np.maximum(1, fleet['service_months'])
+
+        # Cost anomaly: the vehicle's latest service
+        fleet['has_invoices'] = vehicle_ids.isin(set(invoices_df['vehicle_id'])) if not invoices_df.empty \
+            else pd.Series(False, index=fleet.index)
+        fleet['recent_cost'] = vehicle_ids.map(latest['total'])
+        fleet['recent_date'] = vehicle_ids.map(latest['date'])
+        fleet['recent_workshop'] = vehicle_ids.map(latest['workshop'])
+        fleet['anomaly_avg_cost'] = self._numeric(self._or_default(avg_service_cost, 1))
+
+        # Workshop quality: compared with the average of the evaluated vehicles
+        if fleet_avg_cost is None:
+            fleet_avg_cost = vehicles_df['avg_service_cost'].mean() if not vehicles_df.empty else np.nan
+        fleet['fleet_avg_cost'] = fleet_avg_cost
+        if pd.isna(fleet_avg_cost) or fleet_avg_cost == 0:
+            fleet['cost_ratio'] = np.nan
+        else:
+            fleet['cost_ratio'] = self._numeric(self._or_default(avg_service_cost, 0)) / fleet_avg_cost
+        # Vehicles whose invoices have no workshop at all fall back to 'N/A'
+        fleet['most_common_workshop'] = vehicle_ids.map(self._most_common_workshops(invoices_df)).fillna('N/A')
+
+        return fleet
+
+    @staticmethod
+    def _column(frame: pd.DataFrame, name: str, default) -> pd.Series:
+        """Column-wise vehicle.get(name, default)."""
+        if name in frame.columns:
+            return frame[name]
+        return pd.Series([default] * len(frame), index=frame.index, dtype=object)
+
+    @staticmethod
+    def _latest_services(invoices_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Latest service of each vehicle with the odometer of the service before it, indexed by
+        vehicle_id - the is_latest rows of the service_timeline view computed from an invoices
+        frame (same order: date, odometer, then the frame's order; undated invoices are skipped).
+        """
+        columns = ['vehicle_id', 'date', 'odometer_km', 'total', 'workshop']
+        dated = pd.DataFrame({col: FleetRulesEngine._column(invoices_df, col, None) for col in columns})
+        dated = dated[dated['vehicle_id'].notna() & dated['date'].notna()]
+        dated['odometer_km'] = FleetRulesEngine._numeric(dated['odometer_km'])
+        ordered = dated.sort_values(['vehicle_id', 'date', 'odometer_km'], kind='stable', na_position='first')
+        ordered['prev_odometer_km'] = ordered.groupby('vehicle_id', sort=False)['odometer_km'].shift()
+        return ordered.drop_duplicates('vehicle_id', keep='last').set_index('vehicle_id')
+
+    @staticmethod
+    def _vehicle_latest_service(invoices: pd.DataFrame):
+        """
+        Single-vehicle _latest_services for the loop: (latest invoice row, odometer of the
+        service before it), or (None, NaN) without dated invoices.
+        """
+        dated = invoices[invoices['date'].notna()]
+        if dated.empty:
+            return None, np.nan
+        odometer = pd.to_numeric(dated['odometer_km'], errors='coerce').to_numpy(dtype=float)
+        # np.lexsort is stable; NaN odometers sort first like NULLs in SQLite
+        order = np.lexsort((np.nan_to_num(odometer, nan=-np.inf), dated['date'].to_numpy()))
+        previous_km = odometer[order[-2]] if len(order) > 1 else np.nan
+        return dated.iloc[order[-1]], previous_km
+
+    @staticmethod
+    def _or_default(values: pd.Series, default) -> pd.Series:
+        """Column-wise `value or default`: None and zero fall back, NaN is kept (it is truthy)."""
+        falsy = values.map(lambda value: value is None or (not isinstance(value, str) and value == 0))
+        return values.where(~falsy.astype(bool), default)
+
+    @staticmethod
+    def _numeric(values: pd.Series) -> pd.Series:
+        return pd.to_numeric(values, errors='coerce').astype(float)
+
+    @staticmethod
+    def _parse_dates(values: pd.Series) -> pd.Series:
+        """Column-wise strptime(str(value), '%Y-%m-%d'); unparsable values -> NaT."""
+        text = values.map(lambda value: value if isinstance(value, str) else str(value))
+        return pd.to_datetime(text, format='%Y-%m-%d', errors='coerce')
+
+    @staticmethod
+    def _most_common_workshops(invoices_df: pd.DataFrame) -> pd.Series:
+        """Per vehicle: the most frequent workshop (ties -> first in sort order, as Series.mode)."""
+        if invoices_df.empty or 'workshop' not in invoices_df.columns:
+            return pd.Series(dtype=object)
+        counts = (invoices_df.dropna(subset=['workshop'])
+                  .groupby(['vehicle_id', 'workshop'], observed=True).size()
+                  .rename('count').reset_index())
+        counts = counts.sort_values(['vehicle_id', 'count', 'workshop'], ascending=[True, False, True], kind='stable')
+        return counts.drop_duplicates('vehicle_id').set_index('vehicle_id')['workshop']
+
+    def alerts_to_dicts(self, alerts_df: pd.DataFrame) -> List[Dict]:
+        """
+        Convert an evaluate_rules_frame() result into the alert dicts returned by
+        the check_* methods (only the alerting rows are materialized).
+        """
+        if alerts_df.empty:
+            return []
+        builders = {
+            'maintenance_overdue_km': self._maintenance_km_alert,
+            'maintenance_overdue_time': self._maintenance_time_alert,
+            'cost_anomaly': self._cost_anomaly_alert,
+            'retirement_approaching': self._retirement_approaching_alert,
+            'vehicle_too_old': self._vehicle_too_old_alert,
+            'high_mileage': self._high_mileage_alert,
+            'high_utilization': self._high_utilization_alert,
+            'workshop_expensive': self._workshop_expensive_alert
+        }
+        custom_rules = {
+            alert['rule_name']: alert
+            for definition in self.definitions for alert in definition.get('alerts', [])
+            if alert['rule_name'] not in builders
+        }
+        columns = [col for col in alerts_df.columns
+                   if col in self.ALERT_COLUMNS or (custom_rules and col in self._input_columns())]
+        alerts = []
+        for row in alerts_df[columns].to_dict('records'):
+            alert = {
+                'rule_name': row['rule_name'],
+                'severity': row['severity'],
+                'vehicle_id': row['vehicle_id'],
+                'plate': row.get('plate', 'N/A')
+            }
+            if row['rule_name'] in builders:
+                alert.update(builders[row['rule_name']](row))
+            else:
+                alert.update(self._custom_rule_alert(custom_rules.get(row['rule_name'], {}), row))
+            alerts.append(alert)
+        return alerts
+
+    def _custom_rule_alert(self, rule: Dict, row: Dict) -> Dict:
+        """Alert text of an organization-defined rule: its templates formatted with the row's metrics."""
+        metrics = [condition[0] for condition in rule.get('when', [])]
+
+        def render(template):
+            try:
+                return template.format_map(row)
+            except (KeyError, ValueError, IndexError, TypeError):
+                return template
+
+        return {
+            'message': render(rule.get('message', f"📌 {row['rule_name']}")),
+            'details': {metric: row.get(metric) for metric in dict.fromkeys(metrics)},
+            'recommendation': render(rule.get('recommendation', ''))
+        }
+
+    def _maintenance_km_alert(self, row: Dict) -> Dict:
+        km_since_service = float(row['km_since_service'])
+        return {
+            'message': f"🚨 תחזוקה דחופה! {int(km_since_service):,} ק\"מ במרווח הטיפול האחרון",
+            'details': {
+                'km_since_service': int(km_since_service),
+                'threshold': self.rules['maintenance_overdue']['km_threshold'],
+                'last_service_date': str(row['last_service_date']),
+                'current_km': int(row['current_km_value'])
+            },
+            'recommendation': "תזמן תחזוקה שגרתית בדחיפות גבוהה למניעת תקלות"
+        }
+
+    def _maintenance_time_alert(self, row: Dict) -> Dict:
+        days_since_service = int(row['days_since_service'])
+        return {
+            'message': f"🚨 תחזוקה דחופה! {days_since_service} ימים מהשירות האחרון",
+            'details': {
+                'days_since_service': days_since_service,
+                'threshold': self.rules['maintenance_overdue']['days_threshold'],
+                'last_service_date': str(row['last_service_date'])
+            },
+            'recommendation': f"תחזוקה אחרונה הייתה לפני {days_since_service} ימים - תזמן בדיקה מיידית"
+        }
+
+    def _cost_anomaly_alert(self, row: Dict) -> Dict:
+        recent_cost = row['recent_cost']
+        avg_cost = row['anomaly_avg_cost']
+        cost_increase_pct = ((recent_cost - avg_cost) / avg_cost) * 100
+        return {
+            'message': f"⚠️ עלייה חריגה בעלות תחזוקה ({cost_increase_pct:.0f}%)",
+            'details': {
+                'recent_cost': float(recent_cost),
+                'average_cost': float(avg_cost),
+                'increase_percent': float(cost_increase_pct),
+                'threshold_multiplier': self.rules['cost_anomaly']['multiplier'],
+                'invoice_date': str(row['recent_date']),
+                'workshop': str(row['recent_workshop'])
+            },
+            'recommendation': f"בדוק את החשבונית האחרונה מ-{row['recent_workshop']} - עלות חריגה"
+        }
+
+    def _retirement_approaching_alert(self, row: Dict) -> Dict:
+        days_until_retirement = int(row['days_until_retirement'])
+        return {
+            'message': f"ℹ️ רכב מתקרב לפרישה ({days_until_retirement} ימים)",
+            'details': {
+                'days_until_retirement': days_until_retirement,
+                'retirement_date': str(row['estimated_retirement_date']),
+                'vehicle_age_years': 0 if pd.isna(row['vehicle_age_years'])
+                                     else round(float(row['vehicle_age_years']), 1)
+            },
+            'recommendation': "תכנן החלפת רכב - בדוק מחירי רכבים חלופיים"
+        }
+
+    def _vehicle_too_old_alert(self, row: Dict) -> Dict:
+        vehicle_age_years = float(row['vehicle_age_years'])
+        return {
+            'message': f"⚠️ רכב ישן ({vehicle_age_years:.1f} שנים)",
+            'details': {
+                'vehicle_age_years': round(vehicle_age_years, 1),
+                'age_threshold': self.rules['retirement_warning']['age_years'],
+                'purchase_date': str(row.get('purchase_date', 'N/A'))
+            },
+            'recommendation': "שקול החלפת רכב - רכבים ישנים מגדילים עלויות תחזוקה"
+        }
+
+    def _high_mileage_alert(self, row: Dict) -> Dict:
+        current_km = int(row['current_km_value'])
+        return {
+            'message': f"⚠️ קילומטראז' גבוה ({current_km:,} ק\"מ)",
+            'details': {
+                'current_km': current_km,
+                'threshold': self.rules['retirement_warning']['km_threshold']
+            },
+            'recommendation': "רכב עם קילומטראז' גבוה - העלות התחזוקתית עשויה לעלות"
+        }
+
+    def _high_utilization_alert(self, row: Dict) -> Dict:
+        km_per_month = float(row['km_per_month'])
+        months_in_service = max(1, float(row['service_months']))
+        return {
+            'message': f"ℹ️ ניצולת גבוהה ({int(km_per_month):,} ק\"מ/חודש)",
+            'details': {
+                'km_per_month': int(km_per_month),
+                'threshold': self.rules['high_utilization']['km_per_month_threshold'],
+                'total_km_driven': int(row['km_driven']),
+                'months_in_service': round(months_in_service, 1)
+            },
+            'recommendation': "רכב בשימוש אינטנסיבי - שקול תדירות תחזוקה מוגברת"
+        }
+
+    def _workshop_expensive_alert(self, row: Dict) -> Dict:
+        vehicle_avg_cost = row['avg_service_cost'] or 0
+        fleet_avg_cost = row['fleet_avg_cost']
+        cost_increase_pct = ((vehicle_avg_cost - fleet_avg_cost) / fleet_avg_cost) * 100
+        most_common_workshop = row['most_common_workshop']
+        return {
+            'message': f"ℹ️ עלות תחזוקה גבוהה מהממוצע ({cost_increase_pct:.0f}%)",
+            'details': {
+                'vehicle_avg_cost': float(vehicle_avg_cost),
+                'fleet_avg_cost': float(fleet_avg_cost),
+                'cost_increase_percent': float(cost_increase_pct),
+                'most_common_workshop': str(most_common_workshop),
+                'total_services': int(row.get('total_services', 0))
+            },
+            'recommendation': f"בדוק אלטרנטיבות ל-{most_common_workshop} - עלויות גבוהות יחסית"
+        }
+
+    # ===== Per-Vehicle Checks =====
+
+    def check_maintenance_overdue(self, vehicle: pd.Series,
+                                  invoices: Optional[pd.DataFrame] = None) -> List[Dict]:
         """
         Check if vehicle maintenance is overdue based on km or time.
 
         Rule: Alert if:
-        - km_since_service > 10,000 km OR
+        - km_since_service (km of the latest service interval) > 10,000 km OR
         - days_since_service > 180 days
 
         Args:
             vehicle: Vehicle data row with statistics
+            invoices: Vehicle's invoice history (default: its latest row of service_timeline)
 
         Returns:
             List of alert dicts (empty if no violation)
@@ -154,18 +980,22 @@ class FleetRulesEngine:
         if pd.isna(vehicle.get('last_service_date')) or pd.isna(vehicle.get('current_km')):
             return alerts
 
-        # Calculate km since last service
-        initial_km = vehicle.get('initial_km', 0) or 0
         current_km = vehicle.get('current_km', 0) or 0
-        total_services = vehicle.get('total_services', 0) or 0
 
-        # Rough estimate: km per service interval
-        if total_services > 0 and current_km > initial_km:
-            total_km_driven = current_km - initial_km
-            avg_km_per_service = total_km_driven / total_services
-            km_since_service = avg_km_per_service  # Approximation
+        # km of the latest service interval (from initial_km for a first service)
+        if invoices is None:
+            timeline = self.db.get_service_timeline(vehicle['vehicle_id'], latest_only=True)
+            latest = None if timeline.empty else timeline.iloc[-1]
+            previous_km = np.nan if latest is None else latest['prev_odometer_km']
         else:
-            km_since_service = 0
+            latest, previous_km = self._vehicle_latest_service(invoices)
+        km_since_service = 0
+        if latest is not None:
+            if pd.isna(previous_km):
+                previous_km = pd.to_numeric(vehicle.get('initial_km'), errors='coerce')
+            km_delta = pd.to_numeric(latest['odometer_km'], errors='coerce') - previous_km
+            if not pd.isna(km_delta):
+                km_since_service = max(km_delta, 0)
 
         # Calculate days since last service
         try:
@@ -184,7 +1014,7 @@ class FleetRulesEngine:
                 'severity': 'URGENT',
                 'vehicle_id': vehicle['vehicle_id'],
                 'plate': vehicle.get('plate', 'N/A'),
-                'message': f"🚨 תחזוקה דחופה! כ-{int(km_since_service):,} ק\"מ מהשירות האחרון",
+                'message': f"🚨 תחזוקה דחופה! {int(km_since_service):,} ק\"מ במרווח הטיפול האחרון",
                 'details': {
                     'km_since_service': int(km_since_service),
                     'threshold': km_threshold,
@@ -216,7 +1046,7 @@ class FleetRulesEngine:
         """
         Check for unusual cost spikes compared to vehicle's average.
 
-        Rule: Alert if most recent invoice > 2x vehicle's average cost
+        Rule: Alert if the latest service (by date, then odometer) > 2x vehicle's average cost
 
         Args:
             vehicle: Vehicle data row
@@ -231,8 +1061,10 @@ class FleetRulesEngine:
         if invoices.empty or pd.isna(vehicle.get('avg_service_cost')):
             return alerts
 
-        # Get most recent invoice
-        recent_invoice = invoices.sort_values('date', ascending=False).iloc[0]
+        # Get the latest service
+        recent_invoice, _ = self._vehicle_latest_service(invoices)
+        if recent_invoice is None:
+            return alerts
         recent_cost = recent_invoice.get('total', 0)
         avg_cost = vehicle.get('avg_service_cost', 0) or 1  # Avoid division by zero
 
@@ -454,7 +1286,8 @@ class FleetRulesEngine:
 
     def update_rule_threshold(self, rule_name: str, param_name: str, new_value):
         """
-        Update a specific rule threshold (for customization).
+        Update a specific rule threshold (for customization). The change is stored
+        in the rule definitions, so it applies to every session.
 
         Args:
             rule_name: Rule category (e.g., 'maintenance_overdue')
@@ -463,6 +1296,10 @@ class FleetRulesEngine:
         """
         if rule_name in self.rules and param_name in self.rules[rule_name]:
             self.rules[rule_name][param_name] = new_value
+            if self.db is not None:
+                position = list(self.rules).index(rule_name)
+                definition = self.definitions[position]
+                self.db.save_rule_definitions([(rule_name, position, json.dumps(definition, ensure_ascii=False))])
             return True
         return False
 
@@ -516,3 +1353,13 @@ class FleetRulesEngine:
         except Exception as e:
             # If table doesn't exist or other error, return empty list
             return []
+
+
+def _evaluate_shard(db_path: str, predicates: List[tuple], today: int, after_midnight: int,
+                    vehicle_ids: List[str], fleet_avg_cost: Optional[float]) -> pd.DataFrame:
+    """Process-pool worker of evaluate_rules_parallel: the rules query for one shard of vehicles."""
+    from src.database_manager import DatabaseManager
+
+    db = DatabaseManager(db_path, pooled=False, cache=False, analytics='sqlite', write_queue=False)
+    return db.query_rule_matches(predicates, today, after_midnight,
+                                 vehicle_ids=vehicle_ids, fleet_avg_cost=fleet_avg_cost)
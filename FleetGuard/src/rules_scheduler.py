@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+Rules Scheduler
+הערכת ה-Rules Engine ברקע במחזוריות קבועה, עם זרם אירועי התראות
+
+במקום שההתראות יחושבו רק כשמישהו פותח את הטאב, המתזמן מריץ את
+FleetRulesEngine.refresh_alerts כל N דקות (Thread ברקע של הדשבורד או תהליך CLI נפרד).
+אחרי כל הרצה ההתראות השמורות מושוות להרצה הקודמת ונרשמים אירועים ל-alert_events:
+new / resolved / escalated (ו-deescalated, כדי שהמצב של כל כלל יישאר מדויק).
+
+אירועים שטרם נמסרו נשלחים לערוצי ההתראה שהוגדרו (webhook / אימייל) - הטבלה היא
+ה-outbox: משלוח שנכשל נשלח שוב בהרצה הבאה (at-least-once; event_id מזהה כפילויות).
+
+הגדרות (משתני סביבה):
+    RULES_SCHEDULER_INTERVAL_MIN   מחזוריות בדקות (ברירת מחדל: 15)
+    ALERT_WEBHOOK_URL              POST של JSON עם האירועים
+    ALERT_EMAIL_TO                 נמענים (מופרדים בפסיק) - מפעיל משלוח אימייל
+    ALERT_EMAIL_FROM               שולח (ברירת מחדל: fleetguard@localhost)
+    ALERT_SMTP_HOST / PORT         שרת SMTP (ברירת מחדל: localhost:1025 - שרת SMTP מקומי לפיתוח,
+                                   למשל python -m aiosmtpd -n -l localhost:1025)
+
+שימוש:
+    python -m src.rules_scheduler            # daemon
+    python -m src.rules_scheduler --once     # הרצה אחת (cron)
+"""
+
+import argparse
+import json
+import os
+import smtplib
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from email.message import EmailMessage
+
+from src.database_manager import DatabaseManager
+from src.rules_engine import FleetRulesEngine
+
+
+# ===== Notification Channels =====
+
+class WebhookNotifier:
+    """
+    שליחת אירועים ב-POST של JSON: {"events": [...]}.
+
+    Attributes:
+        url: כתובת ה-webhook
+        timeout: זמן המתנה מקסימלי לתשובה (שניות)
+    """
+
+    name = 'webhook'
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, events):
+        body = json.dumps({'events': events}, ensure_ascii=False).encode('utf-8')
+        request = urllib.request.Request(
+            self.url, data=body, method='POST',
+            headers={'Content-Type': 'application/json; charset=utf-8'}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if response.status >= 300:
+                raise Exception(f"webhook החזיר {response.status}")
+
+
+class EmailNotifier:
+    """
+    שליחת אימייל אחד עם כל האירועים של המשלוח דרך SMTP.
+
+    Attributes:
+        recipients: רשימת נמענים
+        sender: כתובת השולח
+        host / port: שרת ה-SMTP
+    """
+
+    name = 'email'
+
+    def __init__(self, recipients, sender='fleetguard@localhost', host='localhost', port=1025,
+                 username=None, password=None, timeout=10):
+        self.recipients = recipients
+        self.sender = sender
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+
+    def send(self, events):
+        message = EmailMessage()
+        message['Subject'] = f"FleetGuard: {len(events)} אירועי התראות"
+        message['From'] = self.sender
+        message['To'] = ', '.join(self.recipients)
+        message.set_content(format_events(events))
+
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.username:
+                smtp.starttls()
+                smtp.login(self.username, self.password)
+            smtp.send_message(message)
+
+
+EVENT_LABELS = {
+    'new': '🆕 חדשה',
+    'escalated': '⬆️ הוחמרה',
+    'deescalated': '⬇️ הוקלה',
+    'resolved': '✅ נפתרה',
+}
+
+
+def format_events(events):
+    """גוף טקסט של אירועים - שורה לכל אירוע"""
+    lines = []
+    for event in events:
+        severity = event['severity']
+        if event['previous_severity'] and event['previous_severity'] != severity:
+            severity = f"{event['previous_severity']} -> {severity}"
+        lines.append(
+            f"[{EVENT_LABELS.get(event['event_type'], event['event_type'])}] "
+            f"{event['plate']} ({event['vehicle_id']}) {severity}: {event['message']}"
+        )
+        if event['event_type'] != 'resolved' and event.get('recommendation'):
+            lines.append(f"    {event['recommendation']}")
+    return '\n'.join(lines)
+
+
+def notifiers_from_env():
+    """ערוצי ההתראה שהוגדרו במשתני הסביבה"""
+    notifiers = []
+    webhook_url = os.getenv('ALERT_WEBHOOK_URL')
+    if webhook_url:
+        notifiers.append(WebhookNotifier(webhook_url))
+
+    recipients = [r.strip() for r in os.getenv('ALERT_EMAIL_TO', '').split(',') if r.strip()]
+    if recipients:
+        notifiers.append(EmailNotifier(
+            recipients,
+            sender=os.getenv('ALERT_EMAIL_FROM', 'fleetguard@localhost'),
+            host=os.getenv('ALERT_SMTP_HOST', 'localhost'),
+            port=int(os.getenv('ALERT_SMTP_PORT', '1025')),
+            username=os.getenv('ALERT_SMTP_USER'),
+            password=os.getenv('ALERT_SMTP_PASSWORD')
+        ))
+    return notifiers
+
+
+# ===== Scheduler =====
+
+class RulesScheduler:
+    """
+    הערכת כללים מחזורית + רישום ומשלוח אירועי התראות לקובץ דאטה בייס אחד.
+
+    Attributes:
+        db_path: נתיב לקובץ הדאטה בייס
+        interval_minutes: מחזוריות ההרצה
+        notifiers: ערוצי ההתראה (ברירת מחדל: לפי משתני הסביבה)
+        max_attempts: מספר ניסיונות משלוח מקסימלי לאירוע
+    """
+
+    def __init__(self, db_path=None, interval_minutes=None, notifiers=None, max_attempts=5):
+        self.db = DatabaseManager(db_path)
+        self.db_path = self.db.db_path
+        if interval_minutes is None:
+            interval_minutes = float(os.getenv('RULES_SCHEDULER_INTERVAL_MIN', '15'))
+        if interval_minutes <= 0:
+            raise ValueError(f"מחזוריות לא תקינה: {interval_minutes}")
+        self.interval_minutes = interval_minutes
+        self.notifiers = notifiers_from_env() if notifiers is None else notifiers
+        self.max_attempts = max_attempts
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.last_run = None
+
+    # ===== Runs =====
+
+    def run_once(self):
+        """
+        הרצה אחת: הערכת הרכבים שהשתנו, רישום אירועי ההתראות ומשלוח האירועים הממתינים.
+
+        Returns:
+            dict: run_id, evaluated, vehicles, מספר האירועים מכל סוג, delivered, failed
+        """
+        with self._lock:
+            started_at = datetime.now().isoformat(timespec='seconds')
+            start = time.perf_counter()
+            try:
+                # מנוע חדש בכל הרצה - שינויי ספים / כללים מסשנים אחרים נטענים מהדאטה בייס
+                refresh = FleetRulesEngine(self.db).refresh_alerts()
+            except Exception as e:
+                self.db.record_alert_events(started_at, error=str(e))
+                raise
+
+            result = {
+                **self.db.record_alert_events(started_at, refresh['vehicles'], refresh['evaluated']),
+                'evaluated': refresh['evaluated'],
+                'vehicles': refresh['vehicles'],
+            }
+            result.update(self.deliver_pending())
+            result['duration_ms'] = round((time.perf_counter() - start) * 1000, 1)
+            self.last_run = result
+            return result
+
+    def deliver_pending(self):
+        """
+        שולח את האירועים שטרם נמסרו לכל ערוצי ההתראה.
+        אירוע מסומן כנמסר רק אם כל הערוצים הצליחו; אחרת הוא נשלח שוב בהרצה הבאה.
+
+        Returns:
+            dict: delivered, failed
+        """
+        if not self.notifiers:
+            return {'delivered': 0, 'failed': 0}
+
+        pending = self.db.get_pending_alert_events(max_attempts=self.max_attempts)
+        if pending.empty:
+            return {'delivered': 0, 'failed': 0}
+
+        events = [self._event_payload(row) for row in pending.to_dict('records')]
+        event_ids = pending['event_id'].tolist()
+        errors = []
+        for notifier in self.notifiers:
+            try:
+                notifier.send(events)
+            except Exception as e:
+                errors.append(f"{notifier.name}: {str(e)}")
+
+        if errors:
+            self.db.mark_alert_events_delivered(event_ids, error='; '.join(errors))
+            print(f"⚠️ Warning: alert delivery failed ({'; '.join(errors)})")
+            return {'delivered': 0, 'failed': len(event_ids)}
+        self.db.mark_alert_events_delivered(event_ids)
+        return {'delivered': len(event_ids), 'failed': 0}
+
+    @staticmethod
+    def _event_payload(row):
+        """אירוע לערוצי ההתראה: שדות האירוע + הודעת ההתראה"""
+        alert = json.loads(row['alert_json'])
+        return {
+            'event_id': int(row['event_id']),
+            'event_type': row['event_type'],
+            'vehicle_id': row['vehicle_id'],
+            'plate': alert.get('plate', row['vehicle_id']),
+            'rule_name': row['rule_name'],
+            'severity': row['severity'],
+            'previous_severity': row['previous_severity'] if isinstance(row['previous_severity'], str) else None,
+            'message': alert.get('message'),
+            'recommendation': alert.get('recommendation'),
+            'created_at': row['created_at'],
+        }
+
+    # ===== Background Thread =====
+
+    def start(self):
+        """מפעיל Thread ברקע שמריץ את run_once כל interval_minutes (הרצה ראשונה מיד)"""
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='fleetguard-rules-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """עוצר את ה-Thread (ההרצה הנוכחית מסתיימת קודם)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"⚠️ Warning: rules scheduler run failed: {str(e)}")
+            self._stop.wait(self.interval_minutes * 60)
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_rules_scheduler(db_path):
+    """
+    מחזיר את המתזמן המשותף לקובץ הדאטה בייס (Thread אחד לקובץ בתהליך,
+    גם כשכל session של Streamlit קורא ל-start).
+    """
+    key = os.path.abspath(db_path)
+    with _schedulers_lock:
+        scheduler = _schedulers.get(key)
+        if scheduler is None:
+            scheduler = RulesScheduler(key)
+            _schedulers[key] = scheduler
+        return scheduler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FleetGuard background rules scheduler")
+    parser.add_argument('--db', help="database path (default: data/database/fleet.db)")
+    parser.add_argument('--interval', type=float, help="minutes between runs (default: RULES_SCHEDULER_INTERVAL_MIN or 15)")
+    parser.add_argument('--once', action='store_true', help="run once and exit (for cron)")
+    parser.add_argument('--webhook', help="webhook URL (default: ALERT_WEBHOOK_URL)")
+    parser.add_argument('--email-to', help="comma-separated recipients (default: ALERT_EMAIL_TO)")
+    args = parser.parse_args()
+
+    if args.webhook:
+        os.environ['ALERT_WEBHOOK_URL'] = args.webhook
+    if args.email_to:
+        os.environ['ALERT_EMAIL_TO'] = args.email_to
+
+    scheduler = RulesScheduler(args.db, interval_minutes=args.interval)
+    scheduler.db.apply_migrations()
+    channels = ', '.join(notifier.name for notifier in scheduler.notifiers) or "none"
+    print(f"Rules scheduler: {scheduler.db_path} every {scheduler.interval_minutes:g} min (delivery: {channels})")
+
+    while True:
+        try:
+            result = scheduler.run_once()
+            print(f"[OK] run {result['run_id']}: {result['evaluated']}/{result['vehicles']} vehicles evaluated, "
+                  f"{result['new']} new, {result['escalated']} escalated, {result['resolved']} resolved, "
+                  f"{result['delivered']} delivered ({result['duration_ms']} ms)")
+        except Exception as e:
+            print(f"⚠️ Warning: rules scheduler run failed: {str(e)}")
+        if args.once:
+            break
+        time.sleep(scheduler.interval_minutes * 60)
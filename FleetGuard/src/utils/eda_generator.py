@@ -53,7 +53,7 @@ class EDAGenerator:
         # Perform analysis
         self._analyze_distributions(df_invoices)
         self._identify_anomalies(df_invoices)
-        self._workshop_comparison(df_invoices)
+        self._workshop_comparison(df_invoices, use_db=df is None)
         self._temporal_analysis(df_invoices)
         self._vehicle_analysis(df_vehicles)
 
@@ -124,14 +124,39 @@ class EDAGenerator:
             'samples': anomalies.nlargest(5, 'total')[['invoice_no', 'vehicle_id', 'workshop', 'total']].to_dict('records')
         }
 
-    def _workshop_comparison(self, df):
-        """Compare workshops by cost and frequency"""
-        workshop_stats = df.groupby('workshop').agg({
-            'total': ['count', 'sum', 'mean', 'std'],
-            'invoice_no': 'count'
-        }).round(2)
+    def _workshop_comparison(self, df, use_db=False):
+        """
+        Compare workshops by cost and frequency
 
-        workshop_stats.columns = ['_'.join(col).strip() for col in workshop_stats.columns.values]
+        Args:
+            df: invoices DataFrame
+            use_db: df is the full invoices table - aggregate on the database's
+                    analytics engine instead of a pandas groupby
+        """
+        if use_db:
+            summary = self.db.get_invoice_cost_summary('workshop', std=True)
+            workshop_stats = pd.DataFrame({
+                'total_count': summary['count'],
+                'total_sum': summary['sum'],
+                'total_mean': summary['mean'],
+                'total_std': summary['std'],
+                'invoice_no_count': summary['count']
+            }).round(2)
+            overall_count = summary['count'].sum()
+            mean_cost = summary['sum'].sum() / overall_count if overall_count else np.nan
+            workshop_means = summary['mean'].items()
+        else:
+            workshop_stats = df.groupby('workshop').agg({
+                'total': ['count', 'sum', 'mean', 'std'],
+                'invoice_no': 'count'
+            }).round(2)
+
+            workshop_stats.columns = ['_'.join(col).strip() for col in workshop_stats.columns.values]
+            mean_cost = df['total'].mean()
+            workshop_means = (
+                (workshop, df[df['workshop'] == workshop]['total'].mean())
+                for workshop in df['workshop'].unique()
+            )
 
         self.insights['workshops'] = {
             'stats': workshop_stats.to_dict(),
@@ -142,9 +167,7 @@ class EDAGenerator:
         }
 
         # Cost variance analysis
-        mean_cost = df['total'].mean()
-        for workshop in df['workshop'].unique():
-            workshop_mean = df[df['workshop'] == workshop]['total'].mean()
+        for workshop, workshop_mean in workshop_means:
             diff_pct = ((workshop_mean - mean_cost) / mean_cost) * 100
             if abs(diff_pct) > 15:  # More than 15% difference
                 if 'pricing_concerns' not in self.insights['workshops']:
@@ -74,7 +74,7 @@ def get_color_scale(value, min_val, max_val, inverse=False):
 
 
 def render_enhanced_dataframe(
-    df: pd.DataFrame,
+    df: Optional[pd.DataFrame] = None,
     title: str = "",
     key_prefix: str = "table",
     enable_search: bool = True,
@@ -85,13 +85,15 @@ def render_enhanced_dataframe(
     number_columns: Optional[List[str]] = None,
     page_size: int = 25,
     height: int = 600,
-    show_summary: bool = True
+    show_summary: bool = True,
+    db: Any = None,
+    source: Optional[str] = None
 ):
     """
     Render an enhanced, professional data table with advanced features
 
     Args:
-        df: DataFrame to display
+        df: DataFrame to display (ignored in server-side mode)
         title: Table title
         key_prefix: Unique prefix for widget keys
         enable_search: Enable text search across all columns
@@ -103,9 +105,23 @@ def render_enhanced_dataframe(
         page_size: Rows per page
         height: Table height in pixels
         show_summary: Show summary statistics
+        db: DatabaseManager for server-side mode
+        source: Paged source name (see DatabaseManager.PAGED_SOURCES) for server-side mode.
+            When db and source are given, search, sorting and counting run in SQLite
+            and each render fetches only the current page.
     """
 
-    if df.empty:
+    if db is not None and source is not None:
+        _render_server_side_dataframe(
+            db, source, title=title, key_prefix=key_prefix,
+            enable_search=enable_search, enable_sorting=enable_sorting,
+            enable_heatmap=enable_heatmap, heatmap_columns=heatmap_columns,
+            currency_columns=currency_columns, number_columns=number_columns,
+            page_size=page_size, height=height, show_summary=show_summary
+        )
+        return
+
+    if df is None or df.empty:
         st.warning("⚠️ אין נתונים להצגה")
         return
 
@@ -126,11 +142,12 @@ def render_enhanced_dataframe(
                 key=f"{key_prefix}_search"
             )
             if search_term:
-                # Search across all string columns
-                mask = display_df.astype(str).apply(
-                    lambda row: row.str.contains(search_term, case=False, na=False).any(),
-                    axis=1
-                )
+                # Search across all columns (column-wise, not row-by-row)
+                mask = pd.Series(False, index=display_df.index)
+                for column in display_df.columns:
+                    mask |= display_df[column].astype(str).str.contains(
+                        search_term, case=False, na=False, regex=False
+                    )
                 display_df = display_df[mask]
                 st.caption(f"📊 נמצאו {len(display_df)} תוצאות")
 
@@ -198,6 +215,30 @@ def render_enhanced_dataframe(
 
         st.markdown("---")
 
+    _display_styled_table(
+        display_df,
+        enable_heatmap=enable_heatmap,
+        heatmap_columns=heatmap_columns,
+        currency_columns=currency_columns,
+        number_columns=number_columns,
+        height=height
+    )
+
+    # Pagination info
+    st.caption(f"📄 מציג {min(page_size, len(display_df))} מתוך {len(display_df)} שורות")
+
+
+def _display_styled_table(
+    display_df: pd.DataFrame,
+    enable_heatmap: bool = False,
+    heatmap_columns: Optional[List[str]] = None,
+    currency_columns: Optional[List[str]] = None,
+    number_columns: Optional[List[str]] = None,
+    height: int = 600
+):
+    """Apply currency/number formatting and optional heatmap, then display the table"""
+    display_df = display_df.copy()
+
     # Apply formatting
     styled_df = display_df.copy()
 
@@ -261,8 +302,136 @@ def render_enhanced_dataframe(
             height=height
         )
 
-    # Pagination info
-    st.caption(f"📄 מציג {min(page_size, len(display_df))} מתוך {len(display_df)} שורות")
+
+def _render_server_side_dataframe(
+    db: Any,
+    source: str,
+    title: str = "",
+    key_prefix: str = "table",
+    enable_search: bool = True,
+    enable_sorting: bool = True,
+    enable_heatmap: bool = False,
+    heatmap_columns: Optional[List[str]] = None,
+    currency_columns: Optional[List[str]] = None,
+    number_columns: Optional[List[str]] = None,
+    page_size: int = 25,
+    height: int = 600,
+    show_summary: bool = True
+):
+    """
+    Server-side variant of render_enhanced_dataframe.
+    Search, sort and count are pushed down to SQLite and pages are fetched with
+    keyset pagination (db.page_rows), so only one page is loaded per render.
+    """
+    columns = db.get_page_columns(source)
+
+    if title:
+        st.subheader(title)
+
+    col1, col2, col3 = st.columns([2, 1, 1])
+
+    search_term = None
+    with col1:
+        if enable_search:
+            search_term = st.text_input(
+                "🔍 חיפוש",
+                placeholder="הקלד טקסט לחיפוש...",
+                key=f"{key_prefix}_search"
+            ) or None
+
+    sort_column = None
+    descending = False
+    with col2:
+        if enable_sorting:
+            selected = st.selectbox(
+                "📊 מיון לפי",
+                options=["ללא"] + columns,
+                key=f"{key_prefix}_sort"
+            )
+            if selected != "ללא":
+                sort_column = selected
+                sort_order = st.radio(
+                    "",
+                    options=["עולה ⬆", "יורד ⬇"],
+                    horizontal=True,
+                    key=f"{key_prefix}_order"
+                )
+                descending = (sort_order == "יורד ⬇")
+
+    total_rows = db.count_rows(source, search=search_term)
+    if search_term:
+        with col1:
+            st.caption(f"📊 נמצאו {total_rows} תוצאות")
+
+    if total_rows == 0:
+        st.warning("⚠️ אין נתונים להצגה")
+        return
+
+    # Keyset cursor stack: page_keys[i] is the after_key of page i.
+    # Reset to the first page whenever search or sort changes.
+    state_key = f"{key_prefix}_page_keys"
+    signature = (search_term, sort_column, descending)
+    if st.session_state.get(f"{key_prefix}_page_signature") != signature:
+        st.session_state[f"{key_prefix}_page_signature"] = signature
+        st.session_state[state_key] = [None]
+    page_keys = st.session_state[state_key]
+
+    page_df, next_key = db.page_rows(
+        source,
+        sort_col=sort_column,
+        descending=descending,
+        after_key=page_keys[-1],
+        page_size=page_size,
+        search=search_term
+    )
+    page_number = len(page_keys)
+    total_pages = max(1, -(-total_rows // page_size))
+
+    with col3:
+        if not page_df.empty:
+            st.download_button(
+                label="📥 ייצא עמוד CSV",
+                data=page_df.to_csv(index=False).encode('utf-8-sig'),
+                file_name=f"{key_prefix}_page{page_number}_export.csv",
+                mime="text/csv",
+                key=f"{key_prefix}_export"
+            )
+
+    st.markdown("---")
+
+    if show_summary:
+        summary_cols = st.columns(4)
+        with summary_cols[0]:
+            st.metric("📊 סה\"כ שורות", total_rows)
+        with summary_cols[1]:
+            st.metric("📋 עמודות", len(columns))
+        with summary_cols[2]:
+            st.metric("📄 עמוד", f"{page_number} / {total_pages}")
+        with summary_cols[3]:
+            st.metric("📏 שורות בעמוד", len(page_df))
+        st.markdown("---")
+
+    _display_styled_table(
+        page_df,
+        enable_heatmap=enable_heatmap,
+        heatmap_columns=heatmap_columns,
+        currency_columns=currency_columns,
+        number_columns=number_columns,
+        height=height
+    )
+
+    nav_prev, nav_info, nav_next = st.columns([1, 2, 1])
+    with nav_prev:
+        if st.button("⬅ הקודם", key=f"{key_prefix}_prev", disabled=page_number == 1):
+            page_keys.pop()
+            st.rerun()
+    with nav_info:
+        first_row = (page_number - 1) * page_size + 1
+        st.caption(f"📄 מציג שורות {first_row}-{first_row + len(page_df) - 1} מתוך {total_rows}")
+    with nav_next:
+        if st.button("הבא ➡", key=f"{key_prefix}_next", disabled=next_key is None):
+            page_keys.append(next_key)
+            st.rerun()
 
 
 def render_data_table_tabs(db):
@@ -286,12 +455,11 @@ def render_data_table_tabs(db):
     # Tab 1: Full joined view
     with subtab1:
         try:
-            # Get full joined data
-            df_full = db.get_full_view()
-
-            if not df_full.empty:
+            # Server-side: only the visible page is fetched from SQLite
+            if db.count_rows('full_view') > 0:
                 render_enhanced_dataframe(
-                    df=df_full,
+                    db=db,
+                    source='full_view',
                     title="תצוגה מאוחדת - חשבוניות + שורות + רכבים",
                     key_prefix="full_data",
                     enable_search=True,
@@ -309,11 +477,10 @@ def render_data_table_tabs(db):
     # Tab 2: Invoices only
     with subtab2:
         try:
-            df_invoices = db.get_all_invoices()
-
-            if not df_invoices.empty:
+            if db.count_rows('invoices') > 0:
                 render_enhanced_dataframe(
-                    df=df_invoices,
+                    db=db,
+                    source='invoices',
                     title="חשבוניות",
                     key_prefix="invoices",
                     enable_search=True,
@@ -332,11 +499,10 @@ def render_data_table_tabs(db):
     # Tab 3: Invoice lines
     with subtab3:
         try:
-            df_lines = db.get_invoice_lines()
-
-            if not df_lines.empty:
+            if db.count_rows('invoice_lines') > 0:
                 render_enhanced_dataframe(
-                    df=df_lines,
+                    db=db,
+                    source='invoice_lines',
                     title="שורות חשבונית מפורטות",
                     key_prefix="invoice_lines",
                     enable_search=True,
@@ -355,11 +521,10 @@ def render_data_table_tabs(db):
     # Tab 4: Vehicles
     with subtab4:
         try:
-            df_vehicles = db.get_all_vehicles()
-
-            if not df_vehicles.empty:
+            if db.count_rows('vehicles') > 0:
                 render_enhanced_dataframe(
-                    df=df_vehicles,
+                    db=db,
+                    source='vehicles',
                     title="רכבים בצי",
                     key_prefix="vehicles",
                     enable_search=True,
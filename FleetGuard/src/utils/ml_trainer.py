@@ -66,12 +66,12 @@ class FleetMLTrainer:
         """
         # Load data if not provided
         if df_vehicles is None:
-            df_vehicles = self.db.get_vehicle_with_stats()
+            df_vehicles = self.db.get_vehicle_with_stats(typed=True)
 
         if df_invoices is None:
-            df_invoices = self.db.get_all_invoices()
+            df_invoices = self.db.get_all_invoices(typed=True)
 
-        # Convert date columns
+        # Convert date columns (no-op for frames already loaded with typed=True)
         df_invoices['date'] = pd.to_datetime(df_invoices['date'])
         df_vehicles['fleet_entry_date'] = pd.to_datetime(df_vehicles['fleet_entry_date'])
 
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Write Queue
+תור כתיבה עם Thread כותב יחיד עבור DatabaseManager
+
+במקום שכל session של Streamlit יפתח חיבור כתיבה משלו ויתחרה על נעילת הקובץ
+(database is locked), הכתיבות נשלחות לתור ו-Thread ייעודי מריץ אותן על חיבור יחיד.
+כל מה שהצטבר בתור בזמן ה-commit הקודם, ומה שמגיע עד max_delay_ms אחרי העבודה
+הראשונה, נכתב בטרנזקציה אחת (group commit): הרבה כתיבות קטנות (הודעות צ'אט,
+לוג סנכרון) -> מעט commits, גם בעומס נמוך.
+
+כל עבודה רצה בתוך SAVEPOINT משלה, כך שכישלון של עבודה אחת לא מבטל את האחרות
+באותה טרנזקציה. המתקשר מקבל Future שמתמלא רק אחרי ה-commit. אם הטרנזקציה עצמה
+נכשלת (ה-SAVEPOINT נעלם, SQLITE_FULL / IOERR שמבטלים אותה אוטומטית) - כל העבודות
+של הקבוצה נכשלות וה-Thread הכותב ממשיך לקבוצה הבאה.
+"""
+
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+
+class WriteQueue:
+    """
+    Thread כותב יחיד לקובץ SQLite.
+
+    Attributes:
+        db_path: נתיב לקובץ הדאטה בייס
+        max_batch: מספר עבודות מקסימלי בטרנזקציה אחת
+        max_delay_ms: כמה זמן לחכות לעבודות נוספות אחרי הראשונה לפני ה-commit (0 = בלי חלון)
+    """
+
+    def __init__(self, db_path, max_batch=256, max_delay_ms=5, busy_timeout_ms=5000):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.max_delay_ms = max_delay_ms
+        self.busy_timeout_ms = busy_timeout_ms
+
+        self._queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+
+        self.jobs = 0
+        self.commits = 0
+        self.failed_jobs = 0
+
+        # ה-Thread (והחיבור שלו) נפתחים בעבודה הראשונה
+        self._thread = None
+
+    # ===== API =====
+
+    def submit(self, work):
+        """
+        מוסיף עבודת כתיבה לתור.
+
+        Args:
+            work: פונקציה שמקבלת cursor ומריצה את הכתיבות (בלי commit);
+                  הערך שהיא מחזירה הוא תוצאת ה-Future
+
+        Returns:
+            concurrent.futures.Future
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("תור הכתיבה נסגר")
+            # Thread שמת (למשל שגיאה לא צפויה) מופעל מחדש - העבודות שבתור לא נתקעות
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='fleetguard-db-writer', daemon=True)
+                self._thread.start()
+            self._queue.put((work, future))
+        return future
+
+    def flush(self, timeout=None):
+        """ממתין עד שכל העבודות שכבר בתור נכתבו"""
+        self.submit(lambda cursor: None).result(timeout)
+
+    def close(self, timeout=None):
+        """מסיים את העבודות שבתור ועוצר את ה-Thread הכותב"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._thread is None:
+                return
+            self._queue.put(None)
+        self._thread.join(timeout)
+
+    def stats(self):
+        """סטטיסטיקות: עבודות, commits וממוצע עבודות ל-commit"""
+        return {
+            'jobs': self.jobs,
+            'commits': self.commits,
+            'failed_jobs': self.failed_jobs,
+            'jobs_per_commit': round(self.jobs / self.commits, 2) if self.commits else 0.0,
+            'pending': self._queue.qsize()
+        }
+
+    # ===== Writer Thread =====
+
+    def _run(self):
+        conn = None
+        try:
+            while True:
+                batch = self._next_batch()
+                stop = None in batch
+                jobs = [job for job in batch if job is not None]
+                if jobs:
+                    if conn is None:
+                        try:
+                            conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+                            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+                        except sqlite3.Error as e:
+                            conn = None
+                            self._fail(jobs, e)
+                            continue
+                    self._write_batch(conn, jobs)
+                if stop:
+                    break
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _next_batch(self):
+        """
+        העבודה הבאה בתור, ואיתה כל מה שכבר הצטבר (בזמן ה-commit הקודם) ומה שמגיע
+        עד max_delay_ms אחריה - עד max_batch עבודות או עד בקשת עצירה.
+        """
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay_ms / 1000
+        while len(batch) < self.max_batch and batch[-1] is not None:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, conn, jobs):
+        """
+        מריץ קבוצת עבודות בטרנזקציה אחת, כל עבודה ב-SAVEPOINT משלה.
+        כל שגיאה ברמת הטרנזקציה מבטלת את כולה ומכשילה את כל העבודות שעוד לא הסתיימו.
+        """
+        cursor = conn.cursor()
+        results = []
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for work, future in jobs:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                cursor.execute("SAVEPOINT job")
+                try:
+                    result = work(cursor)
+                except Exception as e:
+                    self.failed_jobs += 1
+                    future.set_exception(e)
+                    self._rollback_job(conn, cursor)
+                    continue
+                cursor.execute("RELEASE SAVEPOINT job")
+                results.append((future, result))
+            cursor.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                try:
+                    cursor.execute("ROLLBACK")
+                except sqlite3.Error:
+                    pass
+            self._fail(jobs, e)
+            return
+
+        self.jobs += len(jobs)
+        self.commits += 1
+        for future, result in results:
+            future.set_result(result)
+
+    @staticmethod
+    def _rollback_job(conn, cursor):
+        """
+        מבטל את העבודה שנכשלה בלבד. אם ה-SAVEPOINT כבר לא קיים (הטרנזקציה הסתיימה
+        או בוטלה אוטומטית ע"י SQLite) - זורק, וכל הטרנזקציה מבוטלת ב-_write_batch.
+        """
+        if not conn.in_transaction:
+            raise sqlite3.OperationalError("הטרנזקציה של קבוצת הכתיבה הסתיימה באמצע עבודה")
+        cursor.execute("ROLLBACK TO SAVEPOINT job")
+        cursor.execute("RELEASE SAVEPOINT job")
+
+    def _fail(self, jobs, error):
+        """מכשיל את כל העבודות שעוד לא קיבלו תוצאה"""
+        for _, future in jobs:
+            if not future.done():
+                future.set_exception(error)
+                self.failed_jobs += 1
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_write_queue(db_path, max_delay_ms=5):
+    """
+    מחזיר את תור הכתיבה המשותף לקובץ הדאטה בייס (Thread כותב אחד לקובץ בתהליך).
+    חלון ה-group commit נקבע ביצירה הראשונה.
+    """
+    key = os.path.abspath(db_path)
+    with _queues_lock:
+        write_queue = _queues.get(key)
+        if write_queue is None:
+            write_queue = WriteQueue(key, max_delay_ms=max_delay_ms)
+            _queues[key] = write_queue
+        return write_queue
+
+
+@atexit.register
+def _close_write_queues():
+    """כתיבת העבודות שנשארו בתור לפני יציאה מהתהליך"""
+    with _queues_lock:
+        queues = list(_queues.values())
+    for write_queue in queues:
+        write_queue.close(timeout=10)